@@ -1022,7 +1022,9 @@ const PdfViewerPage: React.FC = () => {
         topResults.forEach((result: InsightResult, index: number) => {
           insightsContent += `${index + 1}. **Page ${result.page_number}**\n`;
           insightsContent += `   **Summary:** ${result.summary}\n`;
-          insightsContent += `   **Text:** ${result.text.substring(0, 200)}${result.text.length > 200 ? '...' : ''}\n\n`;
+          insightsContent += result.snippet
+            ? `   **Text:** ${result.snippet}\n\n`
+            : `   **Text:** ${result.text.substring(0, 200)}${result.text.length > 200 ? '...' : ''}\n\n`;
         });
 
         // Add the results to insights results for clickable navigation
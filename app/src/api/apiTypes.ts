@@ -33,6 +33,9 @@ export interface InsightResult {
   page_number: number;
   summary: string;
   text: string;
+  // 2-4 sentences of the text closest to the selection, with [start, end] offsets into text
+  snippet?: string;
+  snippet_offsets?: [number, number][];
 }
 
 // New immediate response shape for insights
@@ -0,0 +1,156 @@
+"""
+Memory / latency / recall@5 benchmark for the compact embedding modes.
+
+Loads the stored chunk embeddings (from POSTGRES_DSN, or a .npy matrix via
+--npy), treats a sample of them as queries and compares every compact
+setting against an exact full-precision scan. When reading from the database
+and every chunk has its ``embedding_compact`` code, the codes written at
+ingest (EMBED_COMPACT_MODE / EMBED_COMPACT_DIM) are benchmarked as well,
+exactly as ``services.search`` scans them.
+
+    python -m benchmarks.compact_embeddings
+    python -m benchmarks.compact_embeddings --settings int8:768,binary:768,float16:256 --queries 200
+    python -m benchmarks.compact_embeddings --npy embeddings.npy --pca --json
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+
+from services import quantize
+
+DEFAULT_SETTINGS = "float16:768,float16:256,int8:768,int8:256,binary:768,binary:256"
+
+def load_corpus_embeddings():
+    """
+    (corpus, stored): the full embeddings, and the stored compact (codes, scales)
+    or None when compact storage is off or some chunk has no code.
+    """
+    from services.methods import get_db_conn
+    conn = get_db_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT embedding, embedding_compact, embedding_scale
+            FROM chunks WHERE embedding IS NOT NULL ORDER BY id
+        """)
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+    corpus = np.array([np.asarray(r[0], dtype=np.float32) for r in rows], dtype=np.float32)
+    stored = None
+    if quantize.COMPACT_MODE and rows and all(r[1] is not None for r in rows):
+        stored = quantize.codes_from_rows([(r[1], r[2]) for r in rows])
+    return corpus, stored
+
+def exact_top_k(corpus, query_idx, k):
+    normed = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+    sims = normed[query_idx] @ normed.T
+    sims[np.arange(len(query_idx)), query_idx] = -np.inf   # a chunk is not its own neighbour
+    return np.argsort(-sims, axis=1)[:, :k]
+
+def run_setting(corpus, query_idx, truth, mode, dim, k, rescore, use_pca, stored=None):
+    if stored is not None:
+        # the codes written at ingest, with the basis they were written with
+        pca = quantize.load_pca()
+        codes, scales = stored
+    else:
+        pca = quantize.fit_pca(corpus, dim) if use_pca else None
+        codes, scales = quantize.encode(quantize.reduce_dimensions(corpus, dim, pca), mode)
+
+    def fetch_full(indices):
+        return corpus[indices]
+
+    latencies = []
+    hits = 0
+    for row, qi in enumerate(query_idx):
+        start = time.perf_counter()
+        found, _ = quantize.search(corpus[qi], codes, scales, fetch_full, k=k + 1, mode=mode,
+                                   dim=dim, rescore=rescore, pca=pca)
+        latencies.append(time.perf_counter() - start)
+        found = [i for i in found if i != qi][:k]
+        hits += len(set(found) & set(truth[row].tolist()))
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        "mode": mode,
+        "dim": dim,
+        "pca": pca is not None,
+        "stored": stored is not None,
+        "rescore": rescore,
+        "index_bytes": int(codes.nbytes + scales.nbytes),
+        "bytes_per_vector": round((codes.nbytes + scales.nbytes) / len(corpus), 1),
+        "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        f"recall@{k}": round(hits / (len(query_idx) * k), 4),
+    }
+
+def run_full_precision(corpus, query_idx, k):
+    normed = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+    latencies = []
+    for qi in query_idx:
+        start = time.perf_counter()
+        sims = normed @ normed[qi]
+        np.argpartition(-sims, k)[:k + 1]
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        "mode": "full",
+        "dim": corpus.shape[1],
+        "pca": False,
+        "stored": False,
+        "rescore": 0,
+        "index_bytes": int(corpus.nbytes),
+        "bytes_per_vector": round(corpus.nbytes / len(corpus), 1),
+        "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        f"recall@{k}": 1.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--npy", help="load embeddings from a .npy file instead of the database")
+    parser.add_argument("--settings", default=DEFAULT_SETTINGS, help="comma separated mode:dim pairs")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore", type=int, default=quantize.RESCORE_CANDIDATES)
+    parser.add_argument("--pca", action="store_true", help="fit PCA instead of truncating")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="emit one JSON object per setting")
+    args = parser.parse_args()
+
+    if args.npy:
+        corpus, stored = np.load(args.npy).astype(np.float32), None
+    else:
+        corpus, stored = load_corpus_embeddings()
+    if len(corpus) <= args.k:
+        raise SystemExit(f"need more than {args.k} embedded chunks, found {len(corpus)}")
+
+    rng = np.random.default_rng(args.seed)
+    query_idx = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+    truth = exact_top_k(corpus, query_idx, args.k)
+
+    results = [run_full_precision(corpus, query_idx, args.k)]
+    for setting in args.settings.split(","):
+        mode, dim = setting.strip().split(":")
+        results.append(run_setting(corpus, query_idx, truth, mode, int(dim), args.k, args.rescore, args.pca))
+    if stored is not None:
+        results.append(run_setting(corpus, query_idx, truth, quantize.COMPACT_MODE, quantize.COMPACT_DIM,
+                                   args.k, args.rescore, False, stored))
+
+    if args.json:
+        for r in results:
+            print(json.dumps(r))
+        return
+
+    print(f"corpus: {len(corpus)} vectors x {corpus.shape[1]} dims, {len(query_idx)} queries")
+    header = f"{'mode':<8} {'dim':>5} {'stored':>6} {'bytes/vec':>10} {'index MB':>9} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['mode']:<8} {r['dim']:>5} {'yes' if r['stored'] else '':>6} {r['bytes_per_vector']:>10} {r['index_bytes'] / 1e6:>9.2f} "
+              f"{r['latency_p50_ms']:>8} {r['latency_p99_ms']:>8} {r[f'recall@{args.k}']:>9}")
+
+if __name__ == "__main__":
+    main()
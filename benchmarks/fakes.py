@@ -0,0 +1,183 @@
+"""
+Deterministic local stand-ins for Gemini and the Cloud TTS REST endpoint.
+
+``install()`` swaps them into the ``services`` modules so every code path can
+run without GOOGLE_API_KEY or network access. Latency is drawn from a seeded
+normal distribution per operation, and a configurable fraction of calls can
+be made to fail.
+
+  - embeddings: hashed bag-of-words vectors (768 dims, L2-normalised), so
+    texts sharing words really are close to each other
+  - generate_content: ranking prompts get a JSON array of the excerpt IDs,
+    podcast prompts a ~2.5k character script, anything else two sentences
+  - TTS: a valid mono 16-bit WAV of silence, 60 ms per word
+  - OCR: ``fake_ocr`` can be plugged in as an OCR engine
+  - stored page / document summaries: none, so /insights never reaches for
+    the database and the precomputed summary mode falls back to raw chunks
+"""
+
+import io
+import os
+import re
+import json
+import time
+import wave
+import zlib
+import base64
+import random
+import threading
+from dataclasses import dataclass, field
+
+EMBED_DIM = 768
+
+class InjectedFailure(RuntimeError):
+    pass
+
+@dataclass
+class Latency:
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+
+@dataclass
+class FakeConfig:
+    embed: Latency = field(default_factory=lambda: Latency(40, 10))
+    generate: Latency = field(default_factory=lambda: Latency(600, 150))
+    tts: Latency = field(default_factory=lambda: Latency(800, 200))
+    failure_rate: float = 0.0
+    seed: int = 0
+
+class _Behaviour:
+    def __init__(self, config):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.calls = {"embed": 0, "generate": 0, "tts": 0}
+
+    def call(self, kind):
+        latency = getattr(self.config, kind)
+        with self._lock:
+            self.calls[kind] += 1
+            delay = max(0.0, self._rng.gauss(latency.mean_ms, latency.jitter_ms)) / 1000.0
+            fail = self._rng.random() < self.config.failure_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise InjectedFailure(f"injected {kind} failure")
+
+def fake_embedding(text):
+    vec = [0.0] * EMBED_DIM
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vec[h % EMBED_DIM] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return [v / norm for v in vec]
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenAI:
+    """Implements the subset of ``google.generativeai`` the services use."""
+
+    def __init__(self, behaviour):
+        self._behaviour = behaviour
+
+    def configure(self, **kwargs):
+        pass
+
+    def embed_content(self, model, content, task_type=None, **kwargs):
+        self._behaviour.call("embed")
+        if isinstance(content, (list, tuple)):
+            return {"embedding": [fake_embedding(t) for t in content]}
+        return {"embedding": fake_embedding(content)}
+
+    def GenerativeModel(self, model_name=None, generation_config=None, **kwargs):
+        return _FakeModel(self._behaviour)
+
+class _FakeModel:
+    def __init__(self, behaviour):
+        self._behaviour = behaviour
+
+    def generate_content(self, prompt):
+        self._behaviour.call("generate")
+        if "JSON array" in prompt:
+            ids = re.findall(r"^ID: (\S+)$", prompt, flags=re.MULTILINE)
+            # deterministic but not identity order, so callers really re-sort
+            ids.sort(key=lambda i: zlib.crc32(i.encode("utf-8")))
+            return _Response(json.dumps(ids))
+        words = re.findall(r"[A-Za-z]+", prompt)
+        if "podcast" in prompt.lower():
+            sentence = "Today we look at " + " ".join(words[40:52]).lower() + " and why it matters."
+            return _Response(" ".join([sentence] * (2500 // len(sentence) + 1))[:2500])
+        return _Response(
+            "This passage covers " + " ".join(words[-12:]).lower() + ". "
+            "It connects the selected text to the surrounding sections."
+        )
+
+def _silent_wav(seconds, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+class _TTSResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+class FakeTTSRequests:
+    """Stands in for ``requests`` inside ``services.tts_service``."""
+
+    def __init__(self, behaviour):
+        self._behaviour = behaviour
+
+    def post(self, url, headers=None, json=None, timeout=None, **kwargs):
+        self._behaviour.call("tts")
+        words = len((json or {}).get("input", {}).get("text", "").split())
+        audio = _silent_wav(0.06 * max(words, 1))
+        return _TTSResponse({"audioContent": base64.b64encode(audio).decode("ascii")})
+
+def fake_ocr(png_bytes, language="eng"):
+    """
+    OCR engine stand-in (``OCR_ENGINE=benchmarks.fakes:fake_ocr``): prose
+    seeded by the image, so the same page always "reads" the same.
+    """
+    from benchmarks import synthetic_pdfs
+
+    time.sleep(float(os.getenv("FAKE_OCR_MS", "0")) / 1000.0)
+    return synthetic_pdfs.page_text("prose", zlib.crc32(png_bytes) % 10000, 0)
+
+def no_stored_summaries(file_pages):
+    """Stands in for ``summaries.load_summaries``: nothing has been rolled up."""
+    return {}, {}
+
+def install(config=None):
+    """
+    Patch the service modules to use the fakes. Returns the shared behaviour
+    object, whose ``calls`` dict counts the stubbed calls made.
+    """
+    import services.clients as clients
+    import services.methods as methods
+    import services.insights_processor as insights_processor
+    import services.summaries as summaries
+    import services.tts_service as tts_service
+
+    behaviour = _Behaviour(config or FakeConfig())
+    clients.set_genai(FakeGenAI(behaviour))
+    for module in (methods, insights_processor):
+        module.GOOGLE_API_KEY = "offline-benchmark"
+    tts_service.requests = FakeTTSRequests(behaviour)
+    summaries.load_summaries = no_stored_summaries
+    # tts_service reads the key from the environment on every call
+    os.environ["GOOGLE_API_KEY"] = "offline-benchmark"
+    return behaviour
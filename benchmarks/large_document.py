@@ -0,0 +1,91 @@
+"""
+Peak memory of whole-document vs page-window extraction.
+
+Builds synthetic PDFs of increasing length on disk, then extracts each one
+in a fresh interpreter, either the old way (download held in memory, every
+page's chunks kept until the end) or window by window from the file as
+``methods.ingest_document_windows`` does. Reports the peak RSS of every run
+(``ru_maxrss``) above the interpreter's RSS once PyMuPDF is imported, so the
+window mode should stay flat as the page count grows:
+
+    python -m benchmarks.large_document
+    python -m benchmarks.large_document --pages 100,400,1600 --window 50 --layout dense
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from benchmarks import synthetic_pdfs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _peak_rss_kb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _child(mode, path, window):
+    """Extract one PDF inside this process and print a JSON result line."""
+    import fitz  # noqa: F401
+    from services.chunker import count_pages, extract_document
+
+    baseline = _peak_rss_kb()
+    start = time.perf_counter()
+    if mode == "whole":
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        page_count, page_chunks, _ = extract_document(pdf_bytes)
+        chunks = len(page_chunks)
+    else:
+        page_count = count_pages(path)
+        chunks = 0
+        for first in range(1, page_count + 1, window):
+            _, page_chunks, _ = extract_document(path, None, first, min(first + window - 1, page_count))
+            chunks += len(page_chunks)
+            page_chunks = None
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"pages": page_count, "chunks": chunks, "seconds": round(elapsed, 3),
+                      "peak_rss_mb": round(_peak_rss_kb() / 1024, 1),
+                      "peak_above_baseline_mb": round((_peak_rss_kb() - baseline) / 1024, 1)}))
+
+def _run_child(mode, path, window):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.large_document", "--child", mode, path,
+                           "--window", str(window)], capture_output=True, text=True, cwd=ROOT, env=env, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def measure(page_counts, window, layout, seed):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = os.path.join(tmp, f"{layout}-{pages}p.pdf")
+            with open(path, "wb") as f:
+                f.write(synthetic_pdfs.build_pdf(pages, layout, seed))
+            row = {"pages": pages, "file_mb": round(os.path.getsize(path) / 2**20, 2)}
+            for mode in ("whole", "window"):
+                row[mode] = _run_child(mode, path, window)
+            results.append(row)
+    return {"window_pages": window, "layout": layout, "runs": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="100,400,1600", help="comma separated page counts")
+    parser.add_argument("--window", type=int, default=50, help="pages per window")
+    parser.add_argument("--layout", default="prose", choices=synthetic_pdfs.LAYOUTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child[0], args.child[1], args.window)
+        return
+    page_counts = [int(p) for p in args.pages.split(",")]
+    print(json.dumps(measure(page_counts, args.window, args.layout, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Start-up cost of the Flask service.
+
+Imports ``services.__main__`` in fresh interpreters and reports the median
+wall time, plus a ``-X importtime`` breakdown of the slowest modules
+(cumulative microseconds, including their own imports). Optionally also
+times ``clients.warm_up()`` so the deferred cost stays visible:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --top 15 --warm genai,pdf,numpy
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(code, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT, env=env, check=True)
+    return time.perf_counter() - start, proc
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def measure(runs, top, warm=None):
+    code = "import services.__main__"
+    walls = [_run(code)[0] for _ in range(runs)]
+    baseline = statistics.median(_run("pass")[0] for _ in range(runs))
+    rows = parse_importtime(_run(code, importtime=True)[1].stderr)
+    service = next((cum for name, _, cum in rows if name == "services.__main__"), None)
+    result = {
+        "runs": runs,
+        "wall_median_ms": round(statistics.median(walls) * 1000, 2),
+        "interpreter_ms": round(baseline * 1000, 2),
+        "import_ms": round(service / 1000, 2) if service is not None else None,
+        "top_modules": [{"module": name, "cumulative_ms": round(cum / 1000, 2), "self_ms": round(own / 1000, 2)}
+                        for name, own, cum in sorted(rows, key=lambda r: r[2], reverse=True)[:top]],
+    }
+    if warm:
+        components = [c for c in warm.split(",") if c]
+        _, proc = _run("import json, services.__main__, services.clients as c; "
+                       f"print(json.dumps(c.warm_up({components!r})))")
+        result["warm_up_s"] = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    parser.add_argument("--warm", help="comma separated clients.warm_up components to time afterwards")
+    args = parser.parse_args()
+    print(json.dumps(measure(args.runs, args.top, args.warm), indent=2))
+
+if __name__ == "__main__":
+    main()
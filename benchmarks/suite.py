@@ -0,0 +1,285 @@
+"""
+Offline benchmark suite for the Python services.
+
+Runs against the deterministic fakes in ``benchmarks.fakes`` and the
+synthetic corpus in ``benchmarks.synthetic_pdfs``, so it needs neither
+GOOGLE_API_KEY nor network access. No database is used: the ingest scenario
+covers extraction, chunking, summaries and embeddings, not the SQL writes.
+
+Each scenario prints one JSON object per line (scenario, params, metrics,
+git commit, timestamp), suitable for appending to a results file:
+
+    python -m benchmarks.suite                                   # all scenarios
+    python -m benchmarks.suite chunker embed --output results.jsonl
+    python -m benchmarks.suite --latency-scale 0 ingest          # CPU cost only
+    python -m benchmarks.suite --failure-rate 0.05 insights
+    python -m benchmarks.suite --compare baseline.jsonl          # exit 1 on regression
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import fakes, synthetic_pdfs
+
+SCENARIOS = ("chunker", "ingest", "embed", "insights", "podcast")
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def _latency_metrics(samples_s, prefix="latency"):
+    ms = [s * 1000.0 for s in samples_s]
+    return {
+        f"{prefix}_p50_ms": round(_percentile(ms, 50), 3),
+        f"{prefix}_p99_ms": round(_percentile(ms, 99), 3),
+        f"{prefix}_mean_ms": round(statistics.fmean(ms), 3),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+def bench_chunker(args):
+    from services.chunker import chunk_page_by_paragraphs
+
+    pages = [synthetic_pdfs.page_text(layout, pno, args.seed)
+             for layout in ("prose", "dense", "fragments") for pno in range(args.pages_per_layout)]
+    words = sum(len(p.split()) for p in pages)
+    chunks = 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in pages:
+            chunks += len(chunk_page_by_paragraphs(text))
+    elapsed = time.perf_counter() - start
+    total_pages = len(pages) * args.repeat
+    return {"pages": len(pages), "repeat": args.repeat}, {
+        "pages_per_s": round(total_pages / elapsed, 1),
+        "words_per_s": round(words * args.repeat / elapsed, 1),
+        "chunks_per_page": round(chunks / total_pages, 3),
+        "us_per_page": round(elapsed / total_pages * 1e6, 2),
+    }
+
+def bench_ingest(args):
+    import services.methods as methods
+    from services.chunker import extract_document_chunks
+
+    def embed_batch(texts):
+        summaries = 0
+        if not args.no_summaries:
+            for text in texts:
+                try:
+                    methods.compute_summary(text)
+                    summaries += 1
+                except Exception:
+                    pass
+        try:
+            methods.compute_embeddings(texts)
+            return len(texts), summaries
+        except Exception:
+            return 0, summaries
+
+    page_counts = [int(p) for p in args.ingest_pages.split(",")]
+    docs = list(synthetic_pdfs.build_corpus(page_counts, args.layouts.split(","), args.seed))
+    per_doc = []
+    total_pages = total_chunks = 0
+    extract_s = embed_s = 0.0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=methods.EMBED_WORKERS) as pool:
+        for name, pdf in docs:
+            t0 = time.perf_counter()
+            page_count, page_chunks = extract_document_chunks(pdf)
+            t1 = time.perf_counter()
+            texts = [text for _, text in page_chunks]
+            size = methods.EMBED_BATCH_SIZE
+            results = list(pool.map(embed_batch, [texts[i:i + size] for i in range(0, len(texts), size)]))
+            t2 = time.perf_counter()
+            embedded = sum(r[0] for r in results)
+            per_doc.append({"doc": name, "pages": page_count, "chunks": len(texts), "embedded": embedded,
+                            "extract_ms": round((t1 - t0) * 1000, 2), "searchable_ms": round((t2 - t0) * 1000, 2)})
+            total_pages += page_count
+            total_chunks += len(texts)
+            extract_s += t1 - t0
+            embed_s += t2 - t1
+    elapsed = time.perf_counter() - start
+    return {"docs": len(docs), "page_counts": page_counts, "summaries": not args.no_summaries}, {
+        "pages_per_s": round(total_pages / elapsed, 2),
+        "chunks_per_s": round(total_chunks / elapsed, 2),
+        "extract_pages_per_s": round(total_pages / extract_s, 1) if extract_s else None,
+        "embed_share": round(embed_s / elapsed, 3),
+        "documents": per_doc,
+    }
+
+def _flask_client():
+    from services.__main__ import app
+    return app.test_client()
+
+def bench_embed(args):
+    client = _flask_client()
+    texts = [synthetic_pdfs.page_paragraphs("prose", i, args.seed)[0] for i in range(args.requests)]
+    samples, errors = [], 0
+    for text in texts:
+        t0 = time.perf_counter()
+        resp = client.post("/embed", json={"text": text})
+        samples.append(time.perf_counter() - t0)
+        errors += resp.status_code != 200
+    return {"requests": len(texts)}, {**_latency_metrics(samples), "errors": errors}
+
+def _fake_chunks(n, seed):
+    chunks = []
+    for i in range(n):
+        paras = synthetic_pdfs.page_paragraphs("prose", i, seed)
+        chunks.append({"id": i + 1, "file_id": 1 + i % 3, "page_number": 1 + i // 3,
+                       "summary": paras[0][:200], "text": "\n\n".join(paras)})
+    return chunks
+
+def bench_insights(args):
+    client = _flask_client()
+    chunks = _fake_chunks(30, args.seed)
+    samples, errors, tokens_used, tokens_saved, response_bytes = [], 0, 0, 0, 0
+    for i in range(args.requests):
+        selection = synthetic_pdfs.page_paragraphs("prose", 1000 + i, args.seed)[0]
+        payload = {"file_id": 1, "page_number": 1, "selected_text": selection, "chunks": chunks,
+                   "result_body": args.result_body}
+        t0 = time.perf_counter()
+        resp = client.post("/insights", json=payload)
+        samples.append(time.perf_counter() - t0)
+        response_bytes += len(resp.get_data())
+        body = resp.get_json() or {}
+        errors += resp.status_code != 200 or not body.get("summary")
+        for report in body.get("context", {}).values():
+            tokens_used += report["tokens_used"]
+            tokens_saved += report["tokens_saved"]
+    return {"requests": args.requests, "chunks": len(chunks), "result_body": args.result_body}, {
+        **_latency_metrics(samples), "errors": errors,
+        "context_tokens_per_request": round(tokens_used / args.requests, 1),
+        "context_tokens_saved_per_request": round(tokens_saved / args.requests, 1),
+        "response_bytes_per_request": round(response_bytes / args.requests, 1),
+    }
+
+def bench_podcast(args):
+    import services.methods as methods
+
+    chunks = _fake_chunks(30, args.seed)
+    samples, errors = [], 0
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)   # podcasts are written under ./data/podcasts
+        try:
+            for i in range(args.podcasts):
+                t0 = time.perf_counter()
+                status, _ = methods.handle_podcast_request(
+                    {"podcast_id": i + 1, "selection_text": chunks[i % len(chunks)]["text"][:400], "chunks": chunks})
+                samples.append(time.perf_counter() - t0)
+                errors += status != 200
+        finally:
+            os.chdir(cwd)
+    return {"podcasts": args.podcasts}, {**_latency_metrics(samples, "time_to_audio"), "errors": errors}
+
+BENCHMARKS = {
+    "chunker": bench_chunker,
+    "ingest": bench_ingest,
+    "embed": bench_embed,
+    "insights": bench_insights,
+    "podcast": bench_podcast,
+}
+
+def _scaled(latency, scale):
+    return fakes.Latency(latency.mean_ms * scale, latency.jitter_ms * scale)
+
+def compare(results, baseline_path, tolerance):
+    """Flag metrics that got worse than the last baseline entry for the same scenario by more than ``tolerance``."""
+    baseline = {}
+    with open(baseline_path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                baseline[entry["scenario"]] = entry["metrics"]
+    regressions = []
+    for entry in results:
+        old = baseline.get(entry["scenario"], {})
+        for name, value in entry["metrics"].items():
+            before = old.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+                continue
+            if name.endswith("_ms") and value > before * (1 + tolerance):
+                regressions.append((entry["scenario"], name, before, value))
+            elif name.endswith("_per_s") and value < before * (1 - tolerance):
+                regressions.append((entry["scenario"], name, before, value))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--output", help="append results to this JSON lines file")
+    parser.add_argument("--compare", help="baseline JSON lines file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply all fake latencies")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of fake calls that fail")
+    parser.add_argument("--repeat", type=int, default=20, help="chunker: passes over the page set")
+    parser.add_argument("--pages-per-layout", type=int, default=50, help="chunker: pages per layout")
+    parser.add_argument("--ingest-pages", default="5,20", help="ingest: comma separated page counts")
+    parser.add_argument("--layouts", default="prose,dense,fragments,columns", help="ingest: layouts")
+    parser.add_argument("--no-summaries", action="store_true", help="ingest: skip per-chunk summaries")
+    parser.add_argument("--requests", type=int, default=50, help="embed/insights: requests to send")
+    parser.add_argument("--result-body", default="snippet", choices=("full", "snippet"),
+                        help="insights: result_body sent with each request")
+    parser.add_argument("--podcasts", type=int, default=5, help="podcast: podcasts to generate")
+    args = parser.parse_args()
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    default = fakes.FakeConfig()
+    config = fakes.FakeConfig(
+        embed=_scaled(default.embed, args.latency_scale),
+        generate=_scaled(default.generate, args.latency_scale),
+        tts=_scaled(default.tts, args.latency_scale),
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    behaviour = fakes.install(config)
+
+    common = {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "latency_scale": args.latency_scale,
+        "failure_rate": args.failure_rate,
+        "seed": args.seed,
+    }
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        before = dict(behaviour.calls)
+        params, metrics_out = BENCHMARKS[name](args)
+        metrics_out["fake_calls"] = {k: behaviour.calls[k] - before[k] for k in before}
+        entry = {"scenario": name, "timestamp": time.time(), **common, "params": params, "metrics": metrics_out}
+        results.append(entry)
+        line = json.dumps(entry)
+        print(line, flush=True)
+        if args.output:
+            with open(args.output, "a") as f:
+                f.write(line + "\n")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for scenario, name, before, after in regressions:
+            print(f"REGRESSION {scenario}.{name}: {before} -> {after}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
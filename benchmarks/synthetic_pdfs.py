@@ -0,0 +1,117 @@
+"""
+Deterministic synthetic PDF corpus for the offline benchmarks.
+
+Every document is generated from a seed, so the same arguments always
+produce byte-identical page text. Layouts:
+
+  - ``prose``:     a single column of medium paragraphs
+  - ``dense``:     few, very long paragraphs (exercises the sub-chunk splitter)
+  - ``fragments``: many short paragraphs (exercises paragraph merging)
+  - ``columns``:   two text columns per page
+  - ``scanned``:   prose pages rasterised to an image, with no text layer
+
+    python -m benchmarks.synthetic_pdfs --out /tmp/corpus --pages 5,50,200
+"""
+
+import os
+import random
+import argparse
+
+LAYOUTS = ("prose", "dense", "fragments", "columns", "scanned")
+
+_VOCAB = (
+    "adobe document section analysis retrieval embedding vector summary insight podcast "
+    "model pipeline latency throughput memory index query page paragraph chunk search "
+    "research method result figure table evidence dataset training evaluation baseline "
+    "design system network protocol storage cache server client request response error "
+    "market revenue customer strategy growth product policy risk governance compliance "
+    "the of and to in a is that for on with as by this from are be at an or which"
+).split()
+
+def _sentence(rng, min_words=6, max_words=22):
+    words = [rng.choice(_VOCAB) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng, sentences):
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+def page_paragraphs(layout, page_number, seed=0):
+    """
+    The paragraphs written on one page; also usable directly as chunker input.
+    For ``scanned`` pages this is the text visible in the image.
+    """
+    rng = random.Random(f"{seed}:{layout}:{page_number}")
+    if layout == "dense":
+        return [_paragraph(rng, rng.randint(30, 45)) for _ in range(2)]
+    if layout == "fragments":
+        return [_sentence(rng, 3, 10) for _ in range(rng.randint(18, 30))]
+    if layout == "scanned":
+        layout = "prose"
+    return [_paragraph(rng, rng.randint(3, 7)) for _ in range(rng.randint(4, 7))]
+
+def page_text(layout, page_number, seed=0):
+    return "\n\n".join(page_paragraphs(layout, page_number, seed))
+
+def _fit_textbox(page, rect, text):
+    # insert_textbox writes nothing when the text overflows, so shrink until it fits
+    for fontsize in (9, 8, 7, 6, 5, 4, 3):
+        if page.insert_textbox(rect, text, fontsize=fontsize) >= 0:
+            return
+    raise ValueError("synthetic page text does not fit on the page")
+
+def build_pdf(pages, layout="prose", seed=0):
+    """Return the bytes of a ``pages``-page PDF in the given layout."""
+    import fitz  # PyMuPDF
+
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout {layout!r}; expected one of {LAYOUTS}")
+
+    doc = fitz.open()
+    try:
+        for pno in range(pages):
+            page = doc.new_page(width=612, height=792)
+            if layout == "scanned":
+                # render a prose page to a bitmap and place only the image
+                source = fitz.open()
+                src_page = source.new_page(width=612, height=792)
+                _fit_textbox(src_page, fitz.Rect(40, 40, 572, 752), page_text("prose", pno, seed))
+                page.insert_image(page.rect, pixmap=src_page.get_pixmap(dpi=150, colorspace=fitz.csGRAY))
+                source.close()
+                continue
+            text = page_text(layout, pno, seed)
+            if layout == "columns":
+                half = len(text) // 2
+                split = text.find("\n\n", half)
+                split = split if split != -1 else half
+                _fit_textbox(page, fitz.Rect(40, 40, 296, 752), text[:split])
+                _fit_textbox(page, fitz.Rect(316, 40, 572, 752), text[split:].lstrip())
+            else:
+                _fit_textbox(page, fitz.Rect(40, 40, 572, 752), text)
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
+
+def build_corpus(page_counts=(5, 20, 80), layouts=("prose", "dense", "fragments", "columns"), seed=0):
+    """Yield (name, pdf_bytes) for every page-count / layout combination."""
+    for pages in page_counts:
+        for layout in layouts:
+            yield f"{layout}-{pages}p", build_pdf(pages, layout, seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory to write PDFs into")
+    parser.add_argument("--pages", default="5,20,80", help="comma separated page counts")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    page_counts = [int(p) for p in args.pages.split(",")]
+    for name, data in build_corpus(page_counts, args.layouts.split(","), args.seed):
+        path = os.path.join(args.out, f"{name}.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"{path}\t{len(data)} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -15,27 +15,69 @@ CREATE TABLE IF NOT EXISTS files (
   id         BIGSERIAL PRIMARY KEY,
   filename   TEXT NOT NULL,
   uploaded_at TIMESTamptz DEFAULT now(),
-  num_pages  INTEGER DEFAULT 0
+  num_pages  INTEGER DEFAULT 0,
+  summary    TEXT,
+  summary_source_hash TEXT
 );
 
+-- added after the first release
+ALTER TABLE files ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE files ADD COLUMN IF NOT EXISTS summary_source_hash TEXT;
+
 CREATE TABLE IF NOT EXISTS chunks (
   id          BIGSERIAL PRIMARY KEY,
   file_id     BIGINT NOT NULL REFERENCES files(id) ON DELETE CASCADE,
   text        TEXT NOT NULL,
   page_number INTEGER NOT NULL,
   embedding   VECTOR(768),
+  embedding_compact BYTEA,
+  embedding_scale   REAL,
   text_tsv    TSVECTOR,
-  summary     TEXT
+  summary     TEXT,
+  content_hash TEXT,
+  sentence_offsets INTEGER[]
 );
 
+-- columns added after the first release, so existing databases pick them up
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding_compact BYTEA;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding_scale REAL;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS sentence_offsets INTEGER[];
+
 CREATE INDEX IF NOT EXISTS idx_chunks_file_id ON chunks (file_id);
 
+CREATE INDEX IF NOT EXISTS idx_chunks_file_hash ON chunks (file_id, content_hash);
+
 CREATE INDEX IF NOT EXISTS idx_chunks_embedding
   ON chunks USING ivfflat (embedding) WITH (lists = 100);
 
 CREATE INDEX IF NOT EXISTS idx_chunks_text_tsv
   ON chunks USING gin (text_tsv);
 
+CREATE TABLE IF NOT EXISTS chunk_neighbours (
+  chunk_id      BIGINT PRIMARY KEY REFERENCES chunks(id) ON DELETE CASCADE,
+  neighbour_ids BIGINT[] NOT NULL,
+  scores        REAL[] NOT NULL,
+  updated_at    TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS page_summaries (
+  file_id     BIGINT NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+  page_number INTEGER NOT NULL,
+  summary     TEXT NOT NULL,
+  source_hash TEXT NOT NULL,
+  updated_at  TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (file_id, page_number)
+);
+
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+  file_id      BIGINT PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+  content_hash TEXT NOT NULL,
+  page_count   INTEGER NOT NULL,
+  last_page    INTEGER NOT NULL,
+  updated_at   TIMESTAMPTZ DEFAULT now()
+);
+
 CREATE TABLE IF NOT EXISTS podcasts (
   id     BIGSERIAL PRIMARY KEY,
   status VARCHAR(15) NOT NULL,
@@ -20,7 +20,12 @@ sleep 10
 cd /app
 
 go run ./main.go&
-python3 -m services&
+# SERVE_MODE=multiprocess: forked interactive workers plus a background ingest process
+if [ "${SERVE_MODE:-single}" = "multiprocess" ]; then
+    python3 -m services.serve&
+else
+    python3 -m services&
+fi
 
 cd /app/app
 npm run dev
\ No newline at end of file
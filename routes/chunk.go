@@ -19,8 +19,54 @@ type ChunkDetail struct {
 	Summary    string `db:"summary" json:"summary"`
 }
 
+type RelatedChunk struct {
+	ChunkDetail
+	Score float64 `db:"score" json:"score"`
+}
+
 func mountChunkRoutes(r *chi.Mux) {
 	r.Get("/api/chunks/{chunk_id}", getChunkHandler)
+	r.Get("/api/chunks/{chunk_id}/related", getRelatedChunksHandler)
+}
+
+// getRelatedChunksHandler serves the sections in other documents closest to
+// a chunk from the neighbour graph built at ingest time.
+func getRelatedChunksHandler(w http.ResponseWriter, r *http.Request) {
+	ctx := r.Context()
+	db := ctx.Value(utils.DatabaseKey).(*sqlx.DB)
+
+	id, err := strconv.ParseInt(chi.URLParam(r, "chunk_id"), 10, 64)
+	if err != nil {
+		http.Error(w, "invalid chunk_id", http.StatusBadRequest)
+		return
+	}
+	limit := 10
+	if v := r.URL.Query().Get("k"); v != "" {
+		if limit, err = strconv.Atoi(v); err != nil || limit <= 0 {
+			http.Error(w, "invalid k", http.StatusBadRequest)
+			return
+		}
+	}
+
+	const q = `
+SELECT c.id, c.file_id, c.page_number, c.text, COALESCE(c.summary, '') as summary, n.score
+FROM chunk_neighbours g
+CROSS JOIN LATERAL unnest(g.neighbour_ids, g.scores) WITH ORDINALITY AS n(id, score, rank)
+JOIN chunks c ON c.id = n.id
+WHERE g.chunk_id = $1
+ORDER BY n.rank
+LIMIT $2
+`
+
+	related := []RelatedChunk{}
+	if err := db.SelectContext(ctx, &related, q, id, limit); err != nil {
+		http.Error(w, "db query failed: "+err.Error(), http.StatusInternalServerError)
+		return
+	}
+
+	w.Header().Set("Content-Type", "application/json")
+	w.WriteHeader(http.StatusOK)
+	_ = json.NewEncoder(w).Encode(map[string]any{"chunk_id": id, "results": related})
 }
 
 func getChunkHandler(w http.ResponseWriter, r *http.Request) {
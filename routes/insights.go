@@ -14,21 +14,26 @@ import (
 	"github.com/ShardulNalegave/adobe-hackathon/utils"
 	"github.com/go-chi/chi/v5"
 	"github.com/jmoiron/sqlx"
-	pgvector "github.com/pgvector/pgvector-go"
+	"github.com/lib/pq"
 )
 
 type InsightsRequest struct {
 	FileID       int64  `json:"file_id"`
 	PageNumber   int    `json:"page_number"`
 	SelectedText string `json:"selected_text"`
+	// "snippet" leaves the full chunk text out of the results
+	ResultBody string `json:"result_body"`
 }
 
 type ChunkResult struct {
-	ID         int64  `db:"id" json:"id"`
-	FileID     int64  `db:"file_id" json:"file_id"`
-	PageNumber int    `db:"page_number" json:"page_number"`
-	Summary    string `db:"summary" json:"summary"`
-	Text       string `db:"text" json:"text"`
+	ID              int64         `db:"id" json:"id"`
+	FileID          int64         `db:"file_id" json:"file_id"`
+	PageNumber      int           `db:"page_number" json:"page_number"`
+	Summary         string        `db:"summary" json:"summary"`
+	Text            string        `db:"text" json:"text,omitempty"`
+	SentenceOffsets pq.Int64Array `db:"sentence_offsets" json:"sentence_offsets,omitempty"`
+	Snippet         string        `db:"-" json:"snippet,omitempty"`
+	SnippetOffsets  [][2]int      `db:"-" json:"snippet_offsets,omitempty"`
 }
 
 type InsightsResponse struct {
@@ -36,8 +41,48 @@ type InsightsResponse struct {
 	Results []ChunkResult `json:"results"`
 }
 
+type PrefetchRequest struct {
+	FileID     int64 `json:"file_id"`
+	PageNumber int   `json:"page_number"`
+}
+
 func mountInsightsRoute(r *chi.Mux) {
 	r.Post("/api/insights", insightsHandler)
+	r.Post("/api/insights/prefetch", insightsPrefetchHandler)
+}
+
+// insightsPrefetchHandler asks the insights service to warm the related
+// sections of the page being read. It is best effort and never blocks the viewer.
+func insightsPrefetchHandler(w http.ResponseWriter, r *http.Request) {
+	var req PrefetchRequest
+	if err := json.NewDecoder(r.Body).Decode(&req); err != nil {
+		http.Error(w, "invalid JSON body", http.StatusBadRequest)
+		return
+	}
+	if req.FileID == 0 || req.PageNumber == 0 {
+		http.Error(w, "file_id and page_number are required", http.StatusBadRequest)
+		return
+	}
+
+	prefetchURL := os.Getenv("PREFETCH_SERVICE_URL")
+	if prefetchURL == "" {
+		prefetchURL = "http://127.0.0.1:5000/prefetch"
+	}
+	bodyBytes, _ := json.Marshal(req)
+
+	shortClient := &http.Client{Timeout: 2 * time.Second}
+	httpReq, _ := http.NewRequestWithContext(r.Context(), http.MethodPost, prefetchURL, bytes.NewReader(bodyBytes))
+	httpReq.Header.Set("Content-Type", "application/json")
+	httpResp, err := shortClient.Do(httpReq)
+	if err != nil {
+		http.Error(w, "failed to call prefetch service: "+err.Error(), http.StatusBadGateway)
+		return
+	}
+	defer httpResp.Body.Close()
+
+	w.Header().Set("Content-Type", "application/json")
+	w.WriteHeader(httpResp.StatusCode)
+	_, _ = io.Copy(w, httpResp.Body)
 }
 
 func insightsHandler(w http.ResponseWriter, r *http.Request) {
@@ -98,23 +143,12 @@ func insightsHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
-	// convert []float64 -> []float32 for pgvector-go
-	vec := make([]float32, len(embResp.Embedding))
-	for i, v := range embResp.Embedding {
-		vec[i] = float32(v)
-	}
-	pgvec := pgvector.NewVector(vec)
-
-	const q = `
-SELECT id, file_id, page_number, COALESCE(summary, '') as summary, text
-FROM chunks
-WHERE embedding IS NOT NULL AND file_id = $2
-ORDER BY embedding <-> $1
-LIMIT 30;
-`
+	const columns = "id, file_id, page_number, COALESCE(summary, '') as summary, text, sentence_offsets"
 
 	var rows []ChunkResult
-	if err := db.SelectContext(ctx, &rows, q, pgvec, req.FileID); err != nil {
+	err = selectNearestChunks(ctx, db, &rows, columns, embResp.Embedding, req.FileID, 30,
+		func(c ChunkResult) int64 { return c.ID })
+	if err != nil {
 		if err == sql.ErrNoRows {
 			rows = []ChunkResult{}
 		} else {
@@ -134,6 +168,9 @@ LIMIT 30;
 		"page_number":   req.PageNumber,
 		"selected_text": req.SelectedText,
 		"chunks":        rows,
+		"embedding":     embResp.Embedding,
+		// we already hold the chunk texts, so only snippets need to come back
+		"result_body": "snippet",
 	}
 	payloadBytes2, _ := json.Marshal(payload)
 
@@ -161,6 +198,17 @@ LIMIT 30;
 		http.Error(w, "invalid response from insights service", http.StatusInternalServerError)
 		return
 	}
+	texts := make(map[int64]string, len(rows))
+	for _, row := range rows {
+		texts[row.ID] = row.Text
+	}
+	for i := range finalResp.Results {
+		res := &finalResp.Results[i]
+		res.SentenceOffsets = nil
+		if req.ResultBody != "snippet" && res.Text == "" {
+			res.Text = texts[res.ID]
+		}
+	}
 
 	w.Header().Set("Content-Type", "application/json")
 	_ = json.NewEncoder(w).Encode(finalResp)
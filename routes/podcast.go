@@ -17,7 +17,6 @@ import (
 	"github.com/ShardulNalegave/adobe-hackathon/utils"
 	"github.com/go-chi/chi/v5"
 	"github.com/jmoiron/sqlx"
-	pgvector "github.com/pgvector/pgvector-go"
 )
 
 type PodcastRequest struct {
@@ -95,23 +94,13 @@ func podcastHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
-	// convert to []float32 for pgvector-go
-	vec := make([]float32, len(embResp.Embedding))
-	for i, v := range embResp.Embedding {
-		vec[i] = float32(v)
-	}
-	pgvec := pgvector.NewVector(vec)
-
 	// 2) query top 30 chunks (across all files)
-	const q = `
-SELECT id, file_id, page_number, COALESCE(summary, '') as summary, text
-FROM chunks
-WHERE embedding IS NOT NULL
-ORDER BY embedding <-> $1
-LIMIT 30;
-`
+	const columns = "id, file_id, page_number, COALESCE(summary, '') as summary, text"
+
 	var chunks []podcastChunk
-	if err := db.SelectContext(ctx, &chunks, q, pgvec); err != nil {
+	err = selectNearestChunks(ctx, db, &chunks, columns, embResp.Embedding, 0, 30,
+		func(c podcastChunk) int64 { return c.ID })
+	if err != nil {
 		if err == sql.ErrNoRows {
 			chunks = []podcastChunk{}
 		} else {
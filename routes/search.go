@@ -0,0 +1,100 @@
+package routes
+
+import (
+	"bytes"
+	"context"
+	"encoding/json"
+	"fmt"
+	"io"
+	"net/http"
+	"os"
+	"time"
+
+	"github.com/jmoiron/sqlx"
+	"github.com/lib/pq"
+	pgvector "github.com/pgvector/pgvector-go"
+)
+
+// searchChunkIDs asks the search service for the k chunks nearest to
+// embedding, within fileID or across all files when fileID is 0, best first.
+// The service scans the compact embedding codes and re-scores the best
+// candidates against the full vectors.
+func searchChunkIDs(ctx context.Context, embedding []float64, fileID int64, k int) ([]int64, error) {
+	searchURL := os.Getenv("SEARCH_SERVICE_URL")
+	if searchURL == "" {
+		searchURL = "http://127.0.0.1:5000/search"
+	}
+	reqBody := map[string]any{"embedding": embedding, "k": k}
+	if fileID != 0 {
+		reqBody["file_id"] = fileID
+	}
+	bodyBytes, _ := json.Marshal(reqBody)
+
+	shortClient := &http.Client{Timeout: 10 * time.Second}
+	httpReq, _ := http.NewRequestWithContext(ctx, http.MethodPost, searchURL, bytes.NewReader(bodyBytes))
+	httpReq.Header.Set("Content-Type", "application/json")
+	httpResp, err := shortClient.Do(httpReq)
+	if err != nil {
+		return nil, err
+	}
+	defer httpResp.Body.Close()
+	if httpResp.StatusCode != http.StatusOK {
+		b, _ := io.ReadAll(httpResp.Body)
+		return nil, fmt.Errorf("search service error: %s", string(b))
+	}
+
+	var searchResp struct {
+		Results []struct {
+			ID int64 `json:"id"`
+		} `json:"results"`
+	}
+	if err := json.NewDecoder(httpResp.Body).Decode(&searchResp); err != nil {
+		return nil, err
+	}
+	ids := make([]int64, len(searchResp.Results))
+	for i, res := range searchResp.Results {
+		ids[i] = res.ID
+	}
+	return ids, nil
+}
+
+// selectNearestChunks loads the given columns of the k chunks nearest to
+// embedding into dest, best first. Retrieval goes through the search service;
+// if it is unreachable the exact pgvector scan is used instead.
+func selectNearestChunks[T any](ctx context.Context, db *sqlx.DB, dest *[]T, columns string,
+	embedding []float64, fileID int64, k int, idOf func(T) int64) error {
+	ids, err := searchChunkIDs(ctx, embedding, fileID, k)
+	if err == nil {
+		var rows []T
+		q := "SELECT " + columns + " FROM chunks WHERE id = ANY($1)"
+		if err := db.SelectContext(ctx, &rows, q, pq.Array(ids)); err != nil {
+			return err
+		}
+		byID := make(map[int64]T, len(rows))
+		for _, row := range rows {
+			byID[idOf(row)] = row
+		}
+		ordered := make([]T, 0, len(ids))
+		for _, id := range ids {
+			// a chunk deleted by a concurrent re-ingest is simply skipped
+			if row, ok := byID[id]; ok {
+				ordered = append(ordered, row)
+			}
+		}
+		*dest = ordered
+		return nil
+	}
+
+	// convert []float64 -> []float32 for pgvector-go
+	vec := make([]float32, len(embedding))
+	for i, v := range embedding {
+		vec[i] = float32(v)
+	}
+	pgvec := pgvector.NewVector(vec)
+	if fileID != 0 {
+		q := "SELECT " + columns + " FROM chunks WHERE embedding IS NOT NULL AND file_id = $2 ORDER BY embedding <-> $1 LIMIT $3"
+		return db.SelectContext(ctx, dest, q, pgvec, fileID, k)
+	}
+	q := "SELECT " + columns + " FROM chunks WHERE embedding IS NOT NULL ORDER BY embedding <-> $1 LIMIT $2"
+	return db.SelectContext(ctx, dest, q, pgvec, k)
+}
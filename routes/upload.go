@@ -95,6 +95,43 @@ func notifyIngestService(fileURL string, fileID int64) {
 	}(fileURL)
 }
 
+type batchIngestFile struct {
+	URL    string `json:"url"`
+	FileID int64  `json:"file_id"`
+}
+
+func notifyBatchIngestService(files []batchIngestFile) {
+	if len(files) == 0 {
+		return
+	}
+
+	batchURL := os.Getenv("INGEST_BATCH_SERVICE_URL")
+	if batchURL == "" {
+		// no batch endpoint configured: fall back to one ingest call per file
+		for _, f := range files {
+			notifyIngestService(f.URL, f.FileID)
+		}
+		return
+	}
+
+	go func() {
+		b, _ := json.Marshal(map[string]any{"files": files})
+
+		client := &http.Client{Timeout: 10 * time.Second}
+		resp, err := client.Post(batchURL, "application/json", bytes.NewReader(b))
+		if err != nil {
+			fmt.Println("notifyBatchIngestService: post error:", err)
+			return
+		}
+		defer resp.Body.Close()
+		if resp.StatusCode < 200 || resp.StatusCode >= 300 {
+			respBody, _ := io.ReadAll(resp.Body)
+			fmt.Printf("notifyBatchIngestService: non-2xx from ingest service: %d %s\n", resp.StatusCode, string(respBody))
+			return
+		}
+	}()
+}
+
 func buildFileURL(r *http.Request, fileID int64) string {
 	scheme := "http"
 	if r.TLS != nil {
@@ -180,6 +217,7 @@ func uploadBatchFiles(w http.ResponseWriter, r *http.Request) {
 	}
 
 	var resp BatchUploadResponse
+	var toIngest []batchIngestFile
 
 	for _, fh := range fileHeaders {
 		src, err := fh.Open()
@@ -203,11 +241,12 @@ func uploadBatchFiles(w http.ResponseWriter, r *http.Request) {
 				UploadedAt: uploadedAt.UTC().Format(time.RFC3339),
 			})
 
-			fileURL := buildFileURL(r, fileID)
-			notifyIngestService(fileURL, fileID)
+			toIngest = append(toIngest, batchIngestFile{URL: buildFileURL(r, fileID), FileID: fileID})
 		}()
 	}
 
+	notifyBatchIngestService(toIngest)
+
 	w.Header().Set("Content-Type", "application/json")
 	w.WriteHeader(http.StatusAccepted)
 	_ = json.NewEncoder(w).Encode(resp)
@@ -0,0 +1,4 @@
+# Load .env once for every services module; they read their settings from os.environ at import.
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -1,43 +1,135 @@
 
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 import services.methods as methods
 import services.insights_processor as insights_processor
-from dotenv import load_dotenv
-
-load_dotenv()
+import services.batch_ingest as batch_ingest
+import services.ingest_progress as ingest_progress
+import services.metrics as metrics
+import services.profiler as profiler
+import services.clients as clients
+import services.prefetch as prefetch
+import services.search as search
 
 app = Flask(__name__)
+profiler.init_app(app)
+prefetch.init_app(app)
+clients.prewarm_in_background()
+
+if metrics.ENABLED:
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_time(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.observe(endpoint, time.perf_counter() - started, response.status_code >= 500,
+                            metric=metrics.REQUEST_METRIC, label="endpoint")
+        return response
 
 @app.get("/")
 def index():
     return "Hello, World!"
 
+@app.get("/ready")
+def ready():
+    warm = request.args.get("warm", "").lower() in ("1", "true", "yes")
+    status_code, body = clients.handle_ready_request(warm)
+    return jsonify(body), status_code
+
+@app.get("/metrics")
+def metrics_export():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.get("/profiles")
+def profiles_list():
+    slow_only = request.args.get("slow", "").lower() in ("1", "true", "yes")
+    return jsonify({"profiles": profiler.list_profiles(slow_only)}), 200
+
+@app.get("/profiles/<path:filename>")
+def profiles_download(filename):
+    return send_from_directory(profiler.PROFILE_DIR, filename, as_attachment=True)
+
 @app.post("/ingest")
 def jobs_ingest():
     payload = request.get_json(silent=True) or {}
     status_code, body = methods.handle_ingest_request(payload)
     return jsonify(body), status_code
 
+@app.post("/ingest/batch")
+def jobs_ingest_batch():
+    payload = request.get_json(silent=True) or {}
+    status_code, body = batch_ingest.handle_batch_ingest_request(payload)
+    return jsonify(body), status_code
+
+@app.get("/ingest/batch/<batch_id>")
+def jobs_ingest_batch_status(batch_id):
+    status_code, body = batch_ingest.handle_batch_status_request(batch_id)
+    return jsonify(body), status_code
+
+@app.get("/ingest/<int:file_id>/status")
+def jobs_ingest_status(file_id):
+    status_code, body = methods.handle_ingest_status_request(file_id)
+    return jsonify(body), status_code
+
+@app.get("/ingest/<int:file_id>/events")
+def jobs_ingest_events(file_id):
+    status_code, body = methods.handle_ingest_status_request(file_id)
+    if status_code != 200:
+        return jsonify(body), status_code
+    return Response(
+        stream_with_context(ingest_progress.stream_events(file_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/prefetch")
+def insights_prefetch():
+    payload = request.get_json(silent=True) or {}
+    status_code, body = prefetch.handle_prefetch_request(payload)
+    return jsonify(body), status_code
+
+@app.get("/prefetch/stats")
+def insights_prefetch_stats():
+    return jsonify(prefetch.stats()), 200
+
 @app.post("/embed")
+@prefetch.interactive
 def embed_text():
     payload = request.get_json(silent=True) or {}
     status_code, body = methods.handle_embed_request(payload)
     return jsonify(body), status_code
 
+@app.post("/search")
+@prefetch.interactive
+def chunks_search():
+    payload = request.get_json(silent=True) or {}
+    status_code, body = search.handle_search_request(payload)
+    return jsonify(body), status_code
+
 @app.post("/podcast")
+@prefetch.interactive
 def podcast_generate():
     payload = request.get_json(silent=True) or {}
     status_code, body = methods.handle_podcast_request(payload)
     return jsonify(body), status_code
 
 @app.post("/insights")
+@prefetch.interactive
 def insights_generate():
     payload = request.get_json(silent=True) or {}
     file_id = payload.get("file_id")
     page_number = payload.get("page_number")
     selected_text = payload.get("selected_text")
     chunks = payload.get("chunks")
-    status_code, body = insights_processor.process_insights(file_id, page_number, selected_text, chunks)
+    summary_mode = payload.get("summary_mode")
+    embedding = payload.get("embedding")
+    result_body = payload.get("result_body")
+    status_code, body = insights_processor.process_insights(file_id, page_number, selected_text, chunks,
+                                                            summary_mode, embedding, result_body)
     return jsonify(body), status_code
 
 
@@ -0,0 +1,160 @@
+"""
+Bulk ingest of many documents at once.
+
+A batch is accepted immediately and worked through by a scheduler thread:
+downloads run on a small thread pool, page extraction and chunking run on a
+shared process pool, and the resulting chunks go through the shared
+``EMBED_BATCHER``. Per-file progress lives in ``ingest_progress``.
+
+Whenever an extraction slot frees up, the smallest downloaded document is
+dispatched next, and embedding work is prioritised by document size, so
+short documents become searchable first. At most
+``INGEST_MAX_BUFFERED_DOWNLOADS`` documents are downloading or waiting for a
+slot at any time; the rest of the batch is only fetched as those drain, so
+the bytes held in memory stay bounded however large the batch is.
+"""
+
+import os
+import uuid
+import heapq
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import services.methods as methods
+import services.ingest_progress as ingest_progress
+import services.metrics as metrics
+import services.ocr as ocr
+from services.chunker import extract_document, warm_worker
+
+# ---- Configuration ----
+DOWNLOAD_WORKERS = int(os.getenv("INGEST_DOWNLOAD_WORKERS", "4"))
+EXTRACT_PROCESSES = int(os.getenv("INGEST_EXTRACT_PROCESSES", str(max(1, (os.cpu_count() or 2) - 1))))
+MAX_BUFFERED_DOWNLOADS = max(1, int(os.getenv("INGEST_MAX_BUFFERED_DOWNLOADS", str(2 * EXTRACT_PROCESSES))))
+MAX_TRACKED_BATCHES = 100
+
+logger = logging.getLogger("batch_ingest")
+
+_download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="ingest-download")
+_extract_pool = None
+_pool_lock = threading.Lock()
+
+_batches = OrderedDict()
+_batches_lock = threading.Lock()
+
+def _get_extract_pool():
+    global _extract_pool
+    with _pool_lock:
+        if _extract_pool is None:
+            # spawn: forking a process that already runs request and embedding threads is unsafe
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _extract_pool
+
+def warm_extract_pool():
+    """Start every extraction worker process and have it import PyMuPDF."""
+    pool = _get_extract_pool()
+    for fut in [pool.submit(warm_worker) for _ in range(EXTRACT_PROCESSES)]:
+        fut.result()
+
+def handle_batch_ingest_request(payload):
+    """
+    payload: { "files": [ {"url": "<pdf url>", "file_id": <int>}, ... ] }
+    returns: (status_code:int, body:dict)
+    """
+    entries = payload.get("files")
+    if not isinstance(entries, list) or not entries:
+        return 400, {"error": "expected a non-empty 'files' list"}
+
+    files = []
+    file_ids = []
+    errors = []
+    for entry in entries:
+        entry = entry if isinstance(entry, dict) else {}
+        file_id = entry.get("file_id")
+        url = entry.get("url")
+        if not file_id or not url:
+            errors.append({"file_id": file_id, "error": "each entry needs 'url' and 'file_id'"})
+            continue
+        file_ids.append(file_id)
+        files.append((file_id, url))
+
+    if not files:
+        return 400, {"error": "no valid files in batch", "errors": errors}
+
+    batch_id = uuid.uuid4().hex
+    batch = {"batch_id": batch_id, "file_ids": file_ids}
+    generations = {file_id: ingest_progress.start_file(file_id) for file_id in file_ids}
+    with _batches_lock:
+        _batches[batch_id] = batch
+        while len(_batches) > MAX_TRACKED_BATCHES:
+            _batches.popitem(last=False)
+
+    threading.Thread(target=_run_batch, args=(batch_id, files, generations), name=f"ingest-batch-{batch_id[:8]}", daemon=True).start()
+
+    body = {"status": "ingest_started", "batch_id": batch_id, "files": file_ids}
+    if errors:
+        body["errors"] = errors
+    return 202, body
+
+def handle_batch_status_request(batch_id):
+    with _batches_lock:
+        batch = _batches.get(batch_id)
+    if batch is None:
+        return 404, {"error": "unknown batch_id"}
+    files = [ingest_progress.snapshot(fid) or {"file_id": fid, "stage": "unknown"} for fid in batch["file_ids"]]
+    done = all(f["stage"] in ingest_progress.TERMINAL_STAGES for f in files)
+    return 200, {"batch_id": batch_id, "status": "done" if done else "running", "files": files}
+
+def _run_batch(batch_id, files, generations):
+    queued = list(reversed(files))  # not yet downloading, popped from the end
+    downloads = {}
+    ready = []          # heap of (size, seq, file_id, pdf_bytes) waiting for an extraction slot
+    extractions = {}
+    seq = 0
+    pool = _get_extract_pool()
+    dpi = ocr.render_dpi()
+
+    while queued or downloads or extractions or ready:
+        # only start downloads while the buffer of fetched-but-unextracted documents has room
+        while queued and len(downloads) + len(ready) < MAX_BUFFERED_DOWNLOADS:
+            file_id, url = queued.pop()
+            ingest_progress.set_stage(file_id, "downloading", generation=generations[file_id])
+            downloads[_download_executor.submit(methods.stream_url_to_bytes, url)] = file_id
+
+        # fill free extraction slots with the smallest downloaded documents
+        while ready and len(extractions) < EXTRACT_PROCESSES:
+            _, _, file_id, pdf_bytes = heapq.heappop(ready)
+            ingest_progress.set_stage(file_id, "extracting", generation=generations[file_id])
+            extractions[pool.submit(metrics.call_and_drain, extract_document, pdf_bytes, dpi)] = file_id
+
+        done, _ = wait(list(downloads) + list(extractions), return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut in downloads:
+                file_id = downloads.pop(fut)
+                try:
+                    pdf_bytes = fut.result()
+                except Exception as e:
+                    logger.warning("batch ingest: download failed for file %s: %s", file_id, e)
+                    ingest_progress.fail(file_id, f"download failed: {e}", generation=generations[file_id])
+                    continue
+                ingest_progress.set_stage(file_id, "waiting", generation=generations[file_id], bytes=len(pdf_bytes))
+                heapq.heappush(ready, (len(pdf_bytes), seq, file_id, pdf_bytes))
+                seq += 1
+            else:
+                file_id = extractions.pop(fut)
+                try:
+                    (page_count, page_chunks, textless), timings = fut.result()
+                    metrics.merge(timings)
+                    # fewer chunks -> lower priority value -> embedded earlier
+                    methods.ingest_extracted_document(file_id, page_count, page_chunks, priority=len(page_chunks),
+                                                      textless_pages=textless, generation=generations[file_id])
+                except Exception as e:
+                    logger.exception("batch ingest: failed for file %s", file_id)
+                    ingest_progress.fail(file_id, f"ingest failed: {e}", generation=generations[file_id])
+
+    logger.info("batch ingest %s: extraction finished for %d files", batch_id, len(files))
@@ -1,8 +1,7 @@
 
+import os
 import re
-from dotenv import load_dotenv
-
-load_dotenv()
+from services import metrics
 
 # tuning parameters
 MIN_WORDS = 40
@@ -71,4 +70,76 @@ def chunk_page_by_paragraphs(page_text):
             chunks.extend(paragraph_to_subchunks(m))
         else:
             chunks.append({'text': m['text']})
-    return chunks
\ No newline at end of file
+    return chunks
+
+def warm_worker():
+    """Pre-import PyMuPDF in an extraction worker process."""
+    import fitz  # noqa: F401
+    return True
+
+def _open(source):
+    import fitz  # PyMuPDF
+
+    # a path is opened lazily by MuPDF, so pages outside the window are never loaded
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+def count_pages(source):
+    """Number of pages of a PDF given as bytes or a file path."""
+    doc = _open(source)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+def extract_document(source, render_dpi=None, first_page=1, last_page=None):
+    """
+    Open a PDF (bytes or a file path) and chunk every page that has text.
+    Returns (page_count, [(page_number, text), ...], textless_pages) with
+    1-based page numbers. textless_pages lists the pages without a text layer
+    as (page_number, png_bytes), rendered in greyscale at ``render_dpi`` for
+    OCR, or (page_number, None) when ``render_dpi`` is None.
+
+    Only pages ``first_page``..``last_page`` (inclusive, default all) are
+    extracted; page_count is always that of the whole document.
+
+    Kept free of database and network state so it can run in a worker process.
+    """
+    import fitz  # PyMuPDF
+
+    with metrics.timer("pdf_open"):
+        doc = _open(source)
+    try:
+        page_chunks = []
+        textless = []
+        end = doc.page_count if last_page is None else min(last_page, doc.page_count)
+        for pno in range(max(first_page, 1) - 1, end):
+            with metrics.timer("page_extract"):
+                page = doc.load_page(pno)
+                page_text = page.get_textpage().extractText()
+            if not page_text or not page_text.strip():
+                image = None
+                if render_dpi:
+                    with metrics.timer("page_render"):
+                        image = page.get_pixmap(dpi=render_dpi, colorspace=fitz.csGRAY).tobytes("png")
+                textless.append((pno + 1, image))
+                continue
+            with metrics.timer("chunking"):
+                chunks = chunk_page_by_paragraphs(page_text)
+            for ch in chunks:
+                page_chunks.append((pno + 1, ch["text"]))
+        return doc.page_count, page_chunks, textless
+    finally:
+        doc.close()
+        if last_page is not None:
+            # drop MuPDF's cached fonts/images of this window before the next one
+            fitz.TOOLS.store_shrink(100)
+
+def extract_document_chunks(pdf_bytes):
+    """
+    Open a PDF and chunk every page that has text.
+    Returns (page_count, [(page_number, text), ...]) with 1-based page numbers.
+    """
+    page_count, page_chunks, _ = extract_document(pdf_bytes)
+    return page_count, page_chunks
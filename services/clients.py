@@ -0,0 +1,140 @@
+"""
+Lazily initialised heavy dependencies.
+
+Importing ``google.generativeai``, ``psycopg2``/``pgvector``, ``fitz`` and
+``numpy`` dominates service start-up, so none of them is imported when the
+service modules load. Each is loaded on first use instead, and ``warm_up``
+loads them all ahead of traffic (``GET /ready?warm=1``).
+
+Under ``services.serve`` each process is given a role with ``set_role``; the
+interactive workers never run ingests, so they skip the
+``BACKGROUND_WARMERS`` (the extraction process pool) and only the
+background process starts it.
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger("clients")
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
+# comma separated components to warm in the background at start-up, or "all"
+PREWARM_ON_START = os.getenv("PREWARM_ON_START", "").strip()
+
+_lock = threading.Lock()
+_genai = None
+_warm = {}          # component -> seconds it took to warm, or an error string
+_role = None        # serve role of this process; None runs every component
+
+def genai():
+    """The configured ``google.generativeai`` module, imported on first call."""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as sdk
+                if GOOGLE_API_KEY:
+                    sdk.configure(api_key=GOOGLE_API_KEY)
+                _genai = sdk
+    return _genai
+
+def set_genai(module):
+    """Replace the SDK (used by the offline benchmarks' fakes)."""
+    global _genai
+    with _lock:
+        _genai = module
+
+def _warm_genai():
+    genai()
+
+def _warm_db():
+    import services.methods as methods
+    conn = methods.get_db_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+    finally:
+        conn.close()
+
+def _warm_pdf():
+    import fitz  # noqa: F401  (PyMuPDF)
+
+def _warm_numpy():
+    from services import quantize  # noqa: F401
+
+def _warm_extract_pool():
+    import services.batch_ingest as batch_ingest
+    batch_ingest.warm_extract_pool()
+
+WARMERS = {
+    "genai": _warm_genai,
+    "db": _warm_db,
+    "pdf": _warm_pdf,
+    "numpy": _warm_numpy,
+    "extract_pool": _warm_extract_pool,
+}
+
+# components only the process that runs ingests needs
+BACKGROUND_WARMERS = {"extract_pool"}
+
+def set_role(role):
+    """Record the serve role of this process ("interactive" or "background")."""
+    global _role
+    _role = role
+
+def role_warmers():
+    """The WARMERS this process's role uses."""
+    if _role == "interactive":
+        return [name for name in WARMERS if name not in BACKGROUND_WARMERS]
+    return list(WARMERS)
+
+def warm_up(components=None):
+    """
+    Initialise the given components (default: all of this role's). Components
+    the role does not use are skipped. Returns {component: seconds or error}.
+    """
+    allowed = role_warmers()
+    for name in components or allowed:
+        if name not in allowed:
+            continue
+        if isinstance(_warm.get(name), float):
+            continue
+        start = time.perf_counter()
+        try:
+            WARMERS[name]()
+            _warm[name] = round(time.perf_counter() - start, 4)
+        except Exception as e:
+            logger.warning("warm-up of %s failed: %s", name, e)
+            _warm[name] = f"error: {e}"
+    return dict(_warm)
+
+def prewarm_in_background():
+    """Start warming the PREWARM_ON_START components without blocking start-up."""
+    if not PREWARM_ON_START:
+        return None
+    components = None if PREWARM_ON_START == "all" else [c.strip() for c in PREWARM_ON_START.split(",") if c.strip() in WARMERS]
+    thread = threading.Thread(target=warm_up, args=(components,), name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+def warm_status():
+    return {name: _warm.get(name) for name in role_warmers()}
+
+def handle_ready_request(warm=False):
+    """
+    Readiness probe. Without ``warm`` it only reports which components are
+    already initialised; with ``warm`` it initialises them first and reports
+    503 if any of them failed.
+    returns: (status_code:int, body:dict)
+    """
+    if warm:
+        warm_up()
+    status = warm_status()
+    failed = [name for name, v in status.items() if isinstance(v, str)]
+    body = {"ready": not failed, "components": status}
+    if failed:
+        body["failed"] = failed
+    return (503 if failed else 200), body
@@ -0,0 +1,223 @@
+"""
+Token-budgeted context assembly for the LLM prompts.
+
+Retrieved chunks overlap heavily: the chunker repeats 125 words between
+neighbouring sub-chunks, and similar pages produce near-identical chunks.
+``build_context`` walks the chunks in relevance order and
+
+  1. drops near-duplicates, found by comparing MinHash signatures of their
+     word shingles (estimated Jaccard >= ``CONTEXT_DEDUP_THRESHOLD``)
+  2. cuts runs of at least ``CONTEXT_MIN_OVERLAP_WORDS`` words whose
+     shingles already appeared in an earlier excerpt; a chunk left with
+     fewer than ``CONTEXT_MIN_NOVEL_WORDS`` new words is dropped as well
+  3. fills the token budget, truncating the last excerpt that only fits in
+     part and leaving out the rest
+
+Tokens are estimated as characters / ``CONTEXT_CHARS_PER_TOKEN``. The report
+compares the tokens sent with what the prompt sent before budgeting
+(``baseline_tokens``): 200-character samples of every chunk for ranking (the
+30 the client sends plus any merged prefetched sections), 500-character excerpts of the first 10 chunks for the summary, and the full
+text of every chunk otherwise. The budgets are set so that neither prompt can
+grow past that baseline.
+"""
+
+import os
+import re
+import zlib
+
+# ---- Configuration ----
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+SHINGLE_WORDS = int(os.getenv("CONTEXT_SHINGLE_WORDS", "5"))
+MINHASH_PERMUTATIONS = int(os.getenv("CONTEXT_MINHASH_PERMUTATIONS", "64"))
+DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+MIN_OVERLAP_WORDS = int(os.getenv("CONTEXT_MIN_OVERLAP_WORDS", "20"))
+MIN_NOVEL_WORDS = int(os.getenv("CONTEXT_MIN_NOVEL_WORDS", "15"))
+MIN_TAIL_TOKENS = 32    # don't bother truncating an excerpt to fewer tokens than this
+
+# payload the ranking and summary prompts sent before budgeting: (items, characters per item);
+# rank_budget widens the ranking one to every chunk when more than 30 are ranked
+BASELINE_RANK = (30, 200)
+BASELINE_SUMMARY = (10, 500)
+
+# per-caller budgets (tokens of excerpt text, excluding the fixed instructions);
+# ranking and summary stay at or below their baseline payload
+BUDGET_PODCAST = int(os.getenv("CONTEXT_BUDGET_PODCAST", "8000"))
+BUDGET_SUMMARY = int(os.getenv("CONTEXT_BUDGET_SUMMARY", "1250"))
+BUDGET_RANK = int(os.getenv("CONTEXT_BUDGET_RANK", "1500"))
+BUDGET_CHUNK_SUMMARY = int(os.getenv("CONTEXT_BUDGET_CHUNK_SUMMARY", "2000"))
+RANK_ITEM_TOKENS = int(os.getenv("CONTEXT_RANK_ITEM_TOKENS", "50"))
+SUMMARY_ITEM_TOKENS = int(os.getenv("CONTEXT_SUMMARY_ITEM_TOKENS", "125"))
+
+_MERSENNE = (1 << 31) - 1
+_ELLIPSIS = "…"
+_word_re = re.compile(r"\w+")
+_permutations = None
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN + 0.5) if text else 0
+
+def baseline_tokens(items, limits=None):
+    """
+    Tokens of the pre-budget payload for ``items``: with ``limits=(n, chars)``
+    the first ``n`` non-empty texts cut to ``chars`` characters (plus the
+    "..." marker), otherwise every text in full.
+    """
+    texts = [it.get("text") or "" for it in items]
+    if limits is None:
+        return sum(estimate_tokens(t) for t in texts)
+    max_items, max_chars = limits
+    samples = [t[:max_chars] + "..." if len(t) > max_chars else t for t in texts if t][:max_items]
+    return sum(estimate_tokens(t) for t in samples)
+
+def rank_budget(items):
+    """
+    (budget, baseline) for ranking ``items``: RANK_ITEM_TOKENS per item, at
+    least BUDGET_RANK, capped to the 200-character samples of every item so
+    that sections merged after the client's 30 are ranked too.
+    """
+    max_items, max_chars = BASELINE_RANK
+    baseline = baseline_tokens(items, (max(max_items, len(items)), max_chars))
+    return min(max(BUDGET_RANK, RANK_ITEM_TOKENS * len(items)), baseline), baseline
+
+def _normalise(word):
+    return "".join(_word_re.findall(word.lower()))
+
+def _shingles(words):
+    """Hash of every SHINGLE_WORDS-long window of normalised words (one window for short texts)."""
+    norm = [_normalise(w) for w in words]
+    k = min(SHINGLE_WORDS, len(norm))
+    return [zlib.crc32(" ".join(norm[i:i + k]).encode("utf-8")) for i in range(len(norm) - k + 1)] if k else []
+
+def _minhash(shingles):
+    import numpy as np
+
+    global _permutations
+    if _permutations is None:
+        rng = np.random.default_rng(0)
+        _permutations = (rng.integers(1, _MERSENNE, MINHASH_PERMUTATIONS, dtype=np.uint64),
+                         rng.integers(0, _MERSENNE, MINHASH_PERMUTATIONS, dtype=np.uint64))
+    a, b = _permutations
+    if not shingles:
+        return np.full(MINHASH_PERMUTATIONS, _MERSENNE, dtype=np.uint64)
+    h = np.asarray(shingles, dtype=np.uint64) % _MERSENNE
+    return ((a[:, None] * h[None, :] + b[:, None]) % _MERSENNE).min(axis=1)
+
+def _truncate_words(words, max_tokens):
+    """Longest prefix of ``words`` whose joined text fits in ``max_tokens``."""
+    budget_chars = max_tokens * CHARS_PER_TOKEN
+    used = 0
+    for i, w in enumerate(words):
+        used += len(w) + (1 if i else 0)
+        if used > budget_chars:
+            return words[:i]
+    return words
+
+def _cut_overlaps(words, shingles, seen):
+    """
+    Drop runs of at least MIN_OVERLAP_WORDS words covered by already-seen
+    shingles. Returns (kept words, words removed, index of the earlier
+    excerpt most of the overlap came from).
+    """
+    covered = [False] * len(words)
+    owners = {}
+    k = min(SHINGLE_WORDS, len(words))
+    for i, s in enumerate(shingles):
+        owner = seen.get(s)
+        if owner is not None:
+            owners[owner] = owners.get(owner, 0) + 1
+            for j in range(i, i + k):
+                covered[j] = True
+    if not owners:
+        return words, 0, None
+
+    kept, removed, i = [], 0, 0
+    while i < len(words):
+        j = i
+        while j < len(words) and covered[j] == covered[i]:
+            j += 1
+        if covered[i] and j - i >= MIN_OVERLAP_WORDS:
+            removed += j - i
+            if 0 < i and j < len(words):
+                kept.append(_ELLIPSIS)
+        else:
+            kept.extend(words[i:j])
+        i = j
+    return kept, removed, max(owners, key=owners.get)
+
+def build_context(items, budget_tokens, max_item_tokens=None, baseline=None):
+    """
+    Select and trim excerpts from ``items`` (dicts with a ``text`` key, most
+    relevant first; items carrying a ``distance`` are re-sorted by it).
+    ``baseline`` is the token count ``tokens_saved`` is measured against
+    (see ``baseline_tokens``); it defaults to the full text of every item.
+
+    returns (excerpts, duplicates, report):
+      - excerpts: [{"index": int, "item": dict, "text": str}] in prompt order
+      - duplicates: {index of dropped item: index of the item it duplicates}
+      - report: counts and token totals for logging / the response
+    """
+    import numpy as np
+
+    order = list(range(len(items)))
+    if items and all(isinstance(it.get("distance"), (int, float)) for it in items):
+        order.sort(key=lambda i: items[i]["distance"])
+
+    report = {"items": len(items), "used": 0, "duplicates": 0, "overlap_words_removed": 0,
+              "truncated": 0, "over_budget": 0, "budget": budget_tokens,
+              "tokens_in": sum(estimate_tokens(it.get("text") or "") for it in items), "tokens_used": 0}
+    report["tokens_baseline"] = report["tokens_in"] if baseline is None else baseline
+    excerpts, duplicates = [], {}
+    seen = {}                   # shingle -> index of the first excerpt containing it
+    signatures, sig_owner = [], []
+    remaining = budget_tokens
+
+    for idx in order:
+        words = (items[idx].get("text") or "").split()
+        if not words:
+            continue
+        if remaining < MIN_TAIL_TOKENS:
+            report["over_budget"] += 1
+            continue
+
+        shingles = _shingles(words)
+        sig = _minhash(shingles)
+        if signatures:
+            similarity = (np.vstack(signatures) == sig).mean(axis=1)
+            best = int(similarity.argmax())
+            if similarity[best] >= DEDUP_THRESHOLD:
+                duplicates[idx] = sig_owner[best]
+                report["duplicates"] += 1
+                continue
+
+        kept, removed, owner = _cut_overlaps(words, shingles, seen)
+        novel = sum(1 for w in kept if w != _ELLIPSIS)
+        if removed and novel < MIN_NOVEL_WORDS:
+            duplicates[idx] = owner
+            report["duplicates"] += 1
+            continue
+        report["overlap_words_removed"] += removed
+        signatures.append(sig)
+        sig_owner.append(idx)
+        for s in shingles:
+            seen.setdefault(s, idx)
+
+        limit = remaining if max_item_tokens is None else min(remaining, max_item_tokens)
+        shown = _truncate_words(kept, limit)
+        if len(shown) < len(kept):
+            report["truncated"] += 1
+            shown = shown + [_ELLIPSIS]
+        text = " ".join(shown)
+        tokens = estimate_tokens(text)
+        remaining -= tokens
+        report["tokens_used"] += tokens
+        excerpts.append({"index": idx, "item": items[idx], "text": text})
+
+    report["used"] = len(excerpts)
+    # negative when the excerpts cost more than the baseline payload did
+    report["tokens_saved"] = report["tokens_baseline"] - report["tokens_used"]
+    return excerpts, duplicates, report
+
+def format_report(report):
+    return (f"{report['used']}/{report['items']} excerpts, {report['tokens_used']}/{report['budget']} tokens "
+            f"({report['tokens_saved']} saved vs {report['tokens_baseline']}; {report['duplicates']} duplicates, "
+            f"{report['overlap_words_removed']} overlap words, {report['over_budget']} over budget)")
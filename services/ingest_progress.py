@@ -0,0 +1,211 @@
+"""
+In-memory ingest pipeline state, one record per file.
+
+Every ingest path reports into this module as a file moves through its
+stages (downloading -> extracting -> storing -> embedding -> ready), and the
+embedding workers bump the counters as chunks complete. Status requests and
+the SSE stream read these records instead of counting rows in ``chunks``.
+
+Every ``start_file`` opens a new ingest generation for the file. Updates
+tagged with an older generation come from an earlier ingest of the same file
+that is still in flight (a chunk batch or OCR page finishing after a
+re-upload) and are dropped, so they cannot land on the new record.
+
+Files ingested before the service started are seeded from the database once,
+on the first status request that asks for them.
+"""
+
+import json
+import time
+import itertools
+import threading
+from collections import OrderedDict
+
+MAX_TRACKED_FILES = 1000
+TERMINAL_STAGES = ("ready", "failed")
+
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)
+_files = OrderedDict()
+_generations = itertools.count(1)
+
+def _new_state(file_id):
+    now = time.time()
+    return {
+        "file_id": file_id,
+        "stage": "queued",
+        "error": None,
+        "bytes": None,
+        "pages_total": None,
+        "pages_extracted": 0,
+        "chunks_inserted": 0,
+        "chunks_unchanged": 0,
+        "chunks_removed": 0,
+        "chunks_to_embed": 0,
+        "embeddings_done": 0,
+        "embed_failures": 0,
+        "summaries_done": 0,
+        "summary_failures": 0,
+        "ocr_pages_total": 0,
+        "ocr_pages_done": 0,
+        "ocr_failures": 0,
+        "ocr_cache_hits": 0,
+        "started_at": now,
+        "updated_at": now,
+        "embed_started_at": None,
+        "version": 0,
+        "generation": None,
+    }
+
+def _key(file_id):
+    return str(file_id)
+
+def _touch(state):
+    """Publish a change; returns True when it completed the embedding stage."""
+    # embedding is complete once every queued chunk has either succeeded or failed,
+    # and every page sent to OCR has come back (OCR pages add chunks to embed)
+    completed = (state["stage"] == "embedding"
+                 and state["embeddings_done"] + state["embed_failures"] >= state["chunks_to_embed"]
+                 and state["ocr_pages_done"] + state["ocr_failures"] >= state["ocr_pages_total"])
+    if completed:
+        state["stage"] = "ready"
+    state["updated_at"] = time.time()
+    state["version"] += 1
+    _changed.notify_all()
+    return completed
+
+def _get_or_create(file_id):
+    key = _key(file_id)
+    state = _files.get(key)
+    if state is None:
+        state = _files[key] = _new_state(file_id)
+        while len(_files) > MAX_TRACKED_FILES:
+            _files.popitem(last=False)
+    return state
+
+def _current(file_id, generation):
+    """The record to update, or None when ``generation`` is set and no longer current."""
+    if generation is None:
+        return _get_or_create(file_id)
+    state = _files.get(_key(file_id))
+    if state is None or state["generation"] != generation:
+        return None
+    return state
+
+def start_file(file_id, stage="queued"):
+    """
+    Reset the record for a file that is (re-)entering the pipeline.
+    Returns the new ingest generation, to be passed along with every update
+    this ingest makes.
+    """
+    with _lock:
+        key = _key(file_id)
+        _files.pop(key, None)
+        state = _get_or_create(file_id)
+        state["stage"] = stage
+        state["generation"] = next(_generations)
+        _touch(state)
+        return state["generation"]
+
+def generation(file_id):
+    """Current ingest generation of a file, or None when it is not tracked."""
+    with _lock:
+        state = _files.get(_key(file_id))
+        return state["generation"] if state is not None else None
+
+def set_stage(file_id, stage, generation=None, **fields):
+    with _lock:
+        state = _current(file_id, generation)
+        if state is None:
+            return
+        state.update(fields)
+        state["stage"] = stage
+        if stage == "embedding" and state["embed_started_at"] is None:
+            state["embed_started_at"] = time.time()
+        _touch(state)
+
+def increment(file_id, generation=None, **counts):
+    """Add to the file's counters. Returns True when this update made the file ready."""
+    with _lock:
+        state = _current(file_id, generation)
+        if state is None:
+            return False
+        for name, n in counts.items():
+            state[name] += n
+        return _touch(state)
+
+def fail(file_id, error, generation=None):
+    set_stage(file_id, "failed", generation=generation, error=str(error))
+
+def _public(state):
+    view = dict(state)
+    now = time.time()
+    view["ready"] = state["stage"] == "ready"
+    view["elapsed_s"] = round(now - state["started_at"], 3)
+    embed_start = state["embed_started_at"]
+    if embed_start is not None and state["embeddings_done"]:
+        end = state["updated_at"] if view["ready"] else now
+        view["embeddings_per_s"] = round(state["embeddings_done"] / max(end - embed_start, 1e-6), 3)
+    else:
+        view["embeddings_per_s"] = 0.0
+    return view
+
+def snapshot(file_id):
+    """Current state of a file as a JSON-friendly dict, or None when it is not tracked."""
+    with _lock:
+        state = _files.get(_key(file_id))
+        return _public(state) if state is not None else None
+
+def wait_for_update(file_id, version, timeout):
+    """Block until the file's record moves past ``version`` (or timeout). Returns the latest snapshot."""
+    deadline = time.monotonic() + timeout
+    with _lock:
+        while True:
+            state = _files.get(_key(file_id))
+            if state is not None and state["version"] != version:
+                return _public(state)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return _public(state) if state is not None else None
+            _changed.wait(remaining)
+
+def seed_from_row(file_id, num_pages, total, embedded, summarized):
+    """
+    Build a record for a file ingested by an earlier process from one aggregate row.
+    A file with chunks still missing embeddings is seeded in the ``embedding``
+    stage; the caller re-queues those chunks under the returned generation.
+    Returns the generation, or None when the file was already tracked.
+    """
+    with _lock:
+        if _key(file_id) in _files:
+            return None
+        state = _get_or_create(file_id)
+        state.update(
+            pages_total=num_pages,
+            pages_extracted=num_pages,
+            chunks_inserted=total,
+            chunks_to_embed=total,
+            embeddings_done=embedded,
+            summaries_done=summarized,
+            stage="ready" if embedded >= total else "embedding",
+            embed_started_at=None if embedded >= total else time.time(),
+            generation=next(_generations),
+        )
+        _touch(state)
+        return state["generation"]
+
+def stream_events(file_id, heartbeat=15.0):
+    """
+    Server-sent events for one file: a ``progress`` event on every change and a
+    comment line as keep-alive. The stream ends once the file reaches a terminal stage.
+    """
+    version = None
+    while True:
+        state = wait_for_update(file_id, version, heartbeat)
+        if state is None or state["version"] == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = state["version"]
+        yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+        if state["stage"] in TERMINAL_STAGES:
+            return
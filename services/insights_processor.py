@@ -1,21 +1,29 @@
 import os
 import json
 import logging
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
+from services import clients, context_builder, metrics, prefetch, snippets, summaries
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("insights_processor")
 
-# Initialize Gemini API
+# Gemini is configured lazily by services.clients
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
 
-def process_insights(file_id, page_number, selected_text, chunks):
+# Where the overall summary's context comes from:
+#   fast        - return the stored summary of the selected page (or its document) as is
+#   precomputed - summarise from stored page/document summaries and chunk summaries
+#   raw         - summarise from the chunk texts
+SUMMARY_MODE = os.getenv("INSIGHTS_SUMMARY_MODE", "precomputed").strip().lower()
+
+# What each result carries besides its snippet preview:
+#   full    - the chunk text as well
+#   snippet - no text for the chunks the caller sent (it already has them);
+#             sections merged in from the prefetch cache keep theirs
+RESULT_BODY = os.getenv("INSIGHTS_RESULT_BODY", "full").strip().lower()
+
+def process_insights(file_id, page_number, selected_text, chunks, summary_mode=None, embedding=None,
+                     result_body=None):
     """
     Process insights to generate a summary and rank chunks by relevance.
     
@@ -34,58 +42,154 @@ def process_insights(file_id, page_number, selected_text, chunks):
             "file_id": int,
             "page_number": int,
             "summary": str,
-            "text": str
+            "text": str,
+            "sentence_offsets": list[int]   # optional, flattened [start, end, ...]
         }
+    summary_mode : str, optional
+        "fast", "precomputed" or "raw"; defaults to INSIGHTS_SUMMARY_MODE
+    embedding : list[float], optional
+        Embedding of the selected text; when the page was prefetched, the
+        closest cached sections from other files are merged into chunks
+    result_body : str, optional
+        "full" or "snippet"; defaults to INSIGHTS_RESULT_BODY
     
     Returns:
     --------
-    dict
-        A dictionary with the format:
+    (int, dict)
+        Status code and a dictionary with the format:
         {
             "summary": str,
-            "results": list[chunk_objects]
+            "results": list[chunk_objects],
+            "context": {"summary": report, "rank": report},
+            "prefetch": {"hit": bool, "related": int}
         }
-        Where results are the chunks sorted by relevance to the selected text
+        Where results are the chunks sorted by relevance to the selected text,
+        each with a "snippet" of 2-4 sentences and its "snippet_offsets"
+        ([[start, end], ...] into the chunk text), and context reports how
+        each prompt's excerpts were budgeted
     """
+    try:
+        file_id, page_number = prefetch.parse_page_key(file_id, page_number)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+
     try:
         # Validate required inputs
         if not selected_text or selected_text.strip() == "":
             logger.warning("Missing or empty selected_text")
-            return {"summary": "", "results": chunks}
+            return 200, {"summary": "", "results": chunks}
+
+        sent_ids = {chunk.get("id") for chunk in chunks or []}
+        chunks, prefetch_info = _merge_prefetched(file_id, page_number, chunks or [], embedding)
             
         if not chunks:
             logger.info("No chunks provided to analyze")
-            return {"summary": "", "results": []}
+            return 200, {"summary": "", "results": []}
             
         # Log processing start
         logger.info(f"Processing insights for file_id: {file_id}, page: {page_number}, chunks: {len(chunks)}")
             
         # Generate overall summary
-        summary = generate_overall_summary(selected_text, chunks)
+        reports = {}
+        summary = generate_overall_summary(selected_text, chunks, reports, summary_mode, file_id, page_number)
         
         # Rank chunks by relevance
-        ranked_chunks = rank_chunks_by_relevance(selected_text, chunks)
+        ranked_chunks = rank_chunks_by_relevance(selected_text, chunks, reports)
+        ranked_chunks = _with_snippets(selected_text, ranked_chunks, sent_ids, result_body)
         
         return 200, {
             "summary": summary,
-            "results": ranked_chunks
+            "results": ranked_chunks,
+            "context": reports,
+            "prefetch": prefetch_info
         }
         
     except Exception as e:
         logger.exception(f"Insights generation failed: {str(e)}")
         return 200, {"summary": "", "results": chunks}
 
-def generate_overall_summary(selected_text, chunks):
+@metrics.timed("snippets")
+def _with_snippets(selected_text, chunks, sent_ids, result_body=None):
+    """Attach snippet previews; in snippet mode, drop the text of the chunks the caller sent."""
+    snippets.attach_snippets(selected_text, chunks)
+    if (result_body or RESULT_BODY).strip().lower() == "snippet":
+        return [{k: v for k, v in chunk.items() if k != "text"} if chunk.get("id") in sent_ids else chunk
+                for chunk in chunks]
+    return chunks
+
+@metrics.timed("prefetch_merge")
+def _merge_prefetched(file_id, page_number, chunks, embedding):
+    """Append the prefetched sections from other files closest to the selection, if the page is warm."""
+    if embedding is None or file_id is None or page_number is None:
+        return chunks, {"hit": False, "related": 0}
+    entry = prefetch.candidates_for(file_id, page_number)
+    if entry is None:
+        return chunks, {"hit": False, "related": 0}
+    known = {chunk.get("id") for chunk in chunks}
+    related = [c for c in prefetch.rerank(entry, embedding) if c["id"] not in known]
+    logger.info(f"Prefetch hit for file_id: {file_id}, page: {page_number}, {len(related)} related sections")
+    return chunks + related, {"hit": True, "related": len(related)}
+
+def _summary_items(chunks, page_summaries, document_summaries):
+    """
+    Compact context for the overall summary: the documents' summaries, then one
+    summary per page in chunk relevance order, falling back to the chunk's own
+    summary for pages that have not been rolled up yet.
+    """
+    items = []
+    for file_id in dict.fromkeys(chunk.get("file_id") for chunk in chunks):
+        if file_id in document_summaries:
+            items.append({"label": f"Document {file_id} overview", "text": document_summaries[file_id]})
+    used_pages = set()
+    for chunk in chunks:
+        key = (chunk.get("file_id"), chunk.get("page_number"))
+        if key in page_summaries:
+            if key not in used_pages:
+                used_pages.add(key)
+                items.append({"label": f"Document {key[0]}, page {key[1]}", "text": page_summaries[key]})
+        elif chunk.get("summary"):
+            items.append({"label": f"Document {key[0]}, page {key[1]} (section)", "text": chunk["summary"]})
+    return items
+
+@metrics.timed("overall_summary")
+def generate_overall_summary(selected_text, chunks, reports=None, mode=None, file_id=None, page_number=None):
     """
     Generate an overall summary based on the selected text and chunks.
+    See SUMMARY_MODE for the modes; precomputed and fast fall back to raw
+    when nothing has been rolled up for these chunks yet. The context
+    builder's report is stored in reports["summary"] if given.
     """
+    mode = (mode or SUMMARY_MODE).strip().lower()
+    baseline = context_builder.baseline_tokens(chunks, context_builder.BASELINE_SUMMARY)
+    items = None
+    if mode in ("fast", "precomputed"):
+        pairs = [(c.get("file_id"), c.get("page_number")) for c in chunks] + [(file_id, page_number)]
+        page_summaries, document_summaries = summaries.load_summaries(
+            (f, p) for f, p in pairs if f is not None and p is not None)
+        if mode == "fast":
+            direct = page_summaries.get((file_id, page_number)) or document_summaries.get(file_id)
+            if direct:
+                if reports is not None:
+                    reports["summary"] = {"mode": "fast", "tokens_baseline": baseline, "tokens_used": 0,
+                                          "tokens_saved": baseline}
+                return direct
+        items = _summary_items(chunks, page_summaries, document_summaries) or None
+    if items is None:
+        mode, items = "raw", chunks
+
     if not GOOGLE_API_KEY:
         logger.warning("GOOGLE_API_KEY not set; cannot generate summary")
         return ""
         
     try:
-        # Extract chunk texts similar to podcast function
-        chunk_texts = [chunk.get("text", "") for chunk in chunks[:10] if chunk.get("text")]
+        # Deduplicated excerpts within the summary token budget
+        # savings are measured against the raw chunk excerpts the prompt used to send, whatever the mode
+        excerpts, _, report = context_builder.build_context(
+            items, context_builder.BUDGET_SUMMARY, context_builder.SUMMARY_ITEM_TOKENS, baseline)
+        report["mode"] = mode
+        logger.info(f"Summary context ({mode}): {context_builder.format_report(report)}")
+        if reports is not None:
+            reports["summary"] = report
         
         # Build prompt
         prompt = (
@@ -94,10 +198,11 @@ def generate_overall_summary(selected_text, chunks):
             f"Selected Text:\n{selected_text}\n\n"
         )
         
-        if chunk_texts:
+        if excerpts:
             prompt += "Additional Context:\n"
-            for i, text in enumerate(chunk_texts, 1):
-                prompt += f"Excerpt {i}:\n{text[:500]}...\n\n"  # Truncate long chunks
+            for i, excerpt in enumerate(excerpts, 1):
+                label = excerpt["item"].get("label") or f"Excerpt {i}"
+                prompt += f"{label}:\n{excerpt['text']}\n\n"
                 
         prompt += (
             "Instructions:\n"
@@ -114,7 +219,7 @@ def generate_overall_summary(selected_text, chunks):
             "top_k": 40,
         }
         
-        model = genai.GenerativeModel(
+        model = clients.genai().GenerativeModel(
             model_name="gemini-2.5-flash",
             generation_config=generation_config,
         )
@@ -134,13 +239,17 @@ def generate_overall_summary(selected_text, chunks):
         return " ".join(lines)
         
     except Exception as e:
+        metrics.mark_error()
         logger.exception(f"Error generating overall summary: {str(e)}")
         return ""
 
-def rank_chunks_by_relevance(selected_text, chunks):
+@metrics.timed("rank_chunks")
+def rank_chunks_by_relevance(selected_text, chunks, reports=None):
     """
     Rank chunks by relevance to the selected text using Gemini.
-    Returns the sorted list of chunks.
+    Returns the sorted list of chunks. Near-duplicates are not sent to the
+    model; each is placed right after the chunk it duplicates. The context
+    builder's report is stored in reports["rank"] if given.
     """
     if not GOOGLE_API_KEY:
         logger.warning("GOOGLE_API_KEY not set; cannot rank chunks")
@@ -154,13 +263,17 @@ def rank_chunks_by_relevance(selected_text, chunks):
         chunks_by_id = {str(chunk.get("id")): chunk for chunk in chunks}
         chunk_ids = list(chunks_by_id.keys())
         
-        # Build a list of short chunk samples for the prompt
-        chunk_samples = []
-        for chunk_id, chunk in chunks_by_id.items():
-            # Get the first 200 characters of the text as a sample
-            text = chunk.get("text", "")
-            text_sample = text[:200] + "..." if len(text) > 200 else text
-            chunk_samples.append(f"ID: {chunk_id}\nSample: {text_sample}\n")
+        # Short, deduplicated samples of the chunks within the ranking token budget
+        budget, baseline = context_builder.rank_budget(chunks)
+        excerpts, duplicates, report = context_builder.build_context(
+            chunks, budget, context_builder.RANK_ITEM_TOKENS, baseline)
+        logger.info(f"Ranking context: {context_builder.format_report(report)}")
+        if reports is not None:
+            reports["rank"] = report
+        chunk_samples = [f"ID: {excerpt['item'].get('id')}\nSample: {excerpt['text']}\n" for excerpt in excerpts]
+        followers = {}
+        for dup, original in duplicates.items():
+            followers.setdefault(str(chunks[original].get("id")), []).append(str(chunks[dup].get("id")))
         
         # Build prompt for ranking - similar pattern to podcast prompt
         prompt = (
@@ -170,8 +283,8 @@ def rank_chunks_by_relevance(selected_text, chunks):
             "Excerpts to rank:\n"
         )
         
-        # Add chunks to prompt (limited to avoid token limits)
-        for i, sample in enumerate(chunk_samples[:30], 1):  # Limit to 30 chunks
+        # Add chunks to prompt
+        for i, sample in enumerate(chunk_samples, 1):
             prompt += f"Excerpt {i}:\n{sample}\n"
             
         prompt += (
@@ -191,7 +304,7 @@ def rank_chunks_by_relevance(selected_text, chunks):
             "top_k": 40,
         }
         
-        model = genai.GenerativeModel(
+        model = clients.genai().GenerativeModel(
             model_name="gemini-2.5-flash",
             generation_config=generation_config,
         )
@@ -214,15 +327,20 @@ def rank_chunks_by_relevance(selected_text, chunks):
             
             # Ensure ranked_ids is a list
             if not isinstance(ranked_ids, list):
+                metrics.mark_error()
                 logger.warning("Ranked IDs is not a list, using original order")
                 return chunks
                 
+            # Put each duplicate right after the chunk it duplicates
+            ranked_ids = [str(id) for id in ranked_ids]
+            ranked_ids = [i for id in ranked_ids for i in [id] + followers.pop(id, [])]
+            
             # Check for missing IDs and append them at the end
-            ranked_id_set = set(str(id) for id in ranked_ids)
+            ranked_id_set = set(ranked_ids)
             missing_ids = [id for id in chunk_ids if id not in ranked_id_set]
             
             # Append missing IDs at the end
-            complete_ranked_ids = ranked_ids + missing_ids
+            complete_ranked_ids = list(dict.fromkeys(ranked_ids + missing_ids))
             
             # Log the ranking results
             logger.info(f"Successfully ranked chunks: {len(ranked_ids)} ranked, {len(missing_ids)} missing")
@@ -236,10 +354,12 @@ def rank_chunks_by_relevance(selected_text, chunks):
             return sorted_chunks
             
         except json.JSONDecodeError as e:
+            metrics.mark_error()
             logger.error(f"Failed to parse ranked IDs JSON: {e}")
             logger.error(f"Raw response: {result_text}")
             return chunks
         
     except Exception as e:
+        metrics.mark_error()
         logger.exception(f"Error ranking chunks: {str(e)}")
         return chunks
@@ -1,43 +1,55 @@
-
 import os
-import requests
-import fitz          # PyMuPDF
-from concurrent.futures import ThreadPoolExecutor
-import psycopg2
-import psycopg2.extras
-from pgvector.psycopg2 import register_vector
-from pgvector import Vector
-import google.generativeai as genai
+import hashlib
+import tempfile
+import queue
+import itertools
+import threading
 import logging
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
-from services.chunker import chunk_page_by_paragraphs
-
-from dotenv import load_dotenv
-
-load_dotenv()
+from services.chunker import count_pages, extract_document
+from services import clients, context_builder, ingest_progress, metrics, ocr, snippets
 
 # ---- Configuration ----
 POSTGRES_DSN = os.getenv("POSTGRES_DSN")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 MAX_IN_MEMORY_BYTES = 50 * 1024 * 1024  # keep small for memory safety
+MAX_DOWNLOAD_BYTES = int(os.getenv("INGEST_MAX_FILE_BYTES", str(1024 * 1024 * 1024)))
 DOWNLOAD_TIMEOUT = 15
+INGEST_WINDOW_PAGES = int(os.getenv("INGEST_WINDOW_PAGES", "50"))  # larger documents are ingested in windows
 EMBED_WORKERS = 4
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "16"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "8"))  # chunk summaries in flight, across all embed workers
 EMBED_MODEL = "models/embedding-001"  # Google's embedding model
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-
-EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=EMBED_WORKERS)
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ingest")
 
+_summary_pool = None
+_summary_pool_lock = threading.Lock()
+
+_window_jobs = queue.Queue()
+_window_worker = None
+_window_lock = threading.Lock()
+
 def get_db_conn():
+    # psycopg2 / pgvector are imported on first use to keep start-up fast
+    import psycopg2
+    from pgvector.psycopg2 import register_vector
+
     conn = psycopg2.connect(POSTGRES_DSN)
     register_vector(conn)
     return conn
 
+def get_dict_cursor(conn):
+    import psycopg2.extras
+    return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+@metrics.timed("download")
 def stream_url_to_bytes(url, max_bytes=MAX_IN_MEMORY_BYTES, timeout=DOWNLOAD_TIMEOUT):
+    import requests
+
     resp = requests.get(url, stream=True, timeout=timeout)
     if resp.status_code != 200:
         raise RuntimeError(f"download failed: status {resp.status_code}")
@@ -52,12 +64,34 @@ def stream_url_to_bytes(url, max_bytes=MAX_IN_MEMORY_BYTES, timeout=DOWNLOAD_TIM
         buf.extend(chunk)
     return bytes(buf)
 
+@metrics.timed("download")
+def stream_url_to_file(url, fileobj, max_bytes=MAX_DOWNLOAD_BYTES, timeout=DOWNLOAD_TIMEOUT):
+    """Stream a download into an open binary file. Returns (size, sha256 hex digest)."""
+    import requests
+
+    resp = requests.get(url, stream=True, timeout=timeout)
+    if resp.status_code != 200:
+        raise RuntimeError(f"download failed: status {resp.status_code}")
+    digest = hashlib.sha256()
+    total = 0
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        if not chunk:
+            continue
+        total += len(chunk)
+        if total > max_bytes:
+            raise ValueError("file too large to ingest")
+        digest.update(chunk)
+        fileobj.write(chunk)
+    fileobj.flush()
+    return total, digest.hexdigest()
+
+@metrics.timed("compute_embedding")
 def compute_embedding(text: str):
     if not GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_API_KEY not set; cannot compute embeddings")
     
     # Generate embeddings using Google's embedding model
-    result = genai.embed_content(
+    result = clients.genai().embed_content(
         model=EMBED_MODEL,
         content=text,
         task_type="RETRIEVAL_QUERY"
@@ -66,10 +100,31 @@ def compute_embedding(text: str):
     # Extract the embedding values
     return result["embedding"]
 
+@metrics.timed("compute_embeddings")
+def compute_embeddings(texts):
+    """Embed several texts with one request; returns one vector per text, in order."""
+    if not GOOGLE_API_KEY:
+        raise RuntimeError("GOOGLE_API_KEY not set; cannot compute embeddings")
+    if not texts:
+        return []
+
+    result = clients.genai().embed_content(
+        model=EMBED_MODEL,
+        content=list(texts),
+        task_type="RETRIEVAL_QUERY"
+    )
+    return result["embedding"]
+
+@metrics.timed("compute_summary")
 def compute_summary(text: str) -> str:
     if not GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_API_KEY not set; cannot generate summary")
 
+    # Chunks are bounded by the chunker; the budget only guards against outliers
+    if context_builder.estimate_tokens(text) > context_builder.BUDGET_CHUNK_SUMMARY:
+        excerpts, _, _ = context_builder.build_context([{"text": text}], context_builder.BUDGET_CHUNK_SUMMARY)
+        text = excerpts[0]["text"] if excerpts else text
+
     # Build a concise summarization prompt targeting 1–2 lines
     prompt = (
         "Summarize the following content in 1 to 2 concise sentences. "
@@ -77,7 +132,7 @@ def compute_summary(text: str) -> str:
         "Content:\n" + text
     )
 
-    model = genai.GenerativeModel(
+    model = clients.genai().GenerativeModel(
         model_name="gemini-2.5-flash"
     )
 
@@ -90,112 +145,590 @@ def compute_summary(text: str) -> str:
 
     return summary_text
 
-def process_chunk_and_store_embedding(chunk_id):
+def chunk_content_hash(text, page_number):
+    """Identity of a chunk for re-ingest: its text together with the page it sits on."""
+    return hashlib.sha256(f"{page_number}\n{text}".encode("utf-8")).hexdigest()
+
+def _store_embedding(cur, chunk_id, emb, summary_text):
+    import psycopg2
+    from pgvector import Vector
+    from services import quantize
+
+    columns = {"embedding": Vector(emb)}
+    if summary_text is not None:
+        columns["summary"] = summary_text
+    # optional reduced / quantized copy used for the candidate scan
+    compact = quantize.compact_embedding(emb)
+    if compact is not None:
+        columns["embedding_compact"] = psycopg2.Binary(compact[0])
+        columns["embedding_scale"] = compact[1]
+    assignments = ", ".join(f"{name} = %s" for name in columns)
+    cur.execute(f"UPDATE chunks SET {assignments} WHERE id = %s", (*columns.values(), chunk_id))
+
+def _get_summary_pool():
+    global _summary_pool
+    with _summary_pool_lock:
+        if _summary_pool is None:
+            _summary_pool = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="chunk-summary")
+        return _summary_pool
+
+def _summarize_chunk(row, generation=None):
+    """Summary of one chunk row, or None if generation failed (the chunk is still embedded)."""
+    try:
+        summary_text = compute_summary(row["text"])
+        ingest_progress.increment(row["file_id"], generation=generation, summaries_done=1)
+        return summary_text
+    except Exception as summary_err:
+        ingest_progress.increment(row["file_id"], generation=generation, summary_failures=1)
+        logger.exception("process_chunks: summary generation failed for chunk %s: %s", row["id"], summary_err)
+        return None
+
+def process_chunks_and_store_embeddings(chunk_ids, generations=None):
+    """
+    Summarize and embed a batch of chunks with a single embedding call.
+    The summaries are generated concurrently on the summary pool while the
+    embedding call runs. If the batch call or its write fails, every chunk is
+    retried on its own, so one bad chunk does not fail the rest.
+    Chunks that are missing or already embedded are skipped. ``generations``
+    maps chunk ids to the ingest generation their progress is reported under.
+    Returns the set of chunk ids that no longer need embedding.
+    """
     conn = None
     try:
         conn = get_db_conn()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute("SELECT id, text, embedding FROM chunks WHERE id = %s", (chunk_id,))
-        row = cur.fetchone()
-        if not row:
-            logger.warning("process_chunk: chunk id %s not found", chunk_id)
-            return
-        if row.get("embedding") is not None:
-            logger.info("process_chunk: chunk id %s already has embedding", chunk_id)
-            return
-        text = row["text"] ################### 
-        # Try summarization first, but do not fail the whole operation if it errors
-        summary_text = None
+        cur = get_dict_cursor(conn)
+        cur.execute(
+            "SELECT id, file_id, text FROM chunks WHERE id = ANY(%s) AND embedding IS NULL ORDER BY id",
+            (list(chunk_ids),)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            logger.info("process_chunks: nothing to embed for %s", list(chunk_ids))
+            return set(chunk_ids)
+
+        pool = _get_summary_pool()
+        generations = generations or {}
+        summary_futures = [pool.submit(_summarize_chunk, row, generations.get(row["id"])) for row in rows]
         try:
-            summary_text = compute_summary(text)
-        except Exception as summary_err:
-            logger.exception("process_chunk: summary generation failed for chunk %s: %s", chunk_id, summary_err)
-
-        emb = compute_embedding(text)               # may raise
-        v = Vector(emb)
-        if summary_text is not None:
-            cur.execute("UPDATE chunks SET embedding = %s, summary = %s WHERE id = %s", (v, summary_text, chunk_id))
-        else:
-            cur.execute("UPDATE chunks SET embedding = %s WHERE id = %s", (v, chunk_id))
-        conn.commit()
-        logger.info("process_chunk: wrote embedding for chunk %s", chunk_id)
+            embeddings = compute_embeddings([row["text"] for row in rows])
+        except Exception as e:
+            logger.warning("process_chunks: batch embedding of %d chunks failed, retrying one by one: %s", len(rows), e)
+            embeddings = None
+        summaries = [f.result() for f in summary_futures]
+
+        if embeddings is not None:
+            try:
+                with metrics.timer("db_write_embeddings"):
+                    for row, emb, summary_text in zip(rows, embeddings, summaries):
+                        _store_embedding(cur, row["id"], emb, summary_text)
+                    conn.commit()
+                logger.info("process_chunks: wrote embeddings for %d chunks", len(rows))
+                return set(chunk_ids)
+            except Exception as e:
+                conn.rollback()
+                logger.warning("process_chunks: batch write of %d chunks failed, retrying one by one: %s", len(rows), e)
+
+        failed = set()
+        for row, summary_text in zip(rows, summaries):
+            try:
+                emb = compute_embeddings([row["text"]])[0]
+                _store_embedding(cur, row["id"], emb, summary_text)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                failed.add(row["id"])
+                logger.exception("process_chunks: failed for chunk %s: %s", row["id"], e)
+        logger.info("process_chunks: wrote embeddings for %d of %d chunks one by one", len(rows) - len(failed), len(rows))
+        return set(chunk_ids) - failed
     except Exception as e:
         if conn:
             conn.rollback()
-        logger.exception("process_chunk: failed for chunk %s: %s", chunk_id, e)
+        logger.exception("process_chunks: failed for chunks %s: %s", list(chunk_ids), e)
+        return set()
     finally:
         if conn:
             conn.close()
 
-def handle_ingest_request(payload):
-    url = payload.get("url")
-    file_id = payload.get("file_id")
+class EmbedBatcher:
+    """
+    Shared embedding queue for every ingest path.
+
+    Chunk ids are served lowest priority value first, so callers can make
+    small documents searchable before large ones. Each worker drains up to
+    ``batch_size`` queued ids and embeds them together, then schedules the
+    roll-up of the pages holding the new chunk summaries (and, once the ingest
+    settles, of the document) and, once a file is fully embedded, adds it to
+    the cross-document neighbour graph.
+    """
+
+    def __init__(self, workers=EMBED_WORKERS, batch_size=EMBED_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, chunk_ids, priority=0, file_id=None, generation=None):
+        """
+        Queue chunk ids; completions are reported to ``ingest_progress`` under
+        ``file_id`` and the ingest ``generation`` that queued them.
+        """
+        self._ensure_started()
+        for cid in chunk_ids:
+            self._queue.put((priority, next(self._seq), cid, file_id, generation))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"embed-batcher-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = process_chunks_and_store_embeddings([cid for _, _, cid, _, _ in batch],
+                                                       {cid: gen for _, _, cid, _, gen in batch})
+            per_file, embedded = {}, {}
+            for _, _, cid, file_id, gen in batch:
+                if file_id is None:
+                    continue
+                counts = per_file.setdefault((file_id, gen), {"embeddings_done": 0, "embed_failures": 0})
+                counts["embeddings_done" if cid in done else "embed_failures"] += 1
+                if cid in done:
+                    embedded.setdefault(file_id, []).append(cid)
+            from services import neighbours, search, summaries
+            for file_id in embedded:
+                search.invalidate_file(file_id)
+            for (file_id, gen), counts in per_file.items():
+                # the batch that brings the file to "ready" adds it to the neighbour graph
+                if ingest_progress.increment(file_id, generation=gen, **counts):
+                    neighbours.schedule(file_id)
+                summaries.schedule(file_id, embedded.get(file_id, []))
+
+EMBED_BATCHER = EmbedBatcher()
+
+def reconcile_chunks(stored, page_chunks):
+    """
+    Match stored chunk rows (``id``, ``page_number``, ``content_hash``,
+    ``needs_embedding``, and ``legacy_text`` for rows written before hashes
+    existed) against freshly extracted ``(page_number, text)`` pairs by content
+    hash. Duplicated texts are matched one to one.
+
+    Returns (to_insert, pending_ids, stale_ids, unchanged): the
+    ``(page_number, text, content_hash)`` triples that are new, the kept ids
+    still missing an embedding, the ids no longer in the document and the
+    number of kept chunks.
+    """
+    existing = {}
+    for row in stored:
+        h = row["content_hash"] or chunk_content_hash(row["legacy_text"], row["page_number"])
+        existing.setdefault(h, []).append(row)
+
+    to_insert, pending_ids, unchanged = [], [], 0
+    for page_number, text in page_chunks:
+        h = chunk_content_hash(text, page_number)
+        if existing.get(h):
+            kept = existing[h].pop(0)
+            unchanged += 1
+            if kept["needs_embedding"]:
+                pending_ids.append(kept["id"])
+            continue
+        to_insert.append((page_number, text, h))
+
+    # whatever was not matched no longer exists in the document
+    stale_ids = [row["id"] for rows in existing.values() for row in rows]
+    return to_insert, pending_ids, stale_ids, unchanged
 
+@metrics.timed("db_write_chunks")
+def store_document_chunks(file_id, page_count, page_chunks, keep_pages=(), pages=None, checkpoint=None):
+    """
+    Reconcile the stored chunks of a file with freshly extracted ``(page_number, text)``
+    pairs in one transaction: unchanged chunks are kept, stale ones deleted and new
+    ones inserted. Chunks on ``keep_pages`` (pages sent to OCR) are left alone.
+
+    With ``pages=(first, last)`` only that page range is reconciled, and
+    ``checkpoint=(content_hash, last_page)`` is recorded in ``ingest_checkpoints``
+    in the same transaction, so a window is either fully stored and checkpointed
+    or not at all.
+
+    Returns (chunk_ids_to_embed, diff) where diff counts added/removed/unchanged chunks.
+    """
     conn = None
-    doc = None
     try:
         conn = get_db_conn()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-        if not file_id:
-            return 400, {"error": "no file_id provided"}
+        cur = get_dict_cursor(conn)
 
-        if not url:
-            return 400, {"error": "no url provided to download PDF for ingestion"}
+        # update num_pages in files; the row lock this takes also serializes
+        # concurrent re-ingests of the same file until we commit
+        cur.execute("UPDATE files SET num_pages = %s WHERE id = %s", (page_count, file_id))
 
-        # download PDF bytes and open with PyMuPDF
-        pdf_bytes = stream_url_to_bytes(url)
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        page_count = doc.page_count
+        # chunks already stored for this file; a re-ingest keeps unchanged
+        # chunks (and their embeddings) in place
+        query = ("SELECT id, page_number, content_hash, embedding IS NULL AS needs_embedding, "
+                 "CASE WHEN content_hash IS NULL THEN text END AS legacy_text "
+                 "FROM chunks WHERE file_id = %s")
+        params = [file_id]
+        if pages is not None:
+            query += " AND page_number BETWEEN %s AND %s"
+            params.extend(pages)
+        cur.execute(query + " ORDER BY id", params)
+        rows = [row for row in cur.fetchall() if row["page_number"] not in keep_pages]
+        to_insert, pending_ids, stale_ids, unchanged = reconcile_chunks(rows, page_chunks)
 
-        # update num_pages in files
-        cur.execute("UPDATE files SET num_pages = %s WHERE id = %s", (page_count, file_id))
+        inserted_chunk_ids = []
+        for page_number, text, h in to_insert:
+            cur.execute(
+                "INSERT INTO chunks (file_id, text, page_number, content_hash, sentence_offsets) "
+                "VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                (file_id, text, page_number, h, snippets.sentence_offsets(text))
+            )
+            inserted_chunk_ids.append(cur.fetchone()["id"])
+
+        if stale_ids:
+            cur.execute("DELETE FROM chunks WHERE id = ANY(%s)", (stale_ids,))
+        if checkpoint is not None:
+            cur.execute(
+                "INSERT INTO ingest_checkpoints (file_id, content_hash, page_count, last_page) "
+                "VALUES (%s, %s, %s, %s) ON CONFLICT (file_id) DO UPDATE SET content_hash = EXCLUDED.content_hash, "
+                "page_count = EXCLUDED.page_count, last_page = EXCLUDED.last_page, updated_at = now()",
+                (file_id, checkpoint[0], page_count, checkpoint[1])
+            )
         conn.commit()
 
+        diff = {
+            "added": len(inserted_chunk_ids),
+            "removed": len(stale_ids),
+            "unchanged": unchanged,
+            "pending_embedding": len(pending_ids),
+        }
+        return inserted_chunk_ids + pending_ids, diff
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def store_page_chunks(file_id, page_number, texts):
+    """
+    Reconcile the stored chunks of one page with its recognised ``texts`` (OCR
+    results arriving after the rest of the file was stored): unchanged chunks
+    are kept, chunks from an earlier scan of the page that are no longer in
+    its text are deleted and new ones inserted.
+    Returns (chunk_ids_to_embed, diff) like ``store_document_chunks``.
+    """
+    conn = None
+    try:
+        conn = get_db_conn()
+        cur = get_dict_cursor(conn)
+        cur.execute(
+            "SELECT id, page_number, content_hash, embedding IS NULL AS needs_embedding, "
+            "CASE WHEN content_hash IS NULL THEN text END AS legacy_text "
+            "FROM chunks WHERE file_id = %s AND page_number = %s ORDER BY id",
+            (file_id, page_number)
+        )
+        to_insert, pending_ids, stale_ids, unchanged = reconcile_chunks(
+            cur.fetchall(), [(page_number, text) for text in texts])
+
         inserted_chunk_ids = []
-        for pno in range(doc.page_count):
-            page = doc.load_page(pno)
-            page_text = page.get_textpage().extractText()
-            if not page_text or not page_text.strip():
-                continue
-            # chunk by paragraph (chunker returns list of dicts or texts)
-            chunks = chunk_page_by_paragraphs(page_text)
-            for ch in chunks:
-                # ch is a dict with 'text' at minimum
-                text = ch["text"]
-                cur.execute(
-                    "INSERT INTO chunks (file_id, text, page_number) VALUES (%s, %s, %s) RETURNING id",
-                    (file_id, text, pno + 1)
-                )
-                cid = cur.fetchone()["id"]
-                inserted_chunk_ids.append(cid)
+        for _, text, h in to_insert:
+            cur.execute(
+                "INSERT INTO chunks (file_id, text, page_number, content_hash, sentence_offsets) "
+                "VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                (file_id, text, page_number, h, snippets.sentence_offsets(text))
+            )
+            inserted_chunk_ids.append(cur.fetchone()["id"])
+        if stale_ids:
+            cur.execute("DELETE FROM chunks WHERE id = ANY(%s)", (stale_ids,))
         conn.commit()
-        doc.close()
-        doc = None
 
-        for cid in inserted_chunk_ids:
-            EMBED_EXECUTOR.submit(process_chunk_and_store_embedding, cid)
+        diff = {
+            "added": len(inserted_chunk_ids),
+            "removed": len(stale_ids),
+            "unchanged": unchanged,
+            "pending_embedding": len(pending_ids),
+        }
+        return inserted_chunk_ids + pending_ids, diff
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
 
-        return 202, {"status": "ingest_started", "file_id": file_id, "chunks_created": len(inserted_chunk_ids)}
+def ingest_extracted_document(file_id, page_count, page_chunks, priority=0, textless_pages=(), generation=None):
+    """
+    Store extracted chunks for a file and queue the ones that need embedding, and
+    the rendered text-less pages for OCR. Progress is reported under the ingest
+    ``generation``. Returns the diff.
+    """
+    ocr_pages = [(pno, png) for pno, png in textless_pages if png is not None]
+    ingest_progress.set_stage(file_id, "storing", generation=generation, pages_total=page_count,
+                              pages_extracted=page_count, ocr_pages_total=len(ocr_pages))
+    chunk_ids, diff = store_document_chunks(file_id, page_count, page_chunks,
+                                            keep_pages={pno for pno, _ in ocr_pages})
+    diff["ocr_pages"] = len(ocr_pages)
+    if diff["added"] or diff["removed"]:
+        from services import prefetch, search
+        prefetch.invalidate_file(file_id)
+        search.invalidate_file(file_id)
+    ingest_progress.set_stage(
+        file_id,
+        "embedding",
+        generation=generation,
+        chunks_inserted=diff["added"],
+        chunks_unchanged=diff["unchanged"],
+        chunks_removed=diff["removed"],
+        chunks_to_embed=len(chunk_ids),
+    )
+    EMBED_BATCHER.submit(chunk_ids, priority=priority, file_id=file_id, generation=generation)
+    if ocr_pages:
+        ocr.OCR_SCHEDULER.submit(file_id, ocr_pages, priority=priority, generation=generation)
+    if diff["removed"] and not chunk_ids:
+        # nothing new to summarise, but removed pages/chunks change the rollup
+        from services import summaries
+        summaries.schedule(file_id)
+    return diff
+
+def _load_checkpoint(file_id, content_hash, page_count):
+    """Last page stored by an interrupted windowed ingest of the same content, or 0."""
+    conn = None
+    try:
+        conn = get_db_conn()
+        cur = get_dict_cursor(conn)
+        cur.execute("SELECT content_hash, page_count, last_page FROM ingest_checkpoints WHERE file_id = %s",
+                    (file_id,))
+        row = cur.fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row and row["content_hash"] == content_hash and row["page_count"] == page_count:
+        return row["last_page"]
+    return 0
 
-    except ValueError as e:
+def _finish_windowed_ingest(file_id, page_count, resumed_from):
+    """
+    Drop chunks past the end of the document, delete the checkpoint, and return
+    (removed, pending ids) where pending are chunks stored by an interrupted run
+    before ``resumed_from`` that still need embedding.
+    """
+    conn = None
+    try:
+        conn = get_db_conn()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM chunks WHERE file_id = %s AND page_number > %s", (file_id, page_count))
+        removed = cur.rowcount
+        pending = []
+        if resumed_from > 1:
+            cur.execute("SELECT id FROM chunks WHERE file_id = %s AND page_number < %s AND embedding IS NULL "
+                        "ORDER BY id", (file_id, resumed_from))
+            pending = [r[0] for r in cur.fetchall()]
+        cur.execute("DELETE FROM ingest_checkpoints WHERE file_id = %s", (file_id,))
+        conn.commit()
+        return removed, pending
+    except Exception:
         if conn:
             conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def ingest_document_windows(file_id, path, content_hash, page_count, priority=0, window=INGEST_WINDOW_PAGES,
+                            generation=None):
+    """
+    Ingest a large PDF ``window`` pages at a time: each window is extracted,
+    stored and checkpointed in its own transaction, and its chunks are queued
+    for embedding right away, so memory stays bounded by the window rather than
+    the document. A previous run of the same content that failed part-way
+    resumes after its last checkpointed page. Returns the diff.
+    """
+    done = _load_checkpoint(file_id, content_hash, page_count)
+    start = done + 1
+    if done:
+        logger.info("ingest: resuming file %s at page %d of %d", file_id, start, page_count)
+    ingest_progress.set_stage(file_id, "extracting", generation=generation, pages_total=page_count,
+                              pages_extracted=done)
+    diff = {"added": 0, "removed": 0, "unchanged": 0, "pending_embedding": 0, "ocr_pages": 0,
+            "windows": 0, "resumed_from_page": start if done else None}
+    dpi = ocr.render_dpi()
+    for first in range(start, page_count + 1, window):
+        last = min(first + window - 1, page_count)
+        _, page_chunks, textless = extract_document(path, dpi, first, last)
+        ocr_pages = [(pno, png) for pno, png in textless if png is not None]
+        chunk_ids, window_diff = store_document_chunks(
+            file_id, page_count, page_chunks, keep_pages={pno for pno, _ in ocr_pages},
+            pages=(first, last), checkpoint=(content_hash, last))
+        page_chunks = textless = None
+        for key in ("added", "removed", "unchanged", "pending_embedding"):
+            diff[key] += window_diff[key]
+        diff["ocr_pages"] += len(ocr_pages)
+        diff["windows"] += 1
+        ingest_progress.set_stage(file_id, "extracting", generation=generation, pages_extracted=last)
+        ingest_progress.increment(file_id, generation=generation, chunks_inserted=window_diff["added"],
+                                  chunks_unchanged=window_diff["unchanged"],
+                                  chunks_removed=window_diff["removed"],
+                                  chunks_to_embed=len(chunk_ids), ocr_pages_total=len(ocr_pages))
+        EMBED_BATCHER.submit(chunk_ids, priority=priority, file_id=file_id, generation=generation)
+        if ocr_pages:
+            ocr.OCR_SCHEDULER.submit(file_id, ocr_pages, priority=priority, generation=generation)
+
+    removed, pending = _finish_windowed_ingest(file_id, page_count, start)
+    diff["removed"] += removed
+    diff["pending_embedding"] += len(pending)
+    if diff["added"] or diff["removed"]:
+        from services import prefetch, search
+        prefetch.invalidate_file(file_id)
+        search.invalidate_file(file_id)
+    ingest_progress.increment(file_id, generation=generation, chunks_removed=removed, chunks_to_embed=len(pending))
+    ingest_progress.set_stage(file_id, "embedding", generation=generation)
+    EMBED_BATCHER.submit(pending, priority=priority, file_id=file_id, generation=generation)
+    if diff["removed"] and not (diff["added"] or diff["pending_embedding"]):
+        from services import summaries
+        summaries.schedule(file_id)
+    return diff
+
+def _run_windowed_ingests():
+    while True:
+        file_id, path, content_hash, page_count, priority, generation = _window_jobs.get()
+        try:
+            if generation is not None and ingest_progress.generation(file_id) != generation:
+                logger.info("ingest: skipping windowed ingest of file %s, superseded by a newer upload", file_id)
+                continue
+            ingest_document_windows(file_id, path, content_hash, page_count, priority=priority,
+                                    generation=generation)
+        except Exception as e:
+            ingest_progress.fail(file_id, e, generation=generation)
+            logger.exception("windowed ingest failed for file %s", file_id)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+def queue_windowed_ingest(file_id, path, content_hash, page_count, priority=0, generation=None):
+    """
+    Run ``ingest_document_windows`` on the background window worker, which takes
+    over ``path`` and deletes it when done. Large documents are ingested one at
+    a time, so their extraction memory stays bounded by a single window.
+    """
+    global _window_worker
+    with _window_lock:
+        if _window_worker is None:
+            _window_worker = threading.Thread(target=_run_windowed_ingests, name="ingest-windows", daemon=True)
+            _window_worker.start()
+    _window_jobs.put((file_id, path, content_hash, page_count, priority, generation))
+
+def handle_ingest_request(payload):
+    url = payload.get("url")
+    file_id = payload.get("file_id")
+
+    if not file_id:
+        return 400, {"error": "no file_id provided"}
+
+    if not url:
+        return 400, {"error": "no url provided to download PDF for ingestion"}
+
+    generation = ingest_progress.start_file(file_id, "downloading")
+    # the PDF is spooled to disk, never held in memory; MuPDF reads pages from the file
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+        try:
+            return _ingest_downloaded(file_id, url, pdf_file, generation)
+        finally:
+            # unless a windowed ingest has moved the file away for its worker
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(pdf_file.name)
+
+def _ingest_downloaded(file_id, url, pdf_file, generation):
+    try:
+        size, content_hash = stream_url_to_file(url, pdf_file)
+        ingest_progress.set_stage(file_id, "extracting", generation=generation, bytes=size)
+        page_count = count_pages(pdf_file.name)
+        if page_count > INGEST_WINDOW_PAGES:
+            # too slow to extract within the request: answer once downloaded and
+            # let the window worker report progress under this generation
+            path = pdf_file.name + ".windows"
+            os.replace(pdf_file.name, path)
+            queue_windowed_ingest(file_id, path, content_hash, page_count, generation=generation)
+            return 202, {
+                "status": "ingest_started",
+                "file_id": file_id,
+                "pages_total": page_count,
+                "windowed": True,
+            }
+
+        page_count, page_chunks, textless = extract_document(pdf_file.name, ocr.render_dpi())
+        diff = ingest_extracted_document(file_id, page_count, page_chunks, textless_pages=textless,
+                                         generation=generation)
+
+        return 202, {
+            "status": "ingest_started",
+            "file_id": file_id,
+            "chunks_created": diff["added"],
+            "diff": diff,
+        }
+
+    except ValueError as e:
+        ingest_progress.fail(file_id, e, generation=generation)
         return 413, {"error": str(e)}
     except Exception as e:
-        if conn:
-            conn.rollback()
+        ingest_progress.fail(file_id, e, generation=generation)
         logger.exception("ingest failed")
         return 500, {"error": f"ingest failed: {e}"}
+
+def handle_ingest_status_request(file_id):
+    """
+    Pipeline state for one file, served from the in-memory counters.
+    Files not seen by this process are seeded once from the database.
+    returns: (status_code:int, body:dict)
+    """
+    state = ingest_progress.snapshot(file_id)
+    if state is not None:
+        return 200, state
+
+    conn = None
+    try:
+        conn = get_db_conn()
+        cur = get_dict_cursor(conn)
+        cur.execute(
+            "SELECT f.num_pages, COUNT(c.id) AS total, COUNT(c.embedding) AS embedded, "
+            "COUNT(c.summary) AS summarized "
+            "FROM files f LEFT JOIN chunks c ON c.file_id = f.id WHERE f.id = %s GROUP BY f.id",
+            (file_id,)
+        )
+        row = cur.fetchone()
+        pending = []
+        if row and row["embedded"] < row["total"]:
+            cur.execute("SELECT id FROM chunks WHERE file_id = %s AND embedding IS NULL ORDER BY id", (file_id,))
+            pending = [r["id"] for r in cur.fetchall()]
+    except Exception as e:
+        logger.exception("ingest status lookup failed")
+        return 500, {"error": f"status lookup failed: {e}"}
     finally:
-        if doc:
-            try:
-                doc.close()
-            except Exception:
-                pass
         if conn:
             conn.close()
 
+    if not row:
+        return 404, {"error": "unknown file_id"}
+    generation = ingest_progress.seed_from_row(file_id, row["num_pages"], row["total"], row["embedded"],
+                                               row["summarized"])
+    if generation is not None and pending:
+        # left unembedded by an earlier process; finishing them lets the record reach "ready"
+        EMBED_BATCHER.submit(pending, priority=len(pending), file_id=file_id, generation=generation)
+    return 200, ingest_progress.snapshot(file_id)
+
 def handle_embed_request(payload):
     """
     payload: { "text": "<selection text>" }
@@ -225,7 +758,7 @@ def handle_podcast_request(payload):
       - Use Gemini to generate a podcast script
       - Convert script to audio using Google Cloud TTS
       - Save the audio file locally
-      - Return {"audio_url": "<url>"}
+      - Return {"context": report} describing how the chunks were budgeted
     """
     podcast_id = payload.get("podcast_id")
     selection_text = payload.get("selection_text", "")
@@ -238,7 +771,7 @@ def handle_podcast_request(payload):
     
     try:
         # 1. Format content into a prompt for Gemini
-        prompt_content = _format_podcast_prompt(selection_text, chunks)
+        prompt_content, context_report = _format_podcast_prompt(selection_text, chunks)
         
         # 2. Generate podcast script using Gemini
         script = _generate_podcast_script(prompt_content)
@@ -261,16 +794,20 @@ def handle_podcast_request(payload):
             raise RuntimeError("Failed to generate audio")
             
         logger.info(f"Generated audio for podcast_id: {podcast_id} at {audio_path}")
-        return 200, {}
+        return 200, {"context": context_report}
         
     except Exception as e:
         logger.exception(f"Podcast generation failed: {str(e)}")
         return 500, {"error": f"Podcast generation failed: {str(e)}"}
 
 def _format_podcast_prompt(selection_text, chunks):
-    """Format selection text and chunks into a prompt for Gemini."""
-    # Combine all chunk texts
-    chunk_texts = [chunk.get("text", "") for chunk in chunks if chunk.get("text")]
+    """
+    Format selection text and chunks into a prompt for Gemini.
+    Returns (prompt, context report).
+    """
+    # Deduplicated chunk texts, most relevant first, within the token budget
+    excerpts, _, report = context_builder.build_context(chunks, context_builder.BUDGET_PODCAST)
+    logger.info(f"Podcast context: {context_builder.format_report(report)}")
     
     # Build prompt
     prompt = "Create a single-person podcast script based on the following content.\n\n"
@@ -278,10 +815,10 @@ def _format_podcast_prompt(selection_text, chunks):
     if selection_text:
         prompt += f"Main focus:\n{selection_text}\n\n"
         
-    if chunk_texts:
+    if excerpts:
         prompt += "Additional context:\n"
-        for i, text in enumerate(chunk_texts, 1):
-            prompt += f"Excerpt {i}:\n{text}\n\n"
+        for i, excerpt in enumerate(excerpts, 1):
+            prompt += f"Excerpt {i}:\n{excerpt['text']}\n\n"
     
     # Using f-string to properly insert the selection_text variable
     prompt += f"""
@@ -299,8 +836,9 @@ Instructions:
 11. Your script should be a maximum of 3000 characters only. Make sure you concluse before you reach the limit. THIS IS AN IMPORTANT CONSTRAINT, PLEASE DO NOT IGNORE.
 """
     
-    return prompt
+    return prompt, report
 
+@metrics.timed("podcast_script")
 def _generate_podcast_script(prompt):
     """Generate podcast script using Gemini."""
     if not GOOGLE_API_KEY:
@@ -314,7 +852,7 @@ def _generate_podcast_script(prompt):
             "top_k": 40,
         }
         
-        model = genai.GenerativeModel(
+        model = clients.genai().GenerativeModel(
             model_name="gemini-2.5-flash",
             generation_config=generation_config
         )
@@ -330,6 +868,7 @@ def _generate_podcast_script(prompt):
         
         return script
     except Exception as e:
+        metrics.mark_error()
         logger.exception(f"Error generating podcast script: {str(e)}")
         return None
 
@@ -386,7 +925,7 @@ def _generate_audio_from_script(script, output_file):
     """Generate audio from script using Google Cloud TTS."""
     try:
         # Import our custom TTS service
-        from tts_service import generate_tts
+        from services.tts_service import generate_tts
         
         # Generate audio using Google Cloud TTS
         audio_path = generate_tts(script, output_file)
@@ -0,0 +1,206 @@
+"""
+Lightweight latency instrumentation for the pipeline stages.
+
+Wrap a function with ``@timed("stage")`` or a block with ``with timer("stage"):``
+and every call is recorded into a fixed-bucket histogram; ``render()``
+produces the Prometheus text format served at ``/metrics``.
+
+A timed function that catches its own failure and returns a fallback calls
+``mark_error()`` in its except branch, so the call still counts as an error.
+
+Set ``METRICS_ENABLED=0`` to turn it off: ``timed`` then returns the function
+unchanged and ``timer`` hands back a shared no-op context manager.
+"""
+
+import os
+import time
+import bisect
+import threading
+import functools
+from contextlib import nullcontext
+
+ENABLED = os.getenv("METRICS_ENABLED", "1").strip().lower() not in ("0", "false", "no", "")
+
+# seconds; spans quick DB writes up to long LLM / TTS calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_METRIC = "pipeline_stage_duration_seconds"
+REQUEST_METRIC = "http_request_duration_seconds"
+
+_NOOP = nullcontext()
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "errors", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        idx = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[idx] += 1
+            self.total += seconds
+            self.count += 1
+            if error:
+                self.errors += 1
+
+class _Capture(threading.local):
+    active = False
+
+_capturing = _Capture()
+
+class _CallState(threading.local):
+    error = False
+
+_call_state = _CallState()
+
+def mark_error():
+    """Count the innermost running ``timed`` call or ``timer`` block as an error even if it returns normally."""
+    _call_state.error = True
+
+_registry = {}
+_registry_lock = threading.Lock()
+_drained = []       # raw observations kept for call_and_drain in worker processes
+
+def _histogram(metric, label, value):
+    key = (metric, label, value)
+    hist = _registry.get(key)
+    if hist is None:
+        with _registry_lock:
+            hist = _registry.setdefault(key, Histogram())
+    return hist
+
+def observe(stage, seconds, error=False, metric=STAGE_METRIC, label="stage"):
+    if not ENABLED:
+        return
+    _histogram(metric, label, stage).observe(seconds, error)
+    if _capturing.active:
+        _drained.append((metric, label, stage, seconds, error))
+
+class _Timer:
+    __slots__ = ("stage", "metric", "label", "start", "outer_error")
+
+    def __init__(self, stage, metric, label):
+        self.stage = stage
+        self.metric = metric
+        self.label = label
+
+    def __enter__(self):
+        self.outer_error, _call_state.error = _call_state.error, False
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        error = exc_type is not None or _call_state.error
+        _call_state.error = self.outer_error
+        observe(self.stage, time.perf_counter() - self.start, error, self.metric, self.label)
+        return False
+
+def timer(stage, metric=STAGE_METRIC, label="stage"):
+    """Context manager timing one pipeline stage."""
+    if not ENABLED:
+        return _NOOP
+    return _Timer(stage, metric, label)
+
+def timed(stage):
+    """Decorator timing every call of the wrapped function as ``stage``."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            outer_error, _call_state.error = _call_state.error, False
+            start = time.perf_counter()
+            error = True
+            try:
+                result = fn(*args, **kwargs)
+                error = _call_state.error
+                return result
+            finally:
+                _call_state.error = outer_error
+                observe(stage, time.perf_counter() - start, error)
+        return wrapper
+    return decorate
+
+def call_and_drain(fn, *args):
+    """
+    Run ``fn`` (typically inside a pool worker process) and return
+    ``(result, observations)`` so the parent can ``merge`` the timings that
+    would otherwise stay in the worker's own registry.
+    """
+    _capturing.active = True
+    try:
+        result = fn(*args)
+        observations = list(_drained)
+        return result, observations
+    finally:
+        _capturing.active = False
+        _drained.clear()
+
+def merge(observations):
+    for metric, label, value, seconds, error in observations:
+        _histogram(metric, label, value).observe(seconds, error)
+
+def _fmt(v):
+    return repr(float(v)) if v != float("inf") else "+Inf"
+
+def export():
+    """
+    The registry as JSON-friendly rows ``[metric, label, value, bucket counts,
+    sum, count, errors]``, so another process can ``combine`` and ``render`` them.
+    """
+    with _registry_lock:
+        items = sorted(_registry.items())
+    rows = []
+    for (metric, label, value), hist in items:
+        with hist.lock:
+            rows.append([metric, label, value, list(hist.counts), hist.total, hist.count, hist.errors])
+    return rows
+
+def combine(exports):
+    """Sum several ``export()`` results (one per process) into one."""
+    merged = {}
+    for rows in exports:
+        for metric, label, value, counts, total, count, errors in rows:
+            row = merged.setdefault((metric, label, value), [metric, label, value, [0] * len(counts), 0.0, 0, 0])
+            row[3] = [a + b for a, b in zip(row[3], counts)]
+            row[4] += total
+            row[5] += count
+            row[6] += errors
+    return [merged[key] for key in sorted(merged)]
+
+def render(rows=None):
+    """
+    All histograms (plus their error counters) in Prometheus text exposition
+    format: this process's registry, or ``rows`` from ``export`` / ``combine``.
+    """
+    if rows is None:
+        rows = export()
+    lines = []
+    errors_by_metric = {}
+    for metric, label, value, counts, total, count, errors in rows:
+        if metric not in errors_by_metric:
+            errors_by_metric[metric] = []
+            lines.append(f"# HELP {metric} Latency by {label}.")
+            lines.append(f"# TYPE {metric} histogram")
+        tag = f'{label}="{value}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += n
+            lines.append(f'{metric}_bucket{{{tag},le="{_fmt(bound)}"}} {cumulative}')
+        lines.append(f"{metric}_sum{{{tag}}} {total}")
+        lines.append(f"{metric}_count{{{tag}}} {count}")
+        errors_by_metric[metric].append((tag, errors))
+
+    for metric, series in errors_by_metric.items():
+        name = metric.replace("_duration_seconds", "") + "_errors_total"
+        lines.append(f"# HELP {name} Calls that raised, by the same labels as {metric}.")
+        lines.append(f"# TYPE {name} counter")
+        for tag, errors in series:
+            lines.append(f"{name}{{{tag}}} {errors}")
+    return "\n".join(lines) + "\n"
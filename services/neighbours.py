@@ -0,0 +1,223 @@
+"""
+Cross-document neighbour graph, maintained at ingest time.
+
+Once a file's ingest has embedded all of its chunks (the embedding batch
+that moves its ``ingest_progress`` record to "ready" schedules it; chunks
+that failed to embed are left out), ``update_file`` streams the
+embeddings of all other files in blocks of ``NEIGHBOUR_BLOCK_ROWS`` and,
+for each block, computes one matrix product against the new file's chunks:
+
+  - the new chunks' top-k neighbours are merged with the block's best
+  - each block chunk's stored top-k list is merged with its best matches
+    among the new chunks, and written back only if it changed
+
+so adding a file costs O(new chunks x stored chunks), never a full all-pairs
+recompute. Scores are cosine similarities. Lists are kept in
+``chunk_neighbours`` (one row per chunk, ids and scores as arrays) and served
+by an indexed lookup (``GET /api/chunks/{id}/related``).
+
+Neighbours that were deleted by a re-ingest are dropped from the lists the
+next time they are touched (each block checks its stored neighbour ids
+against ``chunks``); the slot is refilled only if a later file
+supplies a better match. ``python -m services.neighbours --rebuild``
+recomputes the graph for every file.
+
+Updates run on a single background thread so that two files never merge
+into the same stored lists concurrently.
+"""
+
+import os
+import queue
+import logging
+import threading
+
+from services import metrics
+from services.methods import get_db_conn, get_dict_cursor
+
+# ---- Configuration ----
+NEIGHBOUR_K = int(os.getenv("NEIGHBOUR_K", "10"))
+NEIGHBOUR_BLOCK_ROWS = int(os.getenv("NEIGHBOUR_BLOCK_ROWS", "4096"))
+
+logger = logging.getLogger("neighbours")
+
+_queue = queue.Queue()
+_scheduled = set()
+_lock = threading.Lock()
+_worker = None
+
+def _normalise(matrix):
+    import numpy as np
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def merge_top_k(ids, scores, cand_ids, cand_scores, k):
+    """
+    Row-wise top ``k`` of the union of two candidate sets, best first.
+    ids/scores: (n, a) with -1 / -inf padding; cand_ids: (n, b) or (b,) shared by all rows.
+    """
+    import numpy as np
+
+    if cand_ids.ndim == 1:
+        cand_ids = np.broadcast_to(cand_ids, cand_scores.shape)
+    all_ids = np.concatenate([ids, cand_ids], axis=1)
+    all_scores = np.concatenate([scores, cand_scores], axis=1)
+    width = min(k, all_scores.shape[1])
+    top = np.argpartition(-all_scores, width - 1, axis=1)[:, :width]
+    top_scores = np.take_along_axis(all_scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(all_ids, top, axis=1), np.take_along_axis(all_scores, top, axis=1)
+
+def _padded(lists, k):
+    """Stored (neighbour_ids, scores) lists as (n, k) arrays padded with -1 / -inf."""
+    import numpy as np
+
+    ids = np.full((len(lists), k), -1, dtype=np.int64)
+    scores = np.full((len(lists), k), -np.inf, dtype=np.float32)
+    for i, (nids, nscores) in enumerate(lists):
+        n = min(k, len(nids))
+        ids[i, :n] = nids[:n]
+        scores[i, :n] = nscores[:n]
+    return ids, scores
+
+def _lists(ids, scores):
+    """Unpadded python lists of one merged row."""
+    keep = ids >= 0
+    return [int(i) for i in ids[keep]], [float(s) for s in scores[keep]]
+
+def _write(cur, rows):
+    from psycopg2.extras import execute_values
+
+    if rows:
+        execute_values(
+            cur,
+            "INSERT INTO chunk_neighbours (chunk_id, neighbour_ids, scores) VALUES %s "
+            "ON CONFLICT (chunk_id) DO UPDATE SET neighbour_ids = EXCLUDED.neighbour_ids, "
+            "scores = EXCLUDED.scores, updated_at = now()",
+            rows,
+            template="(%s, %s::bigint[], %s::real[])",
+        )
+
+def _live_ids(cur, ids):
+    """Those of ``ids`` (padded with -1) that are still embedded chunks."""
+    import numpy as np
+
+    wanted = np.unique(ids[ids >= 0])
+    if not len(wanted):
+        return wanted
+    cur.execute("SELECT id FROM chunks WHERE id = ANY(%s) AND embedding IS NOT NULL", (wanted.tolist(),))
+    return np.fromiter((r[0] for r in cur.fetchall()), dtype=np.int64)
+
+@metrics.timed("neighbour_graph")
+def update_file(file_id, k=NEIGHBOUR_K, block_rows=NEIGHBOUR_BLOCK_ROWS):
+    """Insert one file's chunks into the graph. Returns the number of adjacency rows written."""
+    import numpy as np
+
+    conn = None
+    try:
+        conn = get_db_conn()
+        cur = get_dict_cursor(conn)
+        cur.execute("SELECT id, embedding FROM chunks WHERE file_id = %s AND embedding IS NOT NULL ORDER BY id",
+                    (file_id,))
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        new_ids = np.asarray([r["id"] for r in rows], dtype=np.int64)
+        new = _normalise(np.asarray([r["embedding"] for r in rows], dtype=np.float32))
+        rows = None
+
+        best_ids = np.full((len(new_ids), 0), -1, dtype=np.int64)
+        best_scores = np.full((len(new_ids), 0), -np.inf, dtype=np.float32)
+        written = 0
+
+        blocks = conn.cursor(name=f"neighbours_{file_id}")
+        blocks.itersize = block_rows
+        blocks.execute(
+            "SELECT c.id, c.embedding, g.neighbour_ids, g.scores FROM chunks c "
+            "LEFT JOIN chunk_neighbours g ON g.chunk_id = c.id "
+            "WHERE c.file_id <> %s AND c.embedding IS NOT NULL ORDER BY c.id",
+            (file_id,)
+        )
+        write_cur = conn.cursor()
+        while True:
+            block = blocks.fetchmany(block_rows)
+            if not block:
+                break
+            block_ids = np.asarray([b[0] for b in block], dtype=np.int64)
+            sims = new @ _normalise(np.asarray([b[1] for b in block], dtype=np.float32)).T   # (new, block)
+
+            best_ids, best_scores = merge_top_k(best_ids, best_scores, block_ids, sims, k)
+
+            stored_ids, stored_scores = _padded([(b[2] or [], b[3] or []) for b in block], k)
+            # deleted neighbours, and this file's chunks from an earlier update (re-scored below)
+            live = _live_ids(write_cur, stored_ids)
+            drop = (stored_ids >= 0) & (~np.isin(stored_ids, live) | np.isin(stored_ids, new_ids))
+            old_ids, old_scores = stored_ids.copy(), stored_scores.copy()
+            old_ids[drop], old_scores[drop] = -1, -np.inf
+            merged_ids, merged_scores = merge_top_k(old_ids, old_scores, new_ids, sims.T, k)
+            changed = np.flatnonzero((merged_ids != stored_ids).any(axis=1)
+                                     | ~np.isclose(merged_scores, stored_scores).all(axis=1))
+            updates = [(int(block_ids[i]), *_lists(merged_ids[i], merged_scores[i])) for i in changed]
+            _write(write_cur, updates)
+            written += len(updates)
+        blocks.close()
+
+        _write(write_cur, [(int(cid), *_lists(best_ids[i], best_scores[i])) for i, cid in enumerate(new_ids)])
+        written += len(new_ids)
+        conn.commit()
+        logger.info("neighbours: file %s added (%d chunks, %d adjacency rows written)", file_id, len(new_ids), written)
+        return written
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def _run():
+    while True:
+        file_id = _queue.get()
+        with _lock:
+            _scheduled.discard(file_id)
+        try:
+            update_file(file_id)
+        except Exception as e:
+            logger.exception("neighbours: update failed for file %s: %s", file_id, e)
+
+def schedule(file_id):
+    """Queue a file for a graph update; a file already waiting is not queued twice."""
+    global _worker
+    with _lock:
+        if file_id in _scheduled:
+            return
+        _scheduled.add(file_id)
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="neighbours", daemon=True)
+            _worker.start()
+    _queue.put(file_id)
+
+def rebuild():
+    """Recompute the whole graph, one file at a time."""
+    conn = get_db_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM chunk_neighbours")
+        cur.execute("SELECT DISTINCT file_id FROM chunks WHERE embedding IS NOT NULL ORDER BY file_id")
+        file_ids = [r[0] for r in cur.fetchall()]
+        conn.commit()
+    finally:
+        conn.close()
+    for file_id in file_ids:
+        update_file(file_id)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the cross-document neighbour graph.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the graph for every file")
+    parser.add_argument("--file", type=int, action="append", default=[], help="add one file to the graph")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild()
+    for fid in args.file:
+        update_file(fid)
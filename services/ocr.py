@@ -0,0 +1,246 @@
+"""
+OCR for pages without a text layer.
+
+Extraction renders text-less pages to greyscale PNGs (``OCR_DPI``); they are
+queued here and recognised on a dedicated process pool of ``OCR_PROCESSES``
+workers, separate from the extraction pool, so scanned documents cannot
+starve normal text ingest. At most ``OCR_MAX_INFLIGHT`` pages are handed to
+the pool at a time; the rest wait in a queue ordered by page number (then
+document priority), so the first pages of every queued document become
+searchable before the deep pages of any of them. Queued page images are
+spooled to disk (``OCR_SPOOL_DIR``, a temporary directory by default) rather
+than held in memory, so a backlog of scanned documents costs disk, not RAM.
+
+Recognised text is cached on disk under ``OCR_CACHE_DIR``, keyed by the hash
+of the page image together with engine and language, so re-ingesting a
+document (or an identical page in another one) skips the engine.
+
+Engines (``OCR_ENGINE``):
+  - ``tesseract`` (default): PyMuPDF's Tesseract integration; needs the
+    tesseract binary and language data installed
+  - ``package.module:function``: any callable taking (png_bytes, language)
+    and returning text
+
+``OCR_MODE=off`` disables the fallback: text-less pages are then skipped as
+before.
+"""
+
+import os
+import heapq
+import hashlib
+import logging
+import tempfile
+import importlib
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from services import ingest_progress, metrics
+from services.chunker import chunk_page_by_paragraphs
+
+# ---- Configuration ----
+OCR_MODE = os.getenv("OCR_MODE", "auto").strip().lower()
+OCR_ENGINE = os.getenv("OCR_ENGINE", "tesseract").strip()
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", "1"))
+OCR_MAX_INFLIGHT = int(os.getenv("OCR_MAX_INFLIGHT", str(2 * OCR_PROCESSES)))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(os.getcwd(), "data", "ocr_cache"))
+OCR_SPOOL_DIR = os.getenv("OCR_SPOOL_DIR", "")
+
+logger = logging.getLogger("ocr")
+
+_available = None
+
+def enabled():
+    """Whether text-less pages should be rendered and recognised."""
+    global _available
+    if OCR_MODE == "off":
+        return False
+    if _available is None:
+        try:
+            if OCR_ENGINE == "tesseract":
+                import fitz
+                fitz.get_tessdata()
+            else:
+                _load_engine(OCR_ENGINE)
+            _available = True
+        except Exception as e:
+            logger.warning("OCR disabled, engine %r unavailable: %s", OCR_ENGINE, e)
+            _available = False
+    return _available
+
+def render_dpi():
+    """DPI to render text-less pages at during extraction, or None when OCR is off."""
+    return OCR_DPI if enabled() else None
+
+def _load_engine(engine):
+    module_name, _, func = engine.partition(":")
+    return getattr(importlib.import_module(module_name), func)
+
+def recognize(png_bytes, engine=OCR_ENGINE, language=OCR_LANGUAGE):
+    """Text of one page image. Runs inside an OCR worker process."""
+    if engine != "tesseract":
+        return _load_engine(engine)(png_bytes, language)
+    import fitz
+
+    pix = fitz.Pixmap(png_bytes)
+    ocr_doc = fitz.open("pdf", pix.pdfocr_tobytes(language=language))
+    try:
+        return ocr_doc[0].get_text()
+    finally:
+        ocr_doc.close()
+
+# ---- cache ----
+
+def image_key(png_bytes):
+    h = hashlib.sha256(f"{OCR_ENGINE}\n{OCR_LANGUAGE}\n".encode("utf-8"))
+    h.update(png_bytes)
+    return h.hexdigest()
+
+def _cache_path(key):
+    return os.path.join(OCR_CACHE_DIR, key[:2], key + ".txt")
+
+def cache_get(key):
+    try:
+        with open(_cache_path(key), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def cache_put(key, text):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# ---- scheduler ----
+
+class OCRScheduler:
+    """
+    Priority queue of spooled page images in front of a bounded process pool.
+    Each recognised page is chunked, stored and queued for embedding on its own.
+    """
+
+    def __init__(self, processes=OCR_PROCESSES, max_inflight=OCR_MAX_INFLIGHT, spool_dir=OCR_SPOOL_DIR):
+        self.processes = processes
+        self.max_inflight = max(1, max_inflight)
+        self.spool_dir = spool_dir
+        self._heap = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._pool = None
+        self._thread = None
+
+    def submit(self, file_id, pages, priority=0, generation=None):
+        """Queue (page_number, png_bytes) pairs of one file, reported under the ingest ``generation``."""
+        with self._cond:
+            self._ensure_started()
+        spooled = [(page_number, self._spool(png)) for page_number, png in pages]
+        with self._cond:
+            for page_number, path in spooled:
+                heapq.heappush(self._heap, (page_number, priority, next(self._seq), file_id, generation, path))
+            self._cond.notify_all()
+
+    def _spool(self, png):
+        fd, path = tempfile.mkstemp(suffix=".png", dir=self.spool_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(png)
+        return path
+
+    @staticmethod
+    def _unspool(path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.unlink(path)
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap) + self._inflight
+
+    def _ensure_started(self):
+        if self._thread is None:
+            if not self.spool_dir:
+                self.spool_dir = tempfile.mkdtemp(prefix="ocr-spool-")
+            else:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            # spawn: forking a process that already runs request and embedding threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context("spawn"))
+            self._thread = threading.Thread(target=self._dispatch, name="ocr-dispatch", daemon=True)
+            self._thread.start()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._inflight >= self.max_inflight:
+                    self._cond.wait()
+                page_number, priority, _, file_id, generation, path = heapq.heappop(self._heap)
+                self._inflight += 1
+            try:
+                png = self._unspool(path)
+            except OSError as e:
+                logger.warning("OCR: spooled image of file %s page %s unreadable: %s", file_id, page_number, e)
+                self._finish(file_id, generation, page_number, priority, None)
+                continue
+            key = image_key(png)
+            text = cache_get(key)
+            if text is not None:
+                self._finish(file_id, generation, page_number, priority, text, cached=True)
+                continue
+            fut = self._pool.submit(metrics.call_and_drain, recognize, png, OCR_ENGINE, OCR_LANGUAGE)
+            fut.add_done_callback(lambda f, a=(file_id, generation, page_number, priority, key): self._on_done(f, *a))
+
+    def _on_done(self, fut, file_id, generation, page_number, priority, key):
+        try:
+            text, timings = fut.result()
+            metrics.merge(timings)
+            cache_put(key, text or "")
+        except Exception as e:
+            logger.warning("OCR failed for file %s page %s: %s", file_id, page_number, e)
+            text = None
+        self._finish(file_id, generation, page_number, priority, text)
+
+    def _report(self, file_id, generation, **counts):
+        # a last OCR page with nothing new to embed completes the file here, not in the batcher
+        if ingest_progress.increment(file_id, generation=generation, **counts):
+            from services import neighbours
+            neighbours.schedule(file_id)
+
+    def _finish(self, file_id, generation, page_number, priority, text, cached=False):
+        from services import methods
+
+        try:
+            if generation is not None and ingest_progress.generation(file_id) != generation:
+                # a newer ingest of the file superseded this page; its chunks would overwrite the new ones
+                logger.info("OCR: dropping stale result for page %s of file %s", page_number, file_id)
+                return
+            if text is None:
+                self._report(file_id, generation, ocr_failures=1)
+                return
+            texts = [ch["text"] for ch in chunk_page_by_paragraphs(text)] if text.strip() else []
+            # always reconcile, so a page that is blank after a rescan loses its old chunks
+            chunk_ids, diff = methods.store_page_chunks(file_id, page_number, texts)
+            if diff["added"] or diff["removed"]:
+                from services import prefetch, search
+                prefetch.invalidate_file(file_id)
+                search.invalidate_file(file_id)
+            self._report(file_id, generation, ocr_pages_done=1, ocr_cache_hits=int(cached),
+                         chunks_inserted=diff["added"], chunks_unchanged=diff["unchanged"],
+                         chunks_removed=diff["removed"], chunks_to_embed=len(chunk_ids))
+            methods.EMBED_BATCHER.submit(chunk_ids, priority=priority, file_id=file_id, generation=generation)
+        except Exception as e:
+            logger.exception("OCR: storing page %s of file %s failed: %s", page_number, file_id, e)
+            self._report(file_id, generation, ocr_failures=1)
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._cond.notify_all()
+
+OCR_SCHEDULER = OCRScheduler()
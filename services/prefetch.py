@@ -0,0 +1,330 @@
+"""
+Speculative prefetch of related sections for the page being read.
+
+``POST /prefetch`` with a file_id and page_number queues a background job
+that takes the stored embeddings of that page's chunks, finds their nearest
+chunks in other files (``PREFETCH_NEIGHBOURS`` per chunk, one SQL round
+trip) and caches the union as a candidate set. A later ``/insights`` call
+for the same page that carries the selection's embedding only re-ranks that
+warm set with a NumPy dot product instead of searching again.
+
+Prefetching never competes with interactive work: the worker waits until no
+interactive request (a view decorated with ``@prefetch.interactive``) is in
+flight before each job, jobs run newest first and only the newest
+``PREFETCH_MAX_QUEUE`` are kept, and the cache is LRU-evicted to stay
+within ``PREFETCH_MEMORY_BYTES``.
+
+In multi-process serving (``services.serve``) only the background process
+computes candidate sets. It writes each one to a shared directory (the
+matrix as ``.npy``, the chunks as JSON), and every worker memory-maps the
+matrix on a hit, so a set is held in memory once. The budget is then
+enforced oldest-first. The worker also yields to interactive requests
+in flight in the other processes.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from services import metrics
+from services.methods import get_db_conn, get_dict_cursor
+
+# ---- Configuration ----
+PREFETCH_NEIGHBOURS = int(os.getenv("PREFETCH_NEIGHBOURS", "10"))
+PREFETCH_CANDIDATES = int(os.getenv("PREFETCH_CANDIDATES", "60"))
+PREFETCH_MERGE_K = int(os.getenv("PREFETCH_MERGE_K", "10"))
+PREFETCH_MEMORY_BYTES = int(os.getenv("PREFETCH_MEMORY_BYTES", str(64 * 1024 * 1024)))
+PREFETCH_TTL_S = float(os.getenv("PREFETCH_TTL_S", "900"))
+PREFETCH_MAX_QUEUE = int(os.getenv("PREFETCH_MAX_QUEUE", "32"))
+
+logger = logging.getLogger("prefetch")
+
+_lock = threading.Condition()
+_cache = OrderedDict()      # (file_id, page_number) -> entry
+_cache_bytes = 0
+_queue = OrderedDict()      # (file_id, page_number) -> queued_at, oldest first
+_interactive = 0
+_worker = None
+_stats = {"hits": 0, "misses": 0, "computed": 0, "dropped": 0, "evicted": 0}
+_shared_dir = None          # set by use_shared_store; _cache then only holds metadata
+_busy_elsewhere = None
+
+_NEIGHBOURS_SQL = """
+SELECT DISTINCT ON (n.id) n.id, n.file_id, n.page_number, n.summary, n.text, n.sentence_offsets,
+       n.embedding, n.distance
+FROM chunks q
+CROSS JOIN LATERAL (
+  SELECT c.id, c.file_id, c.page_number, COALESCE(c.summary, '') AS summary, c.text, c.sentence_offsets, c.embedding,
+         c.embedding <-> q.embedding AS distance
+  FROM chunks c
+  WHERE c.embedding IS NOT NULL AND c.file_id <> q.file_id
+  ORDER BY c.embedding <-> q.embedding
+  LIMIT %s
+) n
+WHERE q.file_id = %s AND q.page_number = %s AND q.embedding IS NOT NULL
+ORDER BY n.id, n.distance
+"""
+
+# ---- interactive gate ----
+
+def interactive(view):
+    """Mark a Flask view as interactive: prefetch jobs wait while one is in flight."""
+    view.prefetch_interactive = True
+    return view
+
+def is_interactive_request():
+    """Whether the current request is served by a view marked with ``interactive``."""
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, "prefetch_interactive", False)
+
+def _begin_request():
+    global _interactive
+    if is_interactive_request():
+        with _lock:
+            _interactive += 1
+        request.environ["prefetch.interactive"] = True
+
+def _end_request(exc=None):
+    global _interactive
+    if request.environ.pop("prefetch.interactive", False):
+        with _lock:
+            _interactive -= 1
+            _lock.notify_all()
+
+def init_app(app):
+    """Track in-flight interactive requests so prefetch work can yield to them."""
+    app.before_request(_begin_request)
+    app.teardown_request(_end_request)
+
+def use_shared_store(directory, busy_elsewhere=None):
+    """
+    Keep candidate sets in ``directory``, shared by all serving processes.
+    ``busy_elsewhere()`` reports whether another process is serving an
+    interactive request; the worker waits for those as well.
+    """
+    global _shared_dir, _busy_elsewhere
+    os.makedirs(directory, exist_ok=True)
+    with _lock:
+        _shared_dir = directory
+        _busy_elsewhere = busy_elsewhere
+
+def _shared_meta_path(key):
+    return os.path.join(_shared_dir, f"{key[0]}_{key[1]}.json")
+
+def _write_shared(key, entry):
+    """Write a candidate set; returns the metadata kept in place of it."""
+    import numpy as np
+
+    # a fresh matrix file per version: readers holding a mapping of the old one are unaffected
+    matrix_path = os.path.join(_shared_dir, f"{key[0]}_{key[1]}.{time.time_ns()}.npy")
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, entry["matrix"])
+    os.replace(matrix_path + ".tmp", matrix_path)
+    meta = {"chunks": entry["chunks"], "created_at": entry["created_at"], "bytes": entry["bytes"],
+            "matrix": os.path.basename(matrix_path)}
+    tmp = f"{_shared_meta_path(key)}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _shared_meta_path(key))
+    return {"bytes": entry["bytes"], "created_at": entry["created_at"], "matrix": matrix_path}
+
+def _remove_shared(key, meta, replaced=False):
+    # a replaced set's metadata file already describes the new version
+    for path in (meta["matrix"],) if replaced else (meta["matrix"], _shared_meta_path(key)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _read_shared(key):
+    import numpy as np
+
+    try:
+        with open(_shared_meta_path(key), encoding="utf-8") as f:
+            meta = json.load(f)
+        if time.time() - meta["created_at"] > PREFETCH_TTL_S:
+            return None
+        matrix = np.load(os.path.join(_shared_dir, meta["matrix"]), mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        # not prefetched, or replaced between reading the metadata and mapping the matrix
+        return None
+    return {"chunks": meta["chunks"], "matrix": matrix, "created_at": meta["created_at"], "bytes": meta["bytes"]}
+
+# ---- cache ----
+
+def _entry_bytes(entry):
+    return entry["matrix"].nbytes + sum(len(c["text"]) + len(c["summary"]) + 8 * len(c["sentence_offsets"] or ()) + 64
+                                        for c in entry["chunks"])
+
+def _store(key, entry):
+    global _cache_bytes
+    written = _shared_dir is not None and entry["bytes"] <= PREFETCH_MEMORY_BYTES
+    if written:
+        entry = _write_shared(key, entry)
+    with _lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= old["bytes"]
+            if _shared_dir is not None:
+                _remove_shared(key, old, replaced=written)
+        if entry["bytes"] > PREFETCH_MEMORY_BYTES:
+            _stats["dropped"] += 1
+            return
+        _cache[key] = entry
+        _cache_bytes += entry["bytes"]
+        while _cache_bytes > PREFETCH_MEMORY_BYTES:
+            evicted_key, evicted = _cache.popitem(last=False)
+            _cache_bytes -= evicted["bytes"]
+            _stats["evicted"] += 1
+            if _shared_dir is not None:
+                _remove_shared(evicted_key, evicted)
+
+def candidates_for(file_id, page_number):
+    """The cached candidate set for a page, or None if it is not (or no longer) warm."""
+    global _cache_bytes
+    key = (file_id, page_number)
+    if _shared_dir is not None:
+        entry = _read_shared(key)
+        with _lock:
+            _stats["hits" if entry is not None else "misses"] += 1
+        return entry
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and time.time() - entry["created_at"] > PREFETCH_TTL_S:
+            _cache.pop(key)
+            _cache_bytes -= entry["bytes"]
+            entry = None
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _cache.move_to_end(key)
+        _stats["hits"] += 1
+        return entry
+
+def invalidate_file(file_id):
+    """Drop the cached pages of a file whose chunks were just re-ingested."""
+    global _cache_bytes
+    with _lock:
+        for key in [k for k in _cache if k[0] == file_id]:
+            entry = _cache.pop(key)
+            _cache_bytes -= entry["bytes"]
+            if _shared_dir is not None:
+                _remove_shared(key, entry)
+
+def rerank(entry, embedding, k=PREFETCH_MERGE_K):
+    """Top ``k`` candidates by cosine similarity to ``embedding``, as chunk dicts with a ``distance``."""
+    import numpy as np
+
+    if not entry["chunks"]:
+        return []
+    q = np.asarray(embedding, dtype=np.float32)
+    q /= (np.linalg.norm(q) or 1.0)
+    scores = entry["matrix"] @ q
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [{**entry["chunks"][i], "distance": round(float(1.0 - scores[i]), 6)} for i in top]
+
+# ---- background worker ----
+
+@metrics.timed("prefetch_candidates")
+def compute_candidates(file_id, page_number):
+    """Nearest chunks in other files to the chunks of one page, best first, with normalised embeddings."""
+    import numpy as np
+
+    conn = None
+    try:
+        conn = get_db_conn()
+        cur = get_dict_cursor(conn)
+        cur.execute(_NEIGHBOURS_SQL, (PREFETCH_NEIGHBOURS, file_id, page_number))
+        rows = sorted(cur.fetchall(), key=lambda r: r["distance"])[:PREFETCH_CANDIDATES]
+    finally:
+        if conn:
+            conn.close()
+
+    chunks = [{"id": r["id"], "file_id": r["file_id"], "page_number": r["page_number"],
+               "summary": r["summary"], "text": r["text"], "sentence_offsets": r["sentence_offsets"]} for r in rows]
+    matrix = np.asarray([np.asarray(r["embedding"], dtype=np.float32) for r in rows], dtype=np.float32)
+    if len(rows):
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    entry = {"chunks": chunks, "matrix": matrix, "created_at": time.time()}
+    entry["bytes"] = _entry_bytes(entry)
+    return entry
+
+def _next_job():
+    with _lock:
+        while not _queue or _interactive or (_busy_elsewhere is not None and _busy_elsewhere()):
+            _lock.wait(timeout=1.0 if _busy_elsewhere is None else 0.05)
+        # newest first: the page being read now matters more than ones already left
+        key, _ = _queue.popitem(last=True)
+        return key
+
+def _run():
+    while True:
+        key = _next_job()
+        try:
+            _store(key, compute_candidates(*key))
+            with _lock:
+                _stats["computed"] += 1
+        except Exception as e:
+            logger.warning("prefetch failed for file %s page %s: %s", key[0], key[1], e)
+
+def request_prefetch(file_id, page_number):
+    """Queue a page for prefetching. Returns "cached", "queued" or "already_queued"."""
+    global _worker
+    key = (file_id, page_number)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and time.time() - entry["created_at"] <= PREFETCH_TTL_S:
+            return "cached"
+        if key in _queue:
+            return "already_queued"
+        _queue[key] = time.time()
+        # the reader has moved on from the oldest requests
+        while len(_queue) > PREFETCH_MAX_QUEUE:
+            _queue.popitem(last=False)
+            _stats["dropped"] += 1
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="prefetch", daemon=True)
+            _worker.start()
+        _lock.notify_all()
+    return "queued"
+
+def stats():
+    with _lock:
+        return {**_stats, "cached_pages": len(_cache), "cache_bytes": _cache_bytes,
+                "budget_bytes": PREFETCH_MEMORY_BYTES, "queued": len(_queue), "interactive": _interactive,
+                "shared_dir": _shared_dir}
+
+def parse_page_key(file_id, page_number):
+    """
+    Validate a (file_id, page_number) pair from a request body. Either may be
+    None; anything else must convert to an int. Returns the pair as ints,
+    raises ValueError otherwise.
+    """
+    try:
+        return (int(file_id) if file_id is not None else None,
+                int(page_number) if page_number is not None else None)
+    except (TypeError, ValueError):
+        raise ValueError("'file_id' and 'page_number' must be integers") from None
+
+def handle_prefetch_request(payload):
+    """
+    payload: { "file_id": int, "page_number": int }
+    returns: (status_code:int, body:dict)
+    """
+    try:
+        file_id, page_number = parse_page_key(payload.get("file_id"), payload.get("page_number"))
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    if not file_id or page_number is None:
+        return 400, {"error": "file_id and page_number are required"}
+    status = request_prefetch(file_id, page_number)
+    return (200 if status == "cached" else 202), {"status": status, "file_id": file_id, "page_number": page_number}
@@ -0,0 +1,193 @@
+"""
+Opt-in per-request profiling for the Flask app.
+
+A request is profiled when it carries the ``X-Profile: 1`` header, or at
+random with probability ``PROFILE_SAMPLE_RATE``. Two modes are available:
+
+  - ``sample`` (default): a background thread samples the request thread's
+    stack every ``PROFILE_INTERVAL_MS`` and writes collapsed stacks
+    (``.folded``), ready for flamegraph.pl or speedscope
+  - ``cprofile``: deterministic cProfile of the request thread, written as a
+    pstats ``.prof`` file (``snakeviz`` / ``flameprof`` can render it)
+
+Header-triggered profiles are always kept. Randomly sampled ones are kept
+only when the request took at least ``PROFILE_SLOW_MS``. The profile
+directory is pruned to ``PROFILE_RETENTION`` files and ``PROFILE_MAX_BYTES``.
+Work handed off to background threads (embedding, batch extraction) is not
+part of the request's profile.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+import cProfile
+from collections import Counter
+from flask import g, request
+
+# ---- Configuration ----
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample").strip().lower()
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.getcwd(), "data", "profiles"))
+PROFILE_RETENTION = int(os.getenv("PROFILE_RETENTION", "50"))
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+logger = logging.getLogger("profiler")
+
+_prune_lock = threading.Lock()
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval_s):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def _should_profile():
+    if request.headers.get(PROFILE_HEADER, "").strip().lower() in ("1", "true", "yes"):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+def _start_profile():
+    trigger = _should_profile()
+    if trigger is None:
+        return
+    if PROFILE_MODE == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+    else:
+        profile = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0).start()
+    g.profile = (trigger, profile, time.perf_counter())
+
+def _finish_profile(exc=None):
+    active = g.pop("profile", None)
+    if active is None:
+        return
+    trigger, profile, started = active
+    if isinstance(profile, cProfile.Profile):
+        profile.disable()
+    else:
+        profile.stop()
+    duration_ms = (time.perf_counter() - started) * 1000.0
+    if trigger == "sampled" and duration_ms < PROFILE_SLOW_MS:
+        return
+    try:
+        _save(profile, trigger, duration_ms, exc)
+    except Exception:
+        logger.exception("profiler: failed to save profile for %s", request.path)
+
+def _save(profile, trigger, duration_ms, exc):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.url_rule.rule if request.url_rule else request.path).strip("/") or "root"
+    slug = "".join(c if c.isalnum() else "_" for c in endpoint)
+    # the pid keeps names unique when several serving processes share PROFILE_DIR
+    name = (f"{time.strftime('%Y%m%dT%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{slug}-{int(duration_ms)}ms"
+            f"-{os.getpid()}")
+
+    if isinstance(profile, cProfile.Profile):
+        filename = name + ".prof"
+        profile.dump_stats(os.path.join(PROFILE_DIR, filename))
+        samples = None
+    else:
+        filename = name + ".folded"
+        with open(os.path.join(PROFILE_DIR, filename), "w") as f:
+            f.write(profile.folded())
+        samples = profile.samples
+
+    meta = {
+        "file": filename,
+        "pid": os.getpid(),
+        "method": request.method,
+        "path": request.path,
+        "endpoint": endpoint,
+        "trigger": trigger,
+        "duration_ms": round(duration_ms, 2),
+        "slow": duration_ms >= PROFILE_SLOW_MS,
+        "samples": samples,
+        "error": repr(exc) if exc else None,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(PROFILE_DIR, name + ".json"), "w") as f:
+        json.dump(meta, f)
+    logger.info("profiler: saved %s (%.0f ms, %s)", filename, duration_ms, trigger)
+    _prune()
+
+def _prune():
+    """Drop the oldest profiles until both the count and the byte budget are met."""
+    with _prune_lock:
+        entries = []
+        for meta in list_profiles():
+            path = os.path.join(PROFILE_DIR, meta["file"])
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            entries.append((meta, size))
+        total = sum(size for _, size in entries)
+        # list_profiles is newest first; delete from the end
+        while entries and (len(entries) > PROFILE_RETENTION or total > PROFILE_MAX_BYTES):
+            meta, size = entries.pop()
+            total -= size
+            stem = os.path.splitext(meta["file"])[0]
+            for path in (os.path.join(PROFILE_DIR, meta["file"]), os.path.join(PROFILE_DIR, stem + ".json")):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+def list_profiles(slow_only=False):
+    """Metadata of stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.listdir(PROFILE_DIR):
+        if not entry.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, entry)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if slow_only and not meta.get("slow"):
+            continue
+        profiles.append(meta)
+    profiles.sort(key=lambda m: m.get("created_at", 0), reverse=True)
+    return profiles
+
+def init_app(app):
+    """Register the before/teardown hooks; a no-op per request unless profiling is triggered."""
+    app.before_request(_start_profile)
+    app.teardown_request(_finish_profile)
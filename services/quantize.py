@@ -0,0 +1,151 @@
+"""
+Compact embedding storage.
+
+Chunks always keep their full-precision ``VECTOR(768)`` embedding, but the
+candidate scan can run over a much smaller representation produced at write
+time. Two independent knobs control that representation:
+
+  - dimensionality: Matryoshka-style truncation to the leading ``EMBED_COMPACT_DIM``
+    components, or a PCA projection when ``EMBED_PCA_PATH`` points at a basis
+    saved with ``save_pca``
+  - precision: ``float16``, ``int8`` (symmetric, one scale per vector) or
+    ``binary`` (sign bits, compared with Hamming distance)
+
+The full-precision vectors are only consulted to re-score the top candidates
+returned by the compact scan.
+"""
+
+import os
+import numpy as np
+
+# ---- Configuration ----
+EMBED_DIM = 768
+COMPACT_MODES = ("float16", "int8", "binary")
+COMPACT_MODE = os.getenv("EMBED_COMPACT_MODE", "").strip().lower()  # "" disables compact storage
+COMPACT_DIM = int(os.getenv("EMBED_COMPACT_DIM", str(EMBED_DIM)))
+PCA_PATH = os.getenv("EMBED_PCA_PATH", "")
+RESCORE_CANDIDATES = int(os.getenv("EMBED_RESCORE_CANDIDATES", "50"))
+
+_pca_cache = {}
+
+def fit_pca(matrix, dim):
+    """Fit a PCA basis on an (n, d) embedding matrix. Returns (mean, components)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    mean = matrix.mean(axis=0)
+    # rows of vt are the principal directions, already sorted by variance
+    _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+    return mean, vt[:dim].astype(np.float32)
+
+def save_pca(path, mean, components):
+    np.savez(path, mean=mean, components=components)
+
+def load_pca(path=PCA_PATH):
+    if not path:
+        return None
+    if path not in _pca_cache:
+        data = np.load(path)
+        _pca_cache[path] = (data["mean"].astype(np.float32), data["components"].astype(np.float32))
+    return _pca_cache[path]
+
+def reduce_dimensions(vectors, dim=COMPACT_DIM, pca=None):
+    """
+    Project (d,) or (n, d) vectors down to ``dim`` components and L2-normalise
+    them, so dot products on the result are cosine similarities.
+    """
+    x = np.asarray(vectors, dtype=np.float32)
+    if pca is not None:
+        mean, components = pca
+        x = (x - mean) @ components[:dim].T
+    else:
+        x = x[..., :dim]
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+def encode(vectors, mode):
+    """
+    Quantize already-reduced (n, d) vectors.
+    Returns (codes, scales): codes is an (n, code_bytes) uint8 array, scales an (n,) float32 array.
+    """
+    x = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if mode == "float16":
+        codes = x.astype(np.float16).view(np.uint8)
+        scales = np.ones(len(x), dtype=np.float32)
+    elif mode == "int8":
+        scales = np.abs(x).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(x / scales[:, None]).astype(np.int8).view(np.uint8)
+    elif mode == "binary":
+        codes = np.packbits(x > 0, axis=1)
+        scales = np.ones(len(x), dtype=np.float32)
+    else:
+        raise ValueError(f"unknown compact embedding mode: {mode!r}")
+    return np.ascontiguousarray(codes), scales.astype(np.float32)
+
+def decode(codes, scales, mode, dim):
+    """Inverse of ``encode`` for the float modes; binary codes decode to +-1 vectors."""
+    codes = np.atleast_2d(np.asarray(codes, dtype=np.uint8))
+    if mode == "float16":
+        return codes.view(np.float16).astype(np.float32)
+    if mode == "int8":
+        return codes.view(np.int8).astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+    if mode == "binary":
+        return np.unpackbits(codes, axis=1, count=dim).astype(np.float32) * 2.0 - 1.0
+    raise ValueError(f"unknown compact embedding mode: {mode!r}")
+
+def compact_embedding(embedding, mode=COMPACT_MODE, dim=COMPACT_DIM):
+    """
+    Build the compact representation stored next to a chunk's full embedding.
+    Returns (code_bytes, scale) or None when compact storage is disabled.
+    """
+    if not mode:
+        return None
+    reduced = reduce_dimensions(embedding, dim, load_pca())
+    codes, scales = encode(reduced[None, :], mode)
+    return codes[0].tobytes(), float(scales[0])
+
+def codes_from_rows(rows, mode=COMPACT_MODE, dim=COMPACT_DIM):
+    """Stack (bytes, scale) pairs read back from the database into encode()-shaped arrays."""
+    code_bytes = {"float16": dim * 2, "int8": dim, "binary": (dim + 7) // 8}[mode]
+    codes = np.frombuffer(b"".join(bytes(c) for c, _ in rows), dtype=np.uint8)
+    codes = codes.reshape(len(rows), code_bytes)
+    scales = np.array([s for _, s in rows], dtype=np.float32)
+    return codes, scales
+
+def compact_scores(query, codes, scales, mode):
+    """
+    Similarity of one reduced query vector against all compact codes (higher is better).
+    Binary codes are compared by negative Hamming distance on the packed bits.
+    """
+    if mode == "binary":
+        q_bits = np.packbits(np.asarray(query) > 0)
+        return -np.bitwise_count(np.bitwise_xor(codes, q_bits)).sum(axis=1, dtype=np.int32)
+    if mode == "int8":
+        # score in int8 space and rescale, avoids materialising the decoded matrix
+        raw = codes.view(np.int8).astype(np.float32) @ np.asarray(query, dtype=np.float32)
+        return raw * scales
+    return codes.view(np.float16).astype(np.float32) @ np.asarray(query, dtype=np.float32)
+
+def search(query, codes, scales, fetch_full, k=5, mode=COMPACT_MODE, dim=COMPACT_DIM,
+           rescore=RESCORE_CANDIDATES, pca=None):
+    """
+    Two-phase nearest-neighbour search.
+
+    The compact codes select the ``rescore`` best candidates, then
+    ``fetch_full(indices)`` supplies their full-precision vectors as an
+    (len(indices), EMBED_DIM) array and the final top-k is ranked by exact
+    cosine similarity. Returns (indices, scores) ordered best first.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    reduced = reduce_dimensions(query, dim, pca if pca is not None else load_pca())
+    scores = compact_scores(reduced, codes, scales, mode)
+    n = len(scores)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    m = min(max(rescore, k), n)
+    candidates = np.argpartition(-scores, m - 1)[:m]
+
+    full = np.asarray(fetch_full(candidates), dtype=np.float32)
+    full = full / np.maximum(np.linalg.norm(full, axis=1, keepdims=True), 1e-12)
+    exact = full @ (query / max(np.linalg.norm(query), 1e-12))
+    order = np.argsort(-exact)[:k]
+    return candidates[order], exact[order]
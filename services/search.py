@@ -0,0 +1,357 @@
+"""
+Nearest-chunk retrieval over the compact embedding codes.
+
+``search_chunks`` is what the Go insights and podcast handlers call (``POST
+/search``) to pick their candidate chunks. When ``EMBED_COMPACT_MODE`` is set
+and every embedded chunk in scope has its ``embedding_compact`` code, the
+scan runs over those codes via ``quantize.search`` and only the
+``EMBED_RESCORE_CANDIDATES`` best candidates have their full ``VECTOR(768)``
+read back for exact re-scoring. Otherwise (compact storage off, or chunks
+embedded before it was switched on) the exact pgvector scan is used.
+
+The codes of each file are cached under a version that the ingest path bumps
+through ``invalidate_file`` whenever the file's chunks are re-stored or new
+embeddings land, so a query only reads the version, never aggregates over
+``chunks``. In process the cache is evicted least recently used beyond
+``SEARCH_CACHE_BYTES``. In multi-process serving (``services.serve``) it
+lives in a shared directory instead: the code arrays are written once as
+``.npy`` files and memory-mapped by every worker, and each file's version is
+a small file the background process rewrites on invalidation.
+
+Chunks embedded before ``EMBED_COMPACT_MODE`` was set have no code. A file
+with any such chunk is searched exactly (and not cached) until its stored
+embeddings are encoded with
+
+    python -m services.search --backfill
+
+after which the compact scan picks it up without a restart. ``--all``
+re-encodes every chunk, e.g. after changing ``EMBED_COMPACT_MODE`` or
+``EMBED_COMPACT_DIM``.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from services import metrics
+from services.methods import get_db_conn
+
+# ---- Configuration ----
+SEARCH_K = 30
+SEARCH_MAX_K = 200
+SEARCH_CACHE_BYTES = int(os.getenv("SEARCH_CACHE_BYTES", str(256 * 1024 * 1024)))
+SEARCH_BACKFILL_BATCH = int(os.getenv("SEARCH_BACKFILL_BATCH", "1000"))
+
+logger = logging.getLogger("search")
+
+_cache = OrderedDict()  # file_id -> (key, ids, codes, scales)
+_cache_bytes = 0
+_versions = {}          # file_id -> invalidation count, when not sharing a directory
+_shared_dir = None
+_lock = threading.Lock()
+
+def use_shared_store(directory):
+    """Keep the code arrays in ``directory``, shared by all serving processes."""
+    global _shared_dir
+    os.makedirs(directory, exist_ok=True)
+    with _lock:
+        _shared_dir = directory
+
+def _version_path(file_id):
+    return os.path.join(_shared_dir, f"{file_id}.version")
+
+def _meta_path(file_id):
+    return os.path.join(_shared_dir, f"{file_id}.json")
+
+def _entry_bytes(entry):
+    return entry[1].nbytes + entry[2].nbytes + entry[3].nbytes
+
+def _key(file_id):
+    """Current cache key of a file: its invalidation version and the configured code format."""
+    from services import quantize
+
+    if _shared_dir is None:
+        with _lock:
+            version = _versions.get(file_id, 0)
+    else:
+        try:
+            with open(_version_path(file_id)) as f:
+                version = f.read()
+        except FileNotFoundError:
+            version = ""
+    return [version, quantize.COMPACT_MODE, quantize.COMPACT_DIM]
+
+def invalidate_file(file_id):
+    """Mark the cached codes of a file stale: its chunks were re-stored or new embeddings were written."""
+    global _cache_bytes
+    with _lock:
+        entry = _cache.pop(file_id, None)
+        if entry is not None and _shared_dir is None:
+            _cache_bytes -= _entry_bytes(entry)
+        if _shared_dir is None:
+            _versions[file_id] = _versions.get(file_id, 0) + 1
+            return
+    path = _version_path(file_id)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp, path)
+
+def _read_shared(file_id, key):
+    import numpy as np
+
+    try:
+        with open(_meta_path(file_id)) as f:
+            meta = json.load(f)
+        if meta["key"] != key:
+            return None
+        if meta["stem"] is None:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.uint8), np.empty(0, dtype=np.float32)
+        stem = os.path.join(_shared_dir, meta["stem"])
+        return tuple(np.load(f"{stem}.{name}.npy", mmap_mode="r") for name in ("ids", "codes", "scales"))
+    except (FileNotFoundError, ValueError):
+        # not written yet, or replaced between reading the metadata and mapping the arrays
+        return None
+
+def _write_shared(file_id, key, ids, codes, scales):
+    import numpy as np
+
+    stem = None
+    if len(ids):
+        # a fresh set of files per version: readers holding a mapping of the old one are unaffected
+        stem = f"{file_id}.{time.time_ns()}"
+        for name, array in (("ids", ids), ("codes", codes), ("scales", scales)):
+            path = os.path.join(_shared_dir, f"{stem}.{name}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+    try:
+        with open(_meta_path(file_id)) as f:
+            old_stem = json.load(f)["stem"]
+    except (FileNotFoundError, ValueError):
+        old_stem = None
+    tmp = f"{_meta_path(file_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"key": key, "stem": stem}, f)
+    os.replace(tmp, _meta_path(file_id))
+    if old_stem:
+        for name in ("ids", "codes", "scales"):
+            try:
+                os.remove(os.path.join(_shared_dir, f"{old_stem}.{name}.npy"))
+            except FileNotFoundError:
+                pass
+
+def _cached(file_id, key):
+    with _lock:
+        entry = _cache.get(file_id)
+        if entry is not None and entry[0] == key:
+            _cache.move_to_end(file_id)
+            return entry[1:]
+    if _shared_dir is None:
+        return None
+    entry = _read_shared(file_id, key)
+    if entry is not None:
+        # mapped, not copied: the pages are shared with every other process
+        with _lock:
+            _cache[file_id] = (key, *entry)
+    return entry
+
+def _remember(file_id, key, ids, codes, scales):
+    global _cache_bytes
+    if _shared_dir is not None:
+        _write_shared(file_id, key, ids, codes, scales)
+        return
+    entry = (key, ids, codes, scales)
+    with _lock:
+        old = _cache.pop(file_id, None)
+        if old is not None:
+            _cache_bytes -= _entry_bytes(old)
+        _cache[file_id] = entry
+        _cache_bytes += _entry_bytes(entry)
+        while _cache_bytes > SEARCH_CACHE_BYTES and len(_cache) > 1:
+            _, dropped = _cache.popitem(last=False)
+            _cache_bytes -= _entry_bytes(dropped)
+
+def _scope(cur, file_id):
+    if file_id is not None:
+        return [file_id]
+    cur.execute("SELECT id FROM files ORDER BY id")
+    return [r[0] for r in cur.fetchall()]
+
+def _load_codes(cur, file_id=None):
+    """
+    (ids, codes, scales) of every embedded chunk in scope, or None when some
+    of them have no compact code yet.
+    """
+    import numpy as np
+    from services import quantize
+
+    parts = []
+    for fid in _scope(cur, file_id):
+        # read before loading: an invalidation during the load leaves this copy under a stale key
+        key = _key(fid)
+        entry = _cached(fid, key)
+        if entry is None:
+            cur.execute(
+                """
+                SELECT id, embedding_compact, embedding_scale FROM chunks
+                WHERE file_id = %s AND embedding IS NOT NULL ORDER BY id
+                """,
+                (fid,),
+            )
+            rows = cur.fetchall()
+            if any(r[1] is None for r in rows):
+                return None
+            ids = np.array([r[0] for r in rows], dtype=np.int64)
+            codes, scales = quantize.codes_from_rows([(r[1], r[2]) for r in rows],
+                                                    quantize.COMPACT_MODE, quantize.COMPACT_DIM)
+            _remember(fid, key, ids, codes, scales)
+            entry = (ids, codes, scales)
+        if len(entry[0]):
+            parts.append(entry)
+    if not parts:
+        return np.empty(0, dtype=np.int64), None, None
+    return (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]),
+            np.concatenate([p[2] for p in parts]))
+
+def _exact(cur, embedding, file_id, k):
+    from pgvector import Vector
+
+    scope = "AND file_id = %s" if file_id is not None else ""
+    vec = Vector(embedding)
+    cur.execute(
+        f"""
+        SELECT id, 1 - (embedding <=> %s) AS score FROM chunks
+        WHERE embedding IS NOT NULL {scope}
+        ORDER BY embedding <-> %s LIMIT %s
+        """,
+        (vec, *((file_id,) if file_id is not None else ()), vec, k),
+    )
+    return [(int(r[0]), float(r[1])) for r in cur.fetchall()]
+
+@metrics.timed("search")
+def search_chunks(embedding, file_id=None, k=SEARCH_K):
+    """
+    The ``k`` chunks closest to ``embedding``, within ``file_id`` or across
+    all files. Returns (mode, [(chunk_id, cosine score), ...]) best first,
+    where mode is "compact" or "exact".
+    """
+    import numpy as np
+    from services import quantize
+
+    conn = get_db_conn()
+    try:
+        cur = conn.cursor()
+        loaded = None
+        if quantize.COMPACT_MODE:
+            try:
+                loaded = _load_codes(cur, file_id)
+            except ValueError:
+                # codes written under a different EMBED_COMPACT_MODE / _DIM
+                logger.warning("stored compact codes do not match the configured mode, using exact search")
+        if loaded is None:
+            return "exact", _exact(cur, embedding, file_id, k)
+
+        ids, codes, scales = loaded
+        if not len(ids):
+            return "compact", []
+
+        def fetch_full(indices):
+            wanted = ids[indices].tolist()
+            cur.execute("SELECT id, embedding FROM chunks WHERE id = ANY(%s)", (wanted,))
+            by_id = {r[0]: r[1] for r in cur.fetchall()}
+            return np.array([np.asarray(by_id[i], dtype=np.float32) for i in wanted], dtype=np.float32)
+
+        found, scores = quantize.search(embedding, codes, scales, fetch_full, k=k,
+                                        mode=quantize.COMPACT_MODE, dim=quantize.COMPACT_DIM)
+        return "compact", [(int(ids[i]), float(s)) for i, s in zip(found, scores)]
+    finally:
+        conn.close()
+
+def backfill(everything=False, batch_size=SEARCH_BACKFILL_BATCH):
+    """
+    Encode compact codes from the stored full embeddings, for the chunks that
+    have none or, with ``everything``, for all of them. Returns the number of
+    chunks written.
+    """
+    import psycopg2
+    from psycopg2.extras import execute_values
+    from services import quantize
+
+    if not quantize.COMPACT_MODE:
+        raise RuntimeError("EMBED_COMPACT_MODE is not set; nothing to backfill")
+    missing = "" if everything else "AND embedding_compact IS NULL"
+    conn = get_db_conn()
+    written, last_id = 0, 0
+    try:
+        cur = conn.cursor()
+        while True:
+            cur.execute(
+                f"SELECT id, embedding FROM chunks WHERE embedding IS NOT NULL {missing} AND id > %s "
+                "ORDER BY id LIMIT %s",
+                (last_id, batch_size),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            values = []
+            for cid, emb in rows:
+                code, scale = quantize.compact_embedding(emb, quantize.COMPACT_MODE, quantize.COMPACT_DIM)
+                values.append((cid, psycopg2.Binary(code), scale))
+            execute_values(
+                cur,
+                "UPDATE chunks SET embedding_compact = v.code, embedding_scale = v.scale "
+                "FROM (VALUES %s) AS v (id, code, scale) WHERE chunks.id = v.id",
+                values,
+                template="(%s, %s::bytea, %s::real)",
+            )
+            conn.commit()
+            written += len(rows)
+            last_id = rows[-1][0]
+            logger.info("search: backfilled compact codes for %d chunks", written)
+    finally:
+        conn.close()
+    return written
+
+def handle_search_request(payload):
+    """
+    payload: { "embedding": [...], "file_id": <optional int>, "k": <optional int> }
+    returns: (status_code:int, body:dict)
+    """
+    from services import quantize
+
+    embedding = payload.get("embedding")
+    if not isinstance(embedding, list) or len(embedding) != quantize.EMBED_DIM:
+        return 400, {"error": f"'embedding' must be a list of {quantize.EMBED_DIM} floats"}
+    file_id = payload.get("file_id")
+    k = payload.get("k", SEARCH_K)
+    try:
+        file_id = int(file_id) if file_id is not None else None
+        k = int(k)
+    except (TypeError, ValueError):
+        return 400, {"error": "'file_id' and 'k' must be integers"}
+    if not 1 <= k <= SEARCH_MAX_K:
+        return 400, {"error": f"'k' must be between 1 and {SEARCH_MAX_K}"}
+    try:
+        mode, results = search_chunks(embedding, file_id, k)
+    except Exception as e:
+        logger.exception("search error")
+        return 500, {"error": f"search failed: {e}"}
+    return 200, {"mode": mode, "results": [{"id": cid, "score": score} for cid, score in results]}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the compact embedding codes used by search.")
+    parser.add_argument("--backfill", action="store_true",
+                        help="encode compact codes for embedded chunks that have none")
+    parser.add_argument("--all", action="store_true",
+                        help="with --backfill, re-encode every chunk (after changing the compact mode or dim)")
+    args = parser.parse_args()
+    if args.backfill:
+        print(f"backfilled {backfill(everything=args.all)} chunks")
+    else:
+        parser.print_help()
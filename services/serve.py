@@ -0,0 +1,463 @@
+"""
+Multi-process serving mode.
+
+    python -m services.serve
+    python -m services.serve --workers 4 --port 5000 --background-port 5001
+
+``python -m services`` runs everything in one process, where PDF extraction,
+chunking and local ranking all compete for one GIL. This entry point
+imports the app once, preloads ``SERVE_PRELOAD`` (``gc.freeze()``-ing the
+result so the forked children share those pages copy-on-write) and forks:
+
+  - ``SERVE_WORKERS`` interactive workers that accept on one shared socket
+    (``SERVE_HOST:SERVE_PORT``) and serve insights, embeddings and podcasts
+  - one background process on ``127.0.0.1:SERVE_BACKGROUND_PORT`` that owns all
+    ingest state: downloads, extraction, the embed batcher, OCR, the
+    neighbour graph and the prefetch worker. Interactive workers forward
+    ``BACKGROUND_ENDPOINTS`` to it, so clients keep using one address;
+    they can also call it directly to skip the hop
+
+State shared between the processes:
+
+  - a ``multiprocessing.shared_memory`` table with one row per process
+    (pid, role, requests, in-flight interactive requests, RSS/PSS/USS),
+    which the prefetch worker consults to yield to interactive work in
+    any process and ``GET /workers`` reports
+  - prefetched candidate sets, written once by the background process under
+    ``SERVE_SHARED_DIR`` and memory-mapped by every worker (see
+    ``services.prefetch``), and likewise the compact embedding codes that
+    ``POST /search`` scans (see ``services.search``)
+  - a state file per process under ``SERVE_SHARED_DIR/state``, rewritten every
+    ``SERVE_STATE_INTERVAL_S`` with its stage histograms and warm-up status.
+    Whichever process answers ``GET /metrics`` or ``GET /ready`` merges them
+    with its own live state, so the answer covers every process. A
+    ``/ready?warm=1`` is announced through the worker table: every process
+    warms the components its role uses (only the background process starts
+    the extraction pool) and the request waits (up to
+    ``SERVE_READY_TIMEOUT_S``) until all of them have. ``GET /profiles``
+    needs no merging, as every process writes its profiles to the same
+    ``PROFILE_DIR``
+
+Children that die are restarted; SIGTERM / SIGINT stop all of them.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+
+# ---- Configuration ----
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "5000"))
+SERVE_BACKGROUND_PORT = int(os.getenv("SERVE_BACKGROUND_PORT", "5001"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(max(2, min(8, os.cpu_count() or 2)))))
+SERVE_PRELOAD = os.getenv("SERVE_PRELOAD", "numpy,pdf")    # clients.WARMERS loaded before forking
+SERVE_SHARED_DIR = os.getenv("SERVE_SHARED_DIR", "")
+SERVE_MEMORY_INTERVAL_S = float(os.getenv("SERVE_MEMORY_INTERVAL_S", "5"))
+SERVE_REPORT_INTERVAL_S = float(os.getenv("SERVE_REPORT_INTERVAL_S", "60"))
+SERVE_STATE_INTERVAL_S = float(os.getenv("SERVE_STATE_INTERVAL_S", "2"))
+SERVE_READY_TIMEOUT_S = float(os.getenv("SERVE_READY_TIMEOUT_S", "60"))
+BACKGROUND_ENDPOINTS = {
+    "jobs_ingest", "jobs_ingest_batch", "jobs_ingest_batch_status", "jobs_ingest_status",
+    "jobs_ingest_events", "insights_prefetch", "insights_prefetch_stats",
+}
+ROLES = ("interactive", "background")
+FIELDS = ("pid", "role", "started_at", "requests", "inflight", "rss_kb", "pss_kb", "uss_kb", "sampled_at",
+          "warm_requested", "warmed")
+
+logger = logging.getLogger("serve")
+
+# ---- shared worker table ----
+
+def memory_usage(pid="self"):
+    """(rss_kb, pss_kb, uss_kb) of a process; PSS and USS are 0 where smaps_rollup is unavailable."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    fields[name] = int(value.split()[0])
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 0, 0
+    return fields.get("Rss", 0), fields.get("Pss", 0), fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+
+class WorkerTable:
+    """
+    One int64 row of FIELDS per serving process, in shared memory created by
+    the parent before forking. Each process only writes its own row.
+    """
+
+    def __init__(self, slots):
+        import numpy as np
+        from multiprocessing import shared_memory
+
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * len(FIELDS) * 8)
+        self.rows = np.ndarray((slots, len(FIELDS)), dtype=np.int64, buffer=self.shm.buf)
+        self.rows[:] = 0
+        self.slot = None
+        self._lock = threading.Lock()
+
+    def _col(self, name):
+        return FIELDS.index(name)
+
+    def claim(self, slot, role):
+        """Take over a row in a freshly forked child."""
+        self.slot = slot
+        self._lock = threading.Lock()
+        self.rows[slot] = 0
+        self.rows[slot, self._col("pid")] = os.getpid()
+        self.rows[slot, self._col("role")] = ROLES.index(role)
+        self.rows[slot, self._col("started_at")] = int(time.time())
+
+    def add(self, name, n=1):
+        with self._lock:
+            self.rows[self.slot, self._col(name)] += n
+
+    def sample_memory(self):
+        rss, pss, uss = memory_usage()
+        row = self.rows[self.slot]
+        row[self._col("rss_kb")], row[self._col("pss_kb")], row[self._col("uss_kb")] = rss, pss, uss
+        row[self._col("sampled_at")] = int(time.time())
+
+    def interactive_inflight(self):
+        """Interactive requests in flight in every process but this one."""
+        role, inflight = self.rows[:, self._col("role")], self.rows[:, self._col("inflight")]
+        others = self.rows[:, self._col("pid")] != os.getpid()
+        return int(inflight[others & (role == ROLES.index("interactive"))].sum())
+
+    def get(self, name):
+        return int(self.rows[self.slot, self._col(name)])
+
+    def set(self, name, value):
+        with self._lock:
+            self.rows[self.slot, self._col(name)] = value
+
+    def live_slots(self):
+        """{slot: pid} of every process that has claimed a row."""
+        return {slot: pid for slot, pid in enumerate(self.rows[:, self._col("pid")].tolist()) if pid}
+
+    def warm_requested(self):
+        """Newest warm-up token any process has announced."""
+        return int(self.rows[:, self._col("warm_requested")].max())
+
+    def warmed_everywhere(self, token):
+        live = self.rows[:, self._col("pid")] != 0
+        return bool((self.rows[live, self._col("warmed")] >= token).all())
+
+    def snapshot(self):
+        workers = []
+        for row in self.rows.tolist():
+            entry = dict(zip(FIELDS, row))
+            if not entry["pid"]:
+                continue
+            entry["role"] = ROLES[entry["role"]]
+            del entry["warm_requested"], entry["warmed"]
+            for name in ("rss_kb", "pss_kb", "uss_kb"):
+                entry[name.replace("_kb", "_mb")] = round(entry.pop(name) / 1024, 1)
+            workers.append(entry)
+        totals = {name: round(sum(w[name] for w in workers), 1) for name in ("rss_mb", "pss_mb", "uss_mb")}
+        # RSS counts shared pages once per process, PSS splits them: the gap is what sharing saves
+        totals["shared_saving_mb"] = round(totals["rss_mb"] - totals["pss_mb"], 1)
+        return {"workers": workers, "totals": totals}
+
+    def release(self):
+        self.rows = None
+        self.shm.close()
+        self.shm.unlink()
+
+# ---- per-process state files ----
+
+def _state_path(state_dir, slot):
+    return os.path.join(state_dir, f"{slot}.json")
+
+def _own_state(role):
+    from services import clients, metrics
+
+    return {"pid": os.getpid(), "role": role, "metrics": metrics.export(), "components": clients.warm_status()}
+
+def _publish_state(table, role, state_dir):
+    path = _state_path(state_dir, table.slot)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_own_state(role), f)
+    os.replace(tmp, path)
+
+def _publish_state_forever(table, role, state_dir):
+    from services import clients
+
+    while True:
+        token = table.warm_requested()
+        if token > table.get("warmed"):
+            clients.warm_up()
+        try:
+            _publish_state(table, role, state_dir)
+            # only once the file shows the warm-up, so a waiting /ready?warm=1 reads it
+            table.set("warmed", max(token, table.get("warmed")))
+        except OSError as e:
+            logger.warning("serve: could not publish state: %s", e)
+        time.sleep(SERVE_STATE_INTERVAL_S)
+
+def _all_states(table, role, state_dir):
+    """This process's live state followed by the last published state of every other live process."""
+    states = [_own_state(role)]
+    for slot, pid in table.live_slots().items():
+        if slot == table.slot:
+            continue
+        try:
+            with open(_state_path(state_dir, slot)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if state.get("pid") == pid:     # not a file left by a restarted process
+            states.append(state)
+    return states
+
+def merge_ready(states):
+    """
+    Combine per-process warm-up status: a component that failed in any process
+    is failed, one not yet warm in some process is not warm, otherwise it
+    reports the slowest warm-up time.
+    """
+    values = {}
+    for state in states:
+        for name, value in state["components"].items():
+            values.setdefault(name, []).append(value)
+    components = {}
+    for name, seen in values.items():
+        errors = [v for v in seen if isinstance(v, str)]
+        if errors:
+            components[name] = errors[0]
+        elif any(v is None for v in seen):
+            components[name] = None
+        else:
+            components[name] = max(seen)
+    failed = [name for name, v in components.items() if isinstance(v, str)]
+    body = {"ready": not failed, "components": components,
+            "processes": [{"pid": st["pid"], "role": st["role"], "components": st["components"]} for st in states]}
+    if failed:
+        body["failed"] = failed
+    return (503 if failed else 200), body
+
+# ---- per-child request hooks ----
+
+def _install_hooks(app, table, role, background_url, state_dir):
+    from flask import Response, jsonify, request, stream_with_context
+    from services import clients, metrics, prefetch
+
+    def count_request():
+        table.add("requests")
+        if prefetch.is_interactive_request():
+            table.add("inflight")
+            request.environ["serve.inflight"] = True
+
+    def end_request(exc=None):
+        if request.environ.pop("serve.inflight", False):
+            table.add("inflight", -1)
+
+    def forward_to_background():
+        if request.endpoint not in BACKGROUND_ENDPOINTS:
+            return None
+        import requests
+
+        url = background_url + request.path
+        if request.query_string:
+            url += "?" + request.query_string.decode("latin-1")
+        headers = {"Content-Type": request.content_type} if request.content_type else {}
+        try:
+            upstream = requests.request(request.method, url, data=request.get_data(), headers=headers,
+                                        stream=True, timeout=(5, None))
+        except requests.RequestException as e:
+            # the background process is restarting or overloaded; the caller may retry
+            logger.warning("serve: background process unreachable for %s: %s", request.path, e)
+            return jsonify({"error": f"background process unavailable: {e}"}), 503
+        passed = {k: v for k, v in upstream.headers.items()
+                  if k.lower() in ("content-type", "cache-control", "x-accel-buffering")}
+        return Response(stream_with_context(upstream.iter_content(chunk_size=None)),
+                        status=upstream.status_code, headers=passed)
+
+    def workers_view():
+        return jsonify({**table.snapshot(), "self": {"pid": os.getpid(), "role": role}}), 200
+
+    def metrics_view():
+        rows = metrics.combine(state["metrics"] for state in _all_states(table, role, state_dir))
+        return Response(metrics.render(rows), mimetype="text/plain; version=0.0.4")
+
+    def ready_view():
+        if request.args.get("warm", "").lower() in ("1", "true", "yes"):
+            token = max(table.warm_requested() + 1, time.time_ns() // 1_000_000)
+            table.set("warm_requested", token)
+            clients.warm_up()
+            _publish_state(table, role, state_dir)
+            table.set("warmed", token)
+            deadline = time.monotonic() + SERVE_READY_TIMEOUT_S
+            while not table.warmed_everywhere(token):
+                if time.monotonic() > deadline:
+                    _, body = merge_ready(_all_states(table, role, state_dir))
+                    return jsonify({**body, "ready": False, "error": "warm-up timed out in some processes"}), 503
+                time.sleep(0.05)
+        status_code, body = merge_ready(_all_states(table, role, state_dir))
+        return jsonify(body), status_code
+
+    app.before_request(count_request)
+    app.teardown_request(end_request)
+    if role == "interactive":
+        app.before_request(forward_to_background)
+    app.add_url_rule("/workers", "workers", workers_view, methods=["GET"])
+    app.view_functions["metrics_export"] = metrics_view
+    app.view_functions["ready"] = ready_view
+
+def _sample_memory_forever(table):
+    while True:
+        table.sample_memory()
+        time.sleep(SERVE_MEMORY_INTERVAL_S)
+
+def _run_child(slot, role, sock, table, shared_dir, prewarm):
+    from werkzeug.serving import make_server
+    from services import clients, prefetch, search
+    from services.__main__ import app
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    table.claim(slot, role)
+    clients.set_role(role)
+    background_url = f"http://127.0.0.1:{SERVE_BACKGROUND_PORT}"
+    state_dir = os.path.join(shared_dir, "state")
+    _install_hooks(app, table, role, background_url, state_dir)
+    prefetch.use_shared_store(os.path.join(shared_dir, "prefetch"),
+                              busy_elsewhere=table.interactive_inflight if role == "background" else None)
+    search.use_shared_store(os.path.join(shared_dir, "search"))
+    threading.Thread(target=_sample_memory_forever, args=(table,), name="memory-sampler", daemon=True).start()
+    threading.Thread(target=_publish_state_forever, args=(table, role, state_dir), name="state-publisher",
+                     daemon=True).start()
+    if prewarm:
+        components = None if prewarm == "all" else [c for c in prewarm.split(",") if c in clients.WARMERS]
+        threading.Thread(target=clients.warm_up, args=(components,), name="prewarm", daemon=True).start()
+
+    host, port = sock.getsockname()
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    logger.info("serve: %s worker %d listening on %s:%d", role, os.getpid(), host, port)
+    server.serve_forever()
+
+# ---- parent ----
+
+def _listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+def serve(workers=SERVE_WORKERS, port=SERVE_PORT, background_port=SERVE_BACKGROUND_PORT):
+    global SERVE_PORT, SERVE_BACKGROUND_PORT
+    SERVE_PORT, SERVE_BACKGROUND_PORT = port, background_port
+
+    # children warm PREWARM_ON_START themselves: no thread may be running when we fork
+    prewarm = os.environ.pop("PREWARM_ON_START", "").strip()
+    from services import clients
+    import services.__main__  # noqa: F401  (imported once, shared by every child)
+
+    # no process pool before the fork: only the background child starts one
+    preload = [c.strip() for c in SERVE_PRELOAD.split(",")
+               if c.strip() in clients.WARMERS and c.strip() not in clients.BACKGROUND_WARMERS]
+    clients.warm_up(preload)
+    shared_dir = SERVE_SHARED_DIR or tempfile.mkdtemp(
+        prefix="pdf-services-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    owns_shared_dir = not SERVE_SHARED_DIR
+    os.makedirs(os.path.join(shared_dir, "state"), exist_ok=True)
+
+    sockets = {"interactive": _listen(SERVE_HOST, port), "background": _listen("127.0.0.1", background_port)}
+    roles = ["background"] + ["interactive"] * workers
+    table = WorkerTable(len(roles))
+    gc.collect()
+    gc.freeze()     # keep the collector from touching (and so un-sharing) the preloaded objects
+
+    children = {}   # pid -> slot
+    started = {}    # slot -> time of the last fork, to back off from crash loops
+
+    def spawn(slot):
+        delay = 1.0 - (time.time() - started.get(slot, 0))
+        if delay > 0:
+            time.sleep(delay)
+        started[slot] = time.time()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_child(slot, roles[slot], sockets[roles[slot]], table, shared_dir, prewarm)
+            except BaseException:
+                logger.exception("serve: %s worker crashed", roles[slot])
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(len(roles)):
+        spawn(slot)
+    logger.info("serve: %d interactive workers on %s:%d, background process on 127.0.0.1:%d, shared dir %s",
+                workers, SERVE_HOST, port, background_port, shared_dir)
+
+    last_report = time.time()
+    try:
+        while not stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in children:
+                slot = children.pop(pid)
+                logger.warning("serve: %s worker %d exited (status %d), restarting", roles[slot], pid, status)
+                spawn(slot)
+                continue
+            if time.time() - last_report >= SERVE_REPORT_INTERVAL_S:
+                last_report = time.time()
+                totals = table.snapshot()["totals"]
+                logger.info("serve: memory rss %.1f MB, pss %.1f MB, uss %.1f MB across %d processes",
+                            totals["rss_mb"], totals["pss_mb"], totals["uss_mb"], len(children))
+            time.sleep(0.2)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        table.release()
+        if owns_shared_dir:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="interactive worker processes")
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--background-port", type=int, default=SERVE_BACKGROUND_PORT)
+    args = parser.parse_args()
+    if sys.platform == "win32":
+        parser.error("multi-process serving needs fork(); use python -m services")
+    serve(args.workers, args.port, args.background_port)
+
+if __name__ == "__main__":
+    main()
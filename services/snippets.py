@@ -0,0 +1,158 @@
+"""
+Selection-aware snippet previews for retrieved chunks.
+
+Chunks are split into sentences once, at ingest, and the character offsets
+are stored with the chunk (``chunks.sentence_offsets``, flattened
+``[start, end, start, end, ...]``). At query time ``attach_snippets`` scores
+every sentence of every candidate chunk against the selection in one
+vectorised pass and keeps the 2 to ``SNIPPET_MAX_SENTENCES`` best sentences
+of each chunk, in reading order, as its preview:
+
+  - sentences and selection become hashed bag-of-words vectors (log term
+    frequency weighted by IDF over the candidate sentences), so the score is
+    a cosine similarity computed as one matrix-vector product
+  - beyond the first two, a sentence is only added if it scores at least
+    ``SNIPPET_RELATIVE_CUTOFF`` of the chunk's best and the preview stays
+    within ``SNIPPET_MAX_CHARS``
+  - a chunk that shares no words with the selection falls back to its
+    leading sentences
+
+Chunks stored before offsets existed are split on the fly.
+"""
+
+import os
+import re
+import zlib
+
+# ---- Configuration ----
+SNIPPET_MIN_SENTENCES = 2
+SNIPPET_MAX_SENTENCES = int(os.getenv("SNIPPET_MAX_SENTENCES", "4"))
+SNIPPET_MAX_CHARS = int(os.getenv("SNIPPET_MAX_CHARS", "480"))
+SNIPPET_RELATIVE_CUTOFF = float(os.getenv("SNIPPET_RELATIVE_CUTOFF", "0.5"))
+SNIPPET_HASH_DIM = 1 << 12
+
+_ELLIPSIS = "…"
+_sentence_end_re = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])|\n\s*\n")
+_abbreviation_re = re.compile(r"(?:^|\s|\()(?:dr|mr|mrs|ms|prof|st|vs|fig|eq|no|e\.g|i\.e|et al|etc)\.[\"')\]]*$",
+                              re.IGNORECASE)
+_word_re = re.compile(r"\w+")
+
+def split_sentences(text):
+    """Character offsets [(start, end), ...] of the sentences of ``text``, whitespace trimmed."""
+    spans = []
+    start = 0
+    for m in _sentence_end_re.finditer(text):
+        if _abbreviation_re.search(text, max(0, m.start() - 8), m.start()):
+            continue
+        spans.append((start, m.start()))
+        start = m.end()
+    spans.append((start, len(text)))
+    out = []
+    for s, e in spans:
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if e > s:
+            out.append((s, e))
+    return out
+
+def sentence_offsets(text):
+    """Flattened sentence offsets, as stored in ``chunks.sentence_offsets``."""
+    return [pos for span in split_sentences(text or "") for pos in span]
+
+def _spans(chunk):
+    """Stored offsets of a chunk if they fit its text, otherwise freshly split ones."""
+    text = chunk.get("text") or ""
+    flat = chunk.get("sentence_offsets")
+    if flat and len(flat) % 2 == 0 and flat[-1] <= len(text):
+        return list(zip(flat[0::2], flat[1::2]))
+    return split_sentences(text)
+
+def _hashed_tokens(text):
+    return [zlib.crc32(w.encode("utf-8")) % SNIPPET_HASH_DIM for w in _word_re.findall(text.lower())]
+
+def score_sentences(selected_text, sentences):
+    """Cosine similarity of every sentence to the selection, as a float32 array."""
+    import numpy as np
+
+    rows, cols = [], []
+    for i, sentence in enumerate(sentences):
+        tokens = _hashed_tokens(sentence)
+        rows.extend([i] * len(tokens))
+        cols.extend(tokens)
+    query_cols = _hashed_tokens(selected_text)
+    # only the hash buckets that actually occur become columns
+    vocab, inverse = np.unique(np.asarray(cols + query_cols, dtype=np.int64), return_inverse=True)
+    dim = len(vocab)
+    flat = np.asarray(rows, dtype=np.int64) * dim + inverse[:len(cols)]
+    counts = np.bincount(flat, minlength=len(sentences) * dim).astype(np.float32).reshape(len(sentences), dim)
+    query = np.bincount(inverse[len(cols):], minlength=dim).astype(np.float32)
+
+    idf = (np.log((1.0 + len(sentences)) / (1.0 + (counts > 0).sum(axis=0))) + 1.0).astype(np.float32)
+    matrix = np.log1p(counts) * idf
+    query = np.log1p(query) * idf
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+    return (matrix @ query) / np.maximum(norms, 1e-12)
+
+def _pick(scores, spans):
+    """Indices (reading order) of the sentences that make up one chunk's preview."""
+    import numpy as np
+
+    if not spans:
+        return []
+    if not scores.size or scores.max() <= 0:
+        order = range(len(spans))
+    else:
+        order = np.argsort(-scores, kind="stable")
+    best = float(scores.max()) if scores.size else 0.0
+    picked, used = [], 0
+    for i in order:
+        i = int(i)
+        length = spans[i][1] - spans[i][0]
+        if len(picked) >= SNIPPET_MIN_SENTENCES:
+            if len(picked) >= SNIPPET_MAX_SENTENCES or used + length > SNIPPET_MAX_CHARS:
+                break
+            if best > 0 and scores[i] < SNIPPET_RELATIVE_CUTOFF * best:
+                break
+        picked.append(i)
+        used += length
+    return sorted(picked)
+
+def _render(text, spans, picked):
+    """Preview text and its offsets; over-long sentences are cut at a word boundary."""
+    parts, offsets, budget = [], [], SNIPPET_MAX_CHARS
+    previous = None
+    for i in picked:
+        start, end = spans[i]
+        if budget <= 0:
+            break
+        if end - start > budget:
+            cut = text.rfind(" ", start, start + budget)
+            end = cut if cut > start else start + budget
+        if previous is not None:
+            parts.append(" " if i == previous + 1 else f" {_ELLIPSIS} ")
+        sentence = text[start:end]
+        parts.append(sentence if (start, end) == spans[i] else sentence + _ELLIPSIS)
+        offsets.append([start, end])
+        budget -= end - start
+        previous = i
+    return "".join(parts), offsets
+
+def attach_snippets(selected_text, chunks):
+    """
+    Add ``snippet`` (the preview text) and ``snippet_offsets`` ([[start, end], ...]
+    into the chunk's text) to every chunk dict in place. Returns the chunks.
+    """
+    import numpy as np
+
+    spans = [_spans(chunk) for chunk in chunks]
+    sentences = [(chunk.get("text") or "")[s:e] for chunk, sp in zip(chunks, spans) for s, e in sp]
+    scores = score_sentences(selected_text or "", sentences) if sentences else np.zeros(0, dtype=np.float32)
+    pos = 0
+    for chunk, sp in zip(chunks, spans):
+        chunk_scores = scores[pos:pos + len(sp)]
+        pos += len(sp)
+        chunk["snippet"], chunk["snippet_offsets"] = _render(chunk.get("text") or "", sp, _pick(chunk_scores, sp))
+        chunk.pop("sentence_offsets", None)
+    return chunks
@@ -0,0 +1,304 @@
+"""
+Page- and document-level summaries rolled up from the per-chunk summaries.
+
+Whenever the embed batcher finishes a batch it calls ``schedule(file_id,
+chunk_ids)``. Roll-ups run on their own worker thread, never on the embedding
+workers: requests for the same file are merged, and once a file has been
+quiet for ``SUMMARY_ROLLUP_DEBOUNCE_SECONDS`` the pages holding the newly
+embedded chunks are re-summarised, each as soon as every chunk on it has
+been processed. The document summary waits until the ingest is complete
+(``ingest_progress`` reports a terminal stage, so a document still being
+extracted window by window waits for its last window); a file stuck
+mid-ingest gets one anyway after ``SUMMARY_ROLLUP_MAX_DEFER_SECONDS``. It is
+built once every page has a summary, after rolling up any finished page that
+is still missing one.
+
+Each stored summary keeps a hash of the summaries it was built from, so a
+page or document is only re-summarised when its inputs actually changed
+(e.g. after a re-ingest).
+
+``load_summaries`` serves /insights from a per-file in-process cache that is
+dropped whenever this process writes a roll-up for the file and otherwise
+expires after ``SUMMARY_CACHE_SECONDS``.
+
+With ``SUMMARY_ROLLUP_MODE=llm`` (default) pages and documents with more
+than one input are condensed by Gemini; ``extractive`` (or no
+GOOGLE_API_KEY, or a failed call) joins the deduplicated inputs instead.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from services import clients, context_builder, ingest_progress, metrics
+from services.methods import get_db_conn, get_dict_cursor
+
+# ---- Configuration ----
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
+ROLLUP_MODE = os.getenv("SUMMARY_ROLLUP_MODE", "llm").strip().lower()
+PAGE_INPUT_BUDGET = int(os.getenv("SUMMARY_PAGE_INPUT_BUDGET", "1500"))
+DOCUMENT_INPUT_BUDGET = int(os.getenv("SUMMARY_DOCUMENT_INPUT_BUDGET", "6000"))
+FALLBACK_TEXT_WORDS = 80    # chunk text used in place of a summary that failed to generate
+ROLLUP_DEBOUNCE_SECONDS = float(os.getenv("SUMMARY_ROLLUP_DEBOUNCE_SECONDS", "2"))
+ROLLUP_MAX_DEFER_SECONDS = float(os.getenv("SUMMARY_ROLLUP_MAX_DEFER_SECONDS", "600"))
+CACHE_SECONDS = float(os.getenv("SUMMARY_CACHE_SECONDS", "30"))
+MAX_CACHED_FILES = 256
+
+logger = logging.getLogger("summaries")
+
+_pending = {}       # file_id -> (first requested, due, chunk ids or None for every page), monotonic seconds
+_cond = threading.Condition()
+_worker = None
+
+_cache = OrderedDict()  # file_id -> (loaded_at, {page_number: summary}, document summary)
+_cache_lock = threading.Lock()
+
+def _source_hash(parts):
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def _condense(parts, instruction, budget):
+    excerpts, _, _ = context_builder.build_context([{"text": p} for p in parts], budget)
+    extractive = "\n".join(e["text"] for e in excerpts)
+    if ROLLUP_MODE != "llm" or not GOOGLE_API_KEY or len(excerpts) < 2:
+        return extractive
+    prompt = (
+        f"{instruction} "
+        "Output only the summary text without titles, bullets, or extra formatting.\n\n"
+        "Content:\n" + "\n\n".join(e["text"] for e in excerpts)
+    )
+    try:
+        model = clients.genai().GenerativeModel(model_name="gemini-2.5-flash")
+        summary_text = (model.generate_content(prompt).text or "").strip()
+        if summary_text.startswith("```") and summary_text.endswith("```"):
+            summary_text = summary_text[3:-3].strip()
+        return summary_text or extractive
+    except Exception as e:
+        logger.warning("rollup summary failed, keeping extractive summary: %s", e)
+        return extractive
+
+@metrics.timed("page_summary")
+def summarize_page(chunk_summaries):
+    return _condense(chunk_summaries, "Summarize this page of a document in 2 to 3 concise sentences, "
+                                      "based on the summaries of its sections.", PAGE_INPUT_BUDGET)
+
+@metrics.timed("document_summary")
+def summarize_document(page_summaries):
+    return _condense(page_summaries, "Summarize this document in 3 to 5 concise sentences, "
+                                     "based on the summaries of its pages.", DOCUMENT_INPUT_BUDGET)
+
+def _page_inputs(rows):
+    """Summary (or a short prefix of the text, if summarisation failed) of every chunk on a page."""
+    parts = []
+    for row in rows:
+        if row["summary"]:
+            parts.append(row["summary"])
+        elif row["text"]:
+            parts.append(" ".join(row["text"].split()[:FALLBACK_TEXT_WORDS]))
+    return parts
+
+def roll_up_file(conn, file_id, page_numbers=None, chunk_ids=None, document=True):
+    """
+    Refresh the page summaries of ``file_id`` whose chunks are all processed:
+    only ``page_numbers``, or the pages holding ``chunk_ids``, if given. With
+    ``document`` pages still missing a summary are refreshed as well, then the
+    document summary once every page has one. Returns the number of summaries
+    written.
+    """
+    cur = get_dict_cursor(conn)
+    query = ("SELECT page_number, summary, CASE WHEN summary IS NULL THEN text END AS text, "
+             "embedding IS NULL AS pending FROM chunks WHERE file_id = %s")
+    params = [file_id]
+    if page_numbers is not None or chunk_ids is not None:
+        if page_numbers is not None:
+            wanted = "page_number = ANY(%s)"
+            params.append(list(page_numbers))
+        else:
+            wanted = "page_number IN (SELECT page_number FROM chunks WHERE file_id = %s AND id = ANY(%s))"
+            params += [file_id, list(chunk_ids)]
+        if document:
+            wanted += " OR page_number NOT IN (SELECT page_number FROM page_summaries WHERE file_id = %s)"
+            params.append(file_id)
+        query += f" AND ({wanted})"
+    cur.execute(query + " ORDER BY page_number, id", params)
+    pages = {}
+    for row in cur.fetchall():
+        pages.setdefault(row["page_number"], []).append(row)
+
+    cur.execute("SELECT page_number, source_hash FROM page_summaries WHERE file_id = %s AND page_number = ANY(%s)",
+                (file_id, list(pages)))
+    stored = {row["page_number"]: row["source_hash"] for row in cur.fetchall()}
+
+    written = 0
+    for page_number, rows in pages.items():
+        if any(row["pending"] for row in rows):
+            continue
+        parts = _page_inputs(rows)
+        h = _source_hash(parts)
+        if not parts or stored.get(page_number) == h:
+            continue
+        cur.execute(
+            "INSERT INTO page_summaries (file_id, page_number, summary, source_hash) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (file_id, page_number) DO UPDATE "
+            "SET summary = EXCLUDED.summary, source_hash = EXCLUDED.source_hash, updated_at = now()",
+            (file_id, page_number, summarize_page(parts), h)
+        )
+        conn.commit()
+        _forget(file_id)
+        written += 1
+    conn.commit()
+    if not document:
+        return written
+
+    # pages that lost all their chunks in a re-ingest
+    cur.execute(
+        "DELETE FROM page_summaries p WHERE p.file_id = %s AND NOT EXISTS "
+        "(SELECT 1 FROM chunks c WHERE c.file_id = p.file_id AND c.page_number = p.page_number)",
+        (file_id,)
+    )
+    if cur.rowcount:
+        _forget(file_id)
+    cur.execute(
+        "SELECT COUNT(DISTINCT page_number) AS pages, COUNT(*) FILTER (WHERE embedding IS NULL) AS pending, "
+        "(SELECT summary_source_hash FROM files WHERE id = %s) AS stored_hash FROM chunks WHERE file_id = %s",
+        (file_id, file_id)
+    )
+    status = cur.fetchone()
+    cur.execute("SELECT summary FROM page_summaries WHERE file_id = %s ORDER BY page_number", (file_id,))
+    page_summaries = [row["summary"] for row in cur.fetchall()]
+    conn.commit()
+    if status["pending"] or not page_summaries or len(page_summaries) != status["pages"]:
+        return written
+
+    h = _source_hash(page_summaries)
+    if status["stored_hash"] != h:
+        cur.execute("UPDATE files SET summary = %s, summary_source_hash = %s WHERE id = %s",
+                    (summarize_document(page_summaries), h, file_id))
+        conn.commit()
+        _forget(file_id)
+        written += 1
+        logger.info("rollup: document summary written for file %s (%d pages)", file_id, len(page_summaries))
+    return written
+
+def roll_up(file_id, chunk_ids=None, document=True):
+    """Roll up the pages of a file holding ``chunk_ids`` (every page if None), then its document summary."""
+    conn = None
+    try:
+        conn = get_db_conn()
+        roll_up_file(conn, file_id, chunk_ids=chunk_ids, document=document)
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.exception("rollup: failed for file %s: %s", file_id, e)
+    finally:
+        if conn:
+            conn.close()
+
+def schedule(file_id, chunk_ids=None):
+    """
+    Queue a roll-up of the pages of ``file_id`` holding ``chunk_ids`` (every
+    page if None). Requests for a file that is already waiting are merged into
+    one, and each pushes it back by the debounce interval.
+    """
+    global _worker
+    now = time.monotonic()
+    with _cond:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="summary-rollup", daemon=True)
+            _worker.start()
+        first, _, queued = _pending.get(file_id, (now, None, set()))
+        merged = None if queued is None or chunk_ids is None else queued | set(chunk_ids)
+        _pending[file_id] = (first, now + ROLLUP_DEBOUNCE_SECONDS, merged)
+        _cond.notify()
+
+def _ingest_settled(file_id):
+    """Whether this process has no ingest of the file in progress."""
+    state = ingest_progress.snapshot(file_id)
+    return state is None or state["stage"] in ingest_progress.TERMINAL_STAGES
+
+def _next_due():
+    with _cond:
+        while True:
+            now = time.monotonic()
+            due = [(d, f) for f, (_, d, _) in _pending.items() if d <= now]
+            if due:
+                file_id = min(due)[1]
+                first, _, chunk_ids = _pending.pop(file_id)
+                return file_id, first, chunk_ids
+            wake = min((d for _, d, _ in _pending.values()), default=None)
+            _cond.wait(None if wake is None else wake - now)
+
+def _run():
+    while True:
+        file_id, first, chunk_ids = _next_due()
+        settled = _ingest_settled(file_id) or time.monotonic() - first >= ROLLUP_MAX_DEFER_SECONDS
+        if settled or chunk_ids is None or chunk_ids:
+            roll_up(file_id, chunk_ids, document=settled)
+        if settled:
+            continue
+        # the rest of the file is still being extracted or embedded: its
+        # document summary waits, new pages are rolled up as they complete
+        with _cond:
+            earlier, due, queued = _pending.get(file_id, (first, None, set()))
+            due = time.monotonic() + ROLLUP_DEBOUNCE_SECONDS if due is None else due
+            _pending[file_id] = (min(earlier, first), due, queued)
+
+def _forget(file_id):
+    with _cache_lock:
+        _cache.pop(file_id, None)
+
+def _cached_files(file_ids):
+    now = time.monotonic()
+    with _cache_lock:
+        found = {}
+        for file_id in file_ids:
+            entry = _cache.get(file_id)
+            if entry is not None and now - entry[0] < CACHE_SECONDS:
+                _cache.move_to_end(file_id)
+                found[file_id] = entry
+        return found
+
+def load_summaries(file_pages):
+    """
+    Stored summaries for the given ``(file_id, page_number)`` pairs.
+    Returns ({(file_id, page_number): page summary}, {file_id: document summary});
+    both are empty if the database is unavailable. Only files missing from the
+    cache are read, all their pages in one query.
+    """
+    pairs = sorted({(int(f), int(p)) for f, p in file_pages})
+    if not pairs:
+        return {}, {}
+    file_ids = sorted({f for f, _ in pairs})
+    entries = _cached_files(file_ids)
+    missing = [f for f in file_ids if f not in entries]
+    if missing:
+        conn = None
+        try:
+            conn = get_db_conn()
+            cur = get_dict_cursor(conn)
+            cur.execute("SELECT file_id, page_number, summary FROM page_summaries WHERE file_id = ANY(%s)",
+                        (missing,))
+            pages_by_file = {f: {} for f in missing}
+            for row in cur.fetchall():
+                pages_by_file[row["file_id"]][row["page_number"]] = row["summary"]
+            cur.execute("SELECT id, summary FROM files WHERE id = ANY(%s)", (missing,))
+            documents = {row["id"]: row["summary"] for row in cur.fetchall()}
+        except Exception as e:
+            logger.warning("summary lookup failed: %s", e)
+            pages_by_file, documents = {}, {}
+        finally:
+            if conn:
+                conn.close()
+        now = time.monotonic()
+        with _cache_lock:
+            for f in pages_by_file:
+                entries[f] = _cache[f] = (now, pages_by_file[f], documents.get(f))
+                _cache.move_to_end(f)
+            while len(_cache) > MAX_CACHED_FILES:
+                _cache.popitem(last=False)
+
+    pages = {(f, p): entries[f][1][p] for f, p in pairs if f in entries and p in entries[f][1]}
+    documents = {f: entries[f][2] for f in file_ids if f in entries and entries[f][2]}
+    return pages, documents
@@ -10,9 +10,7 @@ import requests
 import logging
 import base64
 from pathlib import Path
-from dotenv import load_dotenv
-
-load_dotenv()
+from services import metrics
 
 # Configure logging
 logger = logging.getLogger("tts_service")
@@ -64,6 +62,7 @@ def generate_tts(text, output_file):
     # Generate audio for the entire text at once
     return _generate_single_tts(text, output_file, gcp_voice, language, api_key)
 
+@metrics.timed("tts_segment")
 def _generate_single_tts(text, output_file, voice, language, api_key):
     """Generate TTS for a single text segment."""
     try:
@@ -106,6 +105,7 @@ def _generate_single_tts(text, output_file, voice, language, api_key):
         return output_file
     
     except Exception as e:
+        metrics.mark_error()
         logger.exception(f"Google Cloud TTS failed: {str(e)}")
         raise RuntimeError(f"Google Cloud TTS failed: {str(e)}")
 
@@ -0,0 +1,38 @@
+import pytest
+
+from services import clients
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+    monkeypatch.setattr(clients, "WARMERS", {name: (lambda name=name: seen.append(name)) for name in clients.WARMERS})
+    monkeypatch.setattr(clients, "_warm", {})
+    monkeypatch.setattr(clients, "_role", None)
+    return seen
+
+
+def test_warm_up_runs_only_the_requested_component(calls):
+    status = clients.warm_up(["db"])
+    assert calls == ["db"]
+    assert list(status) == ["db"]
+
+
+def test_warm_up_runs_every_component_once(calls):
+    clients.warm_up(None)
+    clients.warm_up(None)
+    assert sorted(calls) == sorted(clients.WARMERS)
+    assert all(isinstance(v, float) for v in clients.warm_status().values())
+
+
+def test_interactive_role_skips_the_extraction_pool(calls):
+    clients.set_role("interactive")
+    clients.warm_up(None)
+    clients.warm_up(["extract_pool"])
+    assert "extract_pool" not in calls
+    assert sorted(calls) == sorted(set(clients.WARMERS) - clients.BACKGROUND_WARMERS)
+    assert "extract_pool" not in clients.warm_status()
+
+    clients.set_role("background")
+    clients.warm_up(None)
+    assert calls.count("extract_pool") == 1
@@ -0,0 +1,86 @@
+import random
+
+from services import context_builder as cb
+
+
+def _text(seed, words=120):
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(5000)}" for _ in range(words))
+
+
+def test_near_duplicates_are_dropped():
+    original = _text(1)
+    near = original.replace(original.split()[3], "changed", 1)
+    items = [{"text": original}, {"text": near}, {"text": _text(2)}]
+    excerpts, duplicates, report = cb.build_context(items, 10_000)
+    assert [e["index"] for e in excerpts] == [0, 2]
+    assert duplicates == {1: 0}
+    assert report["duplicates"] == 1
+
+
+def test_overlapping_runs_are_cut():
+    a, b, c = _text(1, 60), _text(2, 60), _text(3, 60)
+    items = [{"text": a + " " + b}, {"text": b + " " + c}]
+    excerpts, duplicates, report = cb.build_context(items, 10_000)
+    assert not duplicates
+    assert excerpts[1]["text"] == c
+    assert report["overlap_words_removed"] == 60
+
+
+def test_mostly_overlapping_item_counts_as_duplicate():
+    a, b = _text(1, 100), _text(2, 5)
+    excerpts, duplicates, _ = cb.build_context([{"text": a}, {"text": b + " " + a}], 10_000)
+    assert len(excerpts) == 1
+    assert duplicates == {1: 0}
+
+
+def test_budget_and_item_cap_are_respected():
+    items = [{"text": _text(i, 200)} for i in range(10)]
+    excerpts, _, report = cb.build_context(items, 300, max_item_tokens=50)
+    assert report["tokens_used"] <= 300 + len(excerpts)  # ellipsis per truncated excerpt
+    assert all(cb.estimate_tokens(e["text"]) <= 51 for e in excerpts)
+    assert report["truncated"] == len(excerpts)
+    assert report["over_budget"] == len(items) - len(excerpts)
+
+
+def test_distance_reorders_items():
+    items = [{"text": _text(1), "distance": 0.9}, {"text": _text(2), "distance": 0.1}]
+    excerpts, _, _ = cb.build_context(items, 10_000)
+    assert [e["index"] for e in excerpts] == [1, 0]
+
+
+def test_baseline_tokens_matches_the_old_payloads():
+    items = [{"text": "x" * 800}] * 12 + [{"text": ""}, {"text": "short"}]
+    # ranking: 200-char samples (+ "...") of at most 30 chunks
+    assert cb.baseline_tokens(items, cb.BASELINE_RANK) == 12 * cb.estimate_tokens("x" * 203) + cb.estimate_tokens("short")
+    # summary: the first 10 chunks with text, 500 chars each
+    assert cb.baseline_tokens(items, cb.BASELINE_SUMMARY) == 10 * cb.estimate_tokens("x" * 503)
+    assert cb.baseline_tokens(items) == 12 * 200 + cb.estimate_tokens("short")
+
+
+def test_tokens_saved_is_measured_against_the_baseline():
+    items = [{"text": _text(i, 200)} for i in range(30)]
+    baseline = cb.baseline_tokens(items, cb.BASELINE_RANK)
+    _, _, report = cb.build_context(items, cb.BUDGET_RANK, cb.RANK_ITEM_TOKENS, baseline)
+    assert report["tokens_baseline"] == baseline
+    assert report["tokens_saved"] == baseline - report["tokens_used"]
+    assert report["tokens_used"] <= baseline
+
+
+def test_budgets_do_not_exceed_the_baseline_payload():
+    rank_items, rank_chars = cb.BASELINE_RANK
+    summary_items, summary_chars = cb.BASELINE_SUMMARY
+    assert cb.RANK_ITEM_TOKENS * cb.CHARS_PER_TOKEN <= rank_chars
+    assert cb.BUDGET_RANK <= rank_items * rank_chars / cb.CHARS_PER_TOKEN
+    assert cb.SUMMARY_ITEM_TOKENS * cb.CHARS_PER_TOKEN <= summary_chars
+    assert cb.BUDGET_SUMMARY <= summary_items * summary_chars / cb.CHARS_PER_TOKEN
+
+
+def test_rank_budget_makes_room_for_merged_sections():
+    items = [{"text": _text(i, 200)} for i in range(40)]
+    budget, baseline = cb.rank_budget(items)
+    assert budget == cb.RANK_ITEM_TOKENS * 40
+    assert budget <= baseline
+    _, _, report = cb.build_context(items, budget, cb.RANK_ITEM_TOKENS, baseline)
+    assert report["over_budget"] == 0
+    assert cb.rank_budget(items[:5])[0] <= cb.baseline_tokens(items[:5], cb.BASELINE_RANK)
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from services import ingest_progress, methods, neighbours, search, summaries
+
+
+class _Stop(Exception):
+    pass
+
+
+def test_lowest_priority_value_first_then_submission_order(monkeypatch):
+    batcher = methods.EmbedBatcher(workers=1, batch_size=2)
+    monkeypatch.setattr(batcher, "_ensure_started", lambda: None)
+    batches = []
+
+    def process(chunk_ids, generations=None):
+        batches.append(chunk_ids)
+        if not batcher.pending():
+            raise _Stop()
+        return set(chunk_ids)
+
+    monkeypatch.setattr(methods, "process_chunks_and_store_embeddings", process)
+    monkeypatch.setattr(summaries, "schedule", lambda file_id, chunk_ids=None: None)
+    batcher.submit([10, 11, 12], priority=5)
+    batcher.submit([20], priority=1)
+    batcher.submit([30, 31], priority=5)
+    assert batcher.pending() == 6
+
+    with pytest.raises(_Stop):
+        batcher._run()
+    assert batches == [[20, 10], [11, 12], [30, 31]]
+
+
+def test_batches_report_progress_and_complete_the_file_once(monkeypatch):
+    scheduled, done = [], threading.Event()
+    monkeypatch.setattr(methods, "process_chunks_and_store_embeddings",
+                        lambda chunk_ids, generations=None: set(chunk_ids) - {3})
+    monkeypatch.setattr(neighbours, "schedule", lambda file_id: (scheduled.append(file_id), done.set()))
+    monkeypatch.setattr(summaries, "schedule", lambda file_id, chunk_ids=None: None)
+    monkeypatch.setattr(search, "invalidate_file", lambda file_id, chunk_ids=None: None)
+
+    generation = ingest_progress.start_file(9301)
+    ingest_progress.set_stage(9301, "embedding", generation=generation, chunks_to_embed=5)
+    batcher = methods.EmbedBatcher(workers=1, batch_size=2)
+    batcher.submit([1, 2, 3, 4, 5], file_id=9301, generation=generation)
+    assert done.wait(5)
+
+    state = ingest_progress.snapshot(9301)
+    assert (state["stage"], state["embeddings_done"], state["embed_failures"]) == ("ready", 4, 1)
+    assert scheduled == [9301]
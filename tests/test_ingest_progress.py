@@ -0,0 +1,53 @@
+from services import ingest_progress
+
+
+def test_updates_from_an_earlier_ingest_are_dropped():
+    old = ingest_progress.start_file(9001)
+    ingest_progress.set_stage(9001, "embedding", generation=old, chunks_to_embed=10)
+    new = ingest_progress.start_file(9001)
+    assert new != old
+
+    ingest_progress.increment(9001, generation=old, embeddings_done=10)
+    ingest_progress.set_stage(9001, "failed", generation=old)
+    state = ingest_progress.snapshot(9001)
+    assert state["stage"] == "queued"
+    assert state["embeddings_done"] == 0
+
+    ingest_progress.set_stage(9001, "embedding", generation=new, chunks_to_embed=2)
+    ingest_progress.increment(9001, generation=new, embeddings_done=2)
+    assert ingest_progress.snapshot(9001)["stage"] == "ready"
+
+
+def test_untagged_updates_still_apply():
+    ingest_progress.start_file(9002)
+    ingest_progress.increment(9002, ocr_pages_done=1)
+    assert ingest_progress.snapshot(9002)["ocr_pages_done"] == 1
+
+
+def test_seeded_file_with_missing_embeddings_keeps_streaming():
+    generation = ingest_progress.seed_from_row(9003, num_pages=3, total=5, embedded=3, summarized=3)
+    assert generation is not None
+    assert ingest_progress.seed_from_row(9003, 3, 5, 3, 3) is None
+
+    events = ingest_progress.stream_events(9003, heartbeat=0.01)
+    first = next(events)
+    assert '"stage": "embedding"' in first
+    assert next(events) == ": keep-alive\n\n"
+
+    ingest_progress.increment(9003, generation=generation, embeddings_done=2)
+    assert '"stage": "ready"' in next(events)
+    assert next(events, None) is None
+
+
+def test_fully_embedded_file_is_seeded_ready():
+    ingest_progress.seed_from_row(9004, num_pages=1, total=2, embedded=2, summarized=2)
+    assert ingest_progress.snapshot(9004)["stage"] == "ready"
+
+
+def test_increment_reports_the_update_that_completes_embedding():
+    generation = ingest_progress.start_file(9004)
+    ingest_progress.set_stage(9004, "embedding", generation=generation, chunks_to_embed=3)
+    assert not ingest_progress.increment(9004, generation=generation, embeddings_done=2)
+    assert ingest_progress.increment(9004, generation=generation, embed_failures=1)
+    assert not ingest_progress.increment(9004, generation=generation, summaries_done=1)
+    assert not ingest_progress.increment(9004, generation=generation + 1, embeddings_done=1)
@@ -0,0 +1,69 @@
+import pytest
+
+from services import metrics
+
+pytestmark = pytest.mark.skipif(not metrics.ENABLED, reason="metrics disabled")
+
+
+def _errors(stage):
+    hist = metrics._registry.get((metrics.STAGE_METRIC, "stage", stage))
+    return (hist.count, hist.errors) if hist else (0, 0)
+
+
+def test_fallback_marked_in_except_branch_counts_as_error():
+    @metrics.timed("test_fallback")
+    def ranked():
+        try:
+            raise RuntimeError("model down")
+        except RuntimeError:
+            metrics.mark_error()
+            return []
+
+    assert ranked() == []
+    assert _errors("test_fallback") == (1, 1)
+
+
+def test_mark_error_does_not_leak_to_the_enclosing_call():
+    @metrics.timed("test_inner")
+    def inner():
+        metrics.mark_error()
+
+    @metrics.timed("test_outer")
+    def outer():
+        inner()
+        return "ok"
+
+    assert outer() == "ok"
+    assert _errors("test_inner") == (1, 1)
+    assert _errors("test_outer") == (1, 0)
+
+
+def test_timer_block_honours_mark_error():
+    with metrics.timer("test_block"):
+        metrics.mark_error()
+    with metrics.timer("test_block"):
+        pass
+    assert _errors("test_block") == (2, 1)
+
+
+def test_raised_exceptions_still_count():
+    @metrics.timed("test_raises")
+    def boom():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        boom()
+    assert _errors("test_raises") == (1, 1)
+
+
+def test_exports_from_several_processes_combine_into_one_series():
+    with metrics.timer("test_combined"):
+        pass
+    rows = [r for r in metrics.export() if r[2] == "test_combined"]
+    other = [[*rows[0][:3], [n * 2 for n in rows[0][3]], 1.5, 2, 1]]
+    merged = metrics.combine([rows, other])
+    assert len(merged) == 1
+    assert merged[0][5] == 3 and merged[0][6] == 1
+    text = metrics.render(merged)
+    assert 'pipeline_stage_duration_seconds_count{stage="test_combined"} 3' in text
+    assert 'pipeline_stage_errors_total{stage="test_combined"} 1' in text
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from services import neighbours
+
+
+def _empty(n, width=0):
+    return np.full((n, width), -1, dtype=np.int64), np.full((n, width), -np.inf, dtype=np.float32)
+
+
+def test_merge_top_k_keeps_the_best_of_both_sets_in_order():
+    ids = np.array([[10, 11, -1]], dtype=np.int64)
+    scores = np.array([[0.9, 0.2, -np.inf]], dtype=np.float32)
+    cand_ids = np.array([20, 21, 22], dtype=np.int64)
+    cand_scores = np.array([[0.5, 0.95, 0.1]], dtype=np.float32)
+    merged_ids, merged_scores = neighbours.merge_top_k(ids, scores, cand_ids, cand_scores, 3)
+    assert merged_ids.tolist() == [[21, 10, 20]]
+    assert np.allclose(merged_scores, [[0.95, 0.9, 0.5]])
+
+
+def test_merge_top_k_with_per_row_candidates():
+    ids, scores = _empty(2)
+    cand_ids = np.array([[1, 2], [3, 4]], dtype=np.int64)
+    cand_scores = np.array([[0.1, 0.7], [0.6, 0.3]], dtype=np.float32)
+    merged_ids, _ = neighbours.merge_top_k(ids, scores, cand_ids, cand_scores, 1)
+    assert merged_ids.tolist() == [[2], [3]]
+
+
+def test_merge_top_k_fewer_candidates_than_k():
+    ids, scores = _empty(1)
+    merged_ids, merged_scores = neighbours.merge_top_k(ids, scores, np.array([5]),
+                                                       np.array([[0.4]], dtype=np.float32), 10)
+    assert merged_ids.tolist() == [[5]]
+    assert merged_scores.shape == (1, 1)
+
+
+def test_blockwise_merge_matches_a_full_sort():
+    rng = np.random.default_rng(0)
+    sims = rng.standard_normal((4, 50)).astype(np.float32)
+    block_ids = np.arange(100, 150, dtype=np.int64)
+    best_ids, best_scores = _empty(4)
+    for start in range(0, 50, 16):
+        best_ids, best_scores = neighbours.merge_top_k(best_ids, best_scores, block_ids[start:start + 16],
+                                                       sims[:, start:start + 16], 5)
+    expected = block_ids[np.argsort(-sims, axis=1)[:, :5]]
+    assert np.array_equal(best_ids, expected)
+
+
+def test_padded_and_lists_round_trip():
+    ids, scores = neighbours._padded([([7, 8], [0.5, 0.4]), ([], [])], 3)
+    assert ids.tolist() == [[7, 8, -1], [-1, -1, -1]]
+    assert neighbours._lists(ids[0], scores[0]) == ([7, 8], pytest.approx([0.5, 0.4]))
+    assert neighbours._lists(ids[1], scores[1]) == ([], [])
+
+
+class _Cursor:
+    def __init__(self, live):
+        self.live = live
+        self.params = None
+
+    def execute(self, sql, params):
+        self.params = params
+
+    def fetchall(self):
+        return [(i,) for i in self.params[0] if i in self.live]
+
+
+def test_live_ids_only_asks_for_the_blocks_own_neighbours():
+    cur = _Cursor(live={7, 9})
+    stored = np.array([[7, 8, -1], [9, 7, -1]], dtype=np.int64)
+    live = neighbours._live_ids(cur, stored)
+    assert cur.params == ([7, 8, 9],)
+    assert sorted(live.tolist()) == [7, 9]
+    assert len(neighbours._live_ids(cur, np.full((2, 3), -1))) == 0
@@ -0,0 +1,50 @@
+from services import ingest_progress, methods, ocr
+
+
+def test_queued_pages_are_spooled_to_disk(tmp_path, monkeypatch):
+    scheduler = ocr.OCRScheduler(spool_dir=str(tmp_path))
+    monkeypatch.setattr(scheduler, "_ensure_started", lambda: None)
+    scheduler.submit(1, [(3, b"page three"), (1, b"page one")])
+    assert scheduler.pending() == 2
+
+    page_number, *_, path = scheduler._heap[0]
+    assert page_number == 1
+    assert path.startswith(str(tmp_path))
+    assert scheduler._unspool(path) == b"page one"
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_rescanned_blank_page_drops_its_old_chunks(monkeypatch):
+    calls = []
+
+    def store_page_chunks(file_id, page_number, texts):
+        calls.append((file_id, page_number, texts))
+        return [], {"added": 0, "removed": 2, "unchanged": 0, "pending_embedding": 0}
+
+    monkeypatch.setattr(methods, "store_page_chunks", store_page_chunks)
+    monkeypatch.setattr(methods.EMBED_BATCHER, "submit", lambda *a, **kw: None)
+    generation = ingest_progress.start_file(9101)
+
+    scheduler = ocr.OCRScheduler()
+    scheduler._inflight = 1
+    scheduler._finish(9101, generation, 4, 0, "   \n")
+    assert calls == [(9101, 4, [])]
+    state = ingest_progress.snapshot(9101)
+    assert state["chunks_removed"] == 2
+    assert state["ocr_pages_done"] == 1
+    assert scheduler._inflight == 0
+
+
+def test_result_from_a_superseded_ingest_is_dropped(monkeypatch):
+    calls = []
+    monkeypatch.setattr(methods, "store_page_chunks", lambda *a: calls.append(a))
+    monkeypatch.setattr(methods.EMBED_BATCHER, "submit", lambda *a, **kw: calls.append(a))
+    stale = ingest_progress.start_file(9102)
+    ingest_progress.start_file(9102)
+
+    scheduler = ocr.OCRScheduler()
+    scheduler._inflight = 1
+    scheduler._finish(9102, stale, 4, 0, "old text of the page")
+    assert calls == []
+    assert ingest_progress.snapshot(9102)["ocr_pages_done"] == 0
+    assert scheduler._inflight == 0
@@ -0,0 +1,69 @@
+from flask import Flask, jsonify
+
+from services import insights_processor, prefetch
+
+
+def test_handle_prefetch_request_rejects_non_integer_ids():
+    assert prefetch.handle_prefetch_request({"file_id": "abc", "page_number": 1})[0] == 400
+    assert prefetch.handle_prefetch_request({"file_id": 1, "page_number": [2]})[0] == 400
+    assert prefetch.handle_prefetch_request({"page_number": 2})[0] == 400
+
+
+def test_insights_rejects_non_integer_ids():
+    status, body = insights_processor.process_insights("x", 1, "selected", [])
+    assert status == 400
+    assert "file_id" in body["error"]
+
+
+def test_interactive_gate_follows_the_decorator():
+    app = Flask(__name__)
+    seen = {}
+
+    @app.post("/slow")
+    @prefetch.interactive
+    def renamed_view():
+        seen["slow"] = prefetch.is_interactive_request()
+        return jsonify({})
+
+    @app.get("/ping")
+    def ping():
+        seen["ping"] = prefetch.is_interactive_request()
+        return jsonify({})
+
+    client = app.test_client()
+    client.post("/slow")
+    client.get("/ping")
+    assert seen == {"slow": True, "ping": False}
+
+
+def test_merged_sections_reach_the_ranking_prompt(monkeypatch):
+    import random
+
+    def text(seed):
+        rng = random.Random(seed)
+        return " ".join(f"w{rng.randrange(5000)}" for _ in range(200))
+
+    sent = [{"id": i, "file_id": 1, "page_number": 2, "text": text(i)} for i in range(30)]
+    merged = [{"id": 100 + i, "file_id": 7, "page_number": 1, "text": text(100 + i), "distance": 0.1}
+              for i in range(10)]
+    prompts = []
+
+    class Model:
+        def __init__(self, **kwargs):
+            pass
+
+        def generate_content(self, prompt):
+            prompts.append(prompt)
+            return type("Response", (), {"text": "[]"})()
+
+    monkeypatch.setattr(insights_processor, "GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(insights_processor.clients, "genai", lambda: type("GenAI", (), {"GenerativeModel": Model}))
+    monkeypatch.setattr(insights_processor, "generate_overall_summary", lambda *a, **k: "")
+    monkeypatch.setattr(prefetch, "candidates_for", lambda file_id, page_number: {"chunks": merged})
+    monkeypatch.setattr(prefetch, "rerank", lambda entry, embedding: entry["chunks"])
+
+    status, body = insights_processor.process_insights(1, 2, "selected", sent, embedding=[0.1, 0.2])
+    assert status == 200
+    assert body["prefetch"] == {"hit": True, "related": 10}
+    assert body["context"]["rank"]["over_budget"] == 0
+    assert all(f"ID: {c['id']}\n" in prompts[0] for c in merged)
@@ -0,0 +1,32 @@
+import json
+
+from services import profiler
+
+
+def _write_profiles(directory, sizes):
+    for i, size in enumerate(sizes):
+        stem = f"profile-{i}"
+        (directory / f"{stem}.folded").write_bytes(b"x" * size)
+        (directory / f"{stem}.json").write_text(json.dumps({"file": f"{stem}.folded", "created_at": 1000.0 + i}))
+
+
+def _kept(directory):
+    return sorted(p.name for p in directory.iterdir())
+
+
+def test_prune_keeps_the_newest_profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiler, "PROFILE_RETENTION", 2)
+    _write_profiles(tmp_path, [10] * 5)
+    profiler._prune()
+    assert _kept(tmp_path) == ["profile-3.folded", "profile-3.json", "profile-4.folded", "profile-4.json"]
+    assert [m["file"] for m in profiler.list_profiles()] == ["profile-4.folded", "profile-3.folded"]
+
+
+def test_prune_enforces_the_byte_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiler, "PROFILE_RETENTION", 10)
+    monkeypatch.setattr(profiler, "PROFILE_MAX_BYTES", 250)
+    _write_profiles(tmp_path, [100, 100, 100, 100])
+    profiler._prune()
+    assert [m["file"] for m in profiler.list_profiles()] == ["profile-3.folded", "profile-2.folded"]
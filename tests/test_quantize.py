@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from services import quantize
+
+
+def _unit_vectors(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("mode, tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_float_modes_round_trip(mode, tolerance):
+    x = _unit_vectors(20, 64)
+    codes, scales = quantize.encode(x, mode)
+    assert codes.dtype == np.uint8
+    decoded = quantize.decode(codes, scales, mode, 64)
+    assert decoded.shape == x.shape
+    assert np.abs(decoded - x).max() < tolerance
+
+
+def test_binary_round_trip_keeps_signs():
+    x = _unit_vectors(5, 70)
+    codes, scales = quantize.encode(x, "binary")
+    assert codes.shape == (5, 9)
+    decoded = quantize.decode(codes, scales, "binary", 70)
+    assert np.array_equal(decoded > 0, x > 0)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        quantize.encode(np.ones((1, 4)), "int4")
+
+
+def test_compact_embedding_survives_database_round_trip():
+    x = _unit_vectors(3, quantize.EMBED_DIM)
+    rows = [quantize.compact_embedding(v, mode="int8", dim=256) for v in x]
+    codes, scales = quantize.codes_from_rows(rows, mode="int8", dim=256)
+    assert codes.shape == (3, 256)
+    expected, expected_scales = quantize.encode(quantize.reduce_dimensions(x, 256), "int8")
+    assert np.array_equal(codes, expected)
+    assert np.allclose(scales, expected_scales)
+
+
+def test_compact_embedding_disabled():
+    assert quantize.compact_embedding(np.ones(quantize.EMBED_DIM), mode="") is None
+
+
+def test_reduce_dimensions_with_pca_normalises():
+    x = _unit_vectors(50, 32)
+    pca = quantize.fit_pca(x, 8)
+    reduced = quantize.reduce_dimensions(x, 8, pca)
+    assert reduced.shape == (50, 8)
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-5)
+
+
+@pytest.mark.parametrize("mode", quantize.COMPACT_MODES)
+def test_search_rescores_with_full_vectors(mode):
+    corpus = _unit_vectors(500, 128, seed=1)
+    codes, scales = quantize.encode(quantize.reduce_dimensions(corpus, 128), mode)
+    fetched = []
+
+    def fetch_full(indices):
+        fetched.append(len(indices))
+        return corpus[indices]
+
+    query = corpus[42] + 0.01 * _unit_vectors(1, 128, seed=2)[0]
+    found, scores = quantize.search(query, codes, scales, fetch_full, k=5, mode=mode, dim=128, rescore=40)
+    assert found[0] == 42
+    assert fetched == [40]
+    assert list(scores) == sorted(scores, reverse=True)
+    exact = corpus[found] @ (query / np.linalg.norm(query))
+    assert np.allclose(scores, exact, atol=1e-5)
+
+
+def test_search_on_empty_index():
+    found, scores = quantize.search(np.ones(8), np.empty((0, 8), dtype=np.uint8), np.empty(0),
+                                    lambda idx: None, k=3, mode="int8", dim=8)
+    assert len(found) == 0 and len(scores) == 0
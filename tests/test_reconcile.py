@@ -0,0 +1,55 @@
+from services.methods import chunk_content_hash, reconcile_chunks
+
+
+def _row(cid, page, text, needs_embedding=False, legacy=False):
+    return {
+        "id": cid,
+        "page_number": page,
+        "content_hash": None if legacy else chunk_content_hash(text, page),
+        "needs_embedding": needs_embedding,
+        "legacy_text": text if legacy else None,
+    }
+
+
+def test_unchanged_document_keeps_every_chunk():
+    stored = [_row(1, 1, "alpha"), _row(2, 1, "beta"), _row(3, 2, "gamma")]
+    to_insert, pending, stale, unchanged = reconcile_chunks(stored, [(1, "alpha"), (1, "beta"), (2, "gamma")])
+    assert (to_insert, pending, stale, unchanged) == ([], [], [], 3)
+
+
+def test_edit_inserts_new_text_and_drops_old():
+    stored = [_row(1, 1, "alpha"), _row(2, 1, "beta")]
+    to_insert, pending, stale, unchanged = reconcile_chunks(stored, [(1, "alpha"), (1, "beta v2")])
+    assert to_insert == [(1, "beta v2", chunk_content_hash("beta v2", 1))]
+    assert stale == [2]
+    assert unchanged == 1
+
+
+def test_text_moved_to_another_page_is_a_new_chunk():
+    stored = [_row(1, 1, "alpha")]
+    to_insert, _, stale, unchanged = reconcile_chunks(stored, [(2, "alpha")])
+    assert [t[:2] for t in to_insert] == [(2, "alpha")]
+    assert stale == [1] and unchanged == 0
+
+
+def test_duplicates_are_matched_one_to_one():
+    stored = [_row(1, 1, "same"), _row(2, 1, "same"), _row(3, 1, "same")]
+    to_insert, _, stale, unchanged = reconcile_chunks(stored, [(1, "same"), (1, "same")])
+    assert to_insert == [] and unchanged == 2
+    assert stale == [3]
+
+    to_insert, _, stale, unchanged = reconcile_chunks(stored[:1], [(1, "same"), (1, "same")])
+    assert len(to_insert) == 1 and stale == [] and unchanged == 1
+
+
+def test_kept_chunks_without_embedding_are_requeued():
+    stored = [_row(1, 1, "alpha", needs_embedding=True), _row(2, 1, "beta")]
+    _, pending, _, _ = reconcile_chunks(stored, [(1, "alpha"), (1, "beta")])
+    assert pending == [1]
+
+
+def test_legacy_rows_are_matched_by_their_text():
+    stored = [_row(1, 3, "old row", legacy=True), _row(2, 3, "gone", legacy=True)]
+    to_insert, _, stale, unchanged = reconcile_chunks(stored, [(3, "old row")])
+    assert to_insert == [] and unchanged == 1
+    assert stale == [2]
@@ -0,0 +1,163 @@
+import numpy as np
+
+from services import quantize, search
+
+
+class FakeCursor:
+    """Answers the queries search_chunks issues from an in-memory chunk table."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks  # id -> (file_id, embedding, code, scale)
+        self.queries = []
+        self.result = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.queries.append(sql)
+        if sql.startswith("SELECT id FROM files"):
+            self.result = [(fid,) for fid in sorted({c[0] for c in self.chunks.values()})]
+        elif sql.startswith("SELECT id, embedding_compact"):
+            self.result = [(cid, c[2], c[3]) for cid, c in sorted(self.chunks.items()) if c[0] == params[0]]
+        elif sql.startswith("SELECT id, embedding FROM"):
+            self.result = [(cid, self.chunks[cid][1]) for cid in params[0]]
+        elif sql.startswith("SELECT id, 1 -"):
+            self.result = [(-1, 1.0)]
+        else:
+            raise AssertionError(sql)
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConn:
+    def __init__(self, cur):
+        self.cur = cur
+
+    def cursor(self):
+        return self.cur
+
+    def close(self):
+        pass
+
+
+def _install(monkeypatch, chunks):
+    cur = FakeCursor(chunks)
+    monkeypatch.setattr(search, "get_db_conn", lambda: FakeConn(cur))
+    monkeypatch.setattr(quantize, "COMPACT_MODE", "int8")
+    monkeypatch.setattr(search, "_cache", type(search._cache)())
+    monkeypatch.setattr(search, "_cache_bytes", 0)
+    monkeypatch.setattr(search, "_versions", {})
+    monkeypatch.setattr(search, "_shared_dir", None)
+    return cur
+
+
+def _loads(cur):
+    return [q for q in cur.queries if q.startswith("SELECT id, embedding_compact")]
+
+
+def _chunks(n, with_codes=True, seed=0):
+    rng = np.random.default_rng(seed)
+    chunks = {}
+    for cid in range(1, n + 1):
+        emb = rng.standard_normal(quantize.EMBED_DIM).astype(np.float32)
+        code, scale = quantize.compact_embedding(emb, mode="int8") if with_codes else (None, None)
+        chunks[cid] = (1 + cid % 2, emb, code, scale)
+    return chunks
+
+
+def test_compact_scan_finds_nearest_chunk(monkeypatch):
+    chunks = _chunks(60)
+    cur = _install(monkeypatch, chunks)
+    mode, results = search.search_chunks(chunks[7][1].tolist(), file_id=None, k=3)
+    assert mode == "compact"
+    assert results[0][0] == 7
+    assert abs(results[0][1] - 1.0) < 1e-5
+    assert not any(q.startswith("SELECT id, 1 -") for q in cur.queries)
+
+
+def test_codes_are_cached_until_the_file_is_invalidated(monkeypatch):
+    chunks = _chunks(20)
+    cur = _install(monkeypatch, chunks)
+    search.search_chunks(chunks[2][1].tolist(), file_id=1, k=2)
+    search.search_chunks(chunks[2][1].tolist(), file_id=1, k=2)
+    assert len(_loads(cur)) == 1
+    assert not any("COUNT" in q for q in cur.queries)
+
+    chunks[99] = (1, *chunks.pop(2)[1:])  # re-ingest replaced a chunk
+    search.invalidate_file(1)
+    mode, results = search.search_chunks(chunks[99][1].tolist(), file_id=1, k=2)
+    assert len(_loads(cur)) == 2
+    assert results[0][0] == 99
+
+
+def test_shared_store_is_mapped_by_other_processes(monkeypatch, tmp_path):
+    chunks = _chunks(20)
+    cur = _install(monkeypatch, chunks)
+    search.use_shared_store(str(tmp_path))
+    search.search_chunks(chunks[4][1].tolist(), file_id=1, k=2)
+    assert len(_loads(cur)) == 1
+
+    # another process: empty in-process cache, same directory
+    monkeypatch.setattr(search, "_cache", type(search._cache)())
+    mode, results = search.search_chunks(chunks[4][1].tolist(), file_id=1, k=2)
+    assert (mode, results[0][0]) == ("compact", 4)
+    assert len(_loads(cur)) == 1
+    assert isinstance(search._cache[1][1], np.memmap)
+
+    search.invalidate_file(1)   # e.g. by the background process
+    search.search_chunks(chunks[4][1].tolist(), file_id=1, k=2)
+    assert len(_loads(cur)) == 2
+    assert len(list(tmp_path.glob("*.codes.npy"))) == 1
+
+
+def test_missing_codes_fall_back_to_exact_scan_until_backfilled(monkeypatch):
+    chunks = _chunks(10, with_codes=False)
+    cur = _install(monkeypatch, chunks)
+    mode, results = search.search_chunks(chunks[1][1].tolist(), k=3)
+    assert mode == "exact"
+    assert results == [(-1, 1.0)]
+
+    # the backfill writes the codes; incomplete files were never cached
+    for cid, (fid, emb, _, _) in chunks.items():
+        chunks[cid] = (fid, emb, *quantize.compact_embedding(emb, mode="int8"))
+    mode, results = search.search_chunks(chunks[1][1].tolist(), k=3)
+    assert (mode, results[0][0]) == ("compact", 1)
+
+
+def test_request_validation():
+    assert search.handle_search_request({})[0] == 400
+    embedding = [0.0] * quantize.EMBED_DIM
+    assert search.handle_search_request({"embedding": embedding, "file_id": "x"})[0] == 400
+    assert search.handle_search_request({"embedding": embedding, "k": 0})[0] == 400
+
+
+def test_backfill_encodes_missing_codes_in_id_order(monkeypatch):
+    import psycopg2.extras
+
+    chunks = _chunks(5, with_codes=False)
+    writes = []
+
+    class BackfillCursor:
+        def execute(self, sql, params):
+            last_id, limit = params
+            self.result = [(cid, chunks[cid][1]) for cid in sorted(chunks)
+                           if cid > last_id and chunks[cid][2] is None][:limit]
+
+        def fetchall(self):
+            return self.result
+
+    def execute_values(cur, sql, values, template=None):
+        writes.append([v[0] for v in values])
+        for cid, code, scale in values:
+            chunks[cid] = (chunks[cid][0], chunks[cid][1], bytes(code.adapted), scale)
+
+    class BackfillConn(FakeConn):
+        def commit(self):
+            pass
+
+    monkeypatch.setattr(search, "get_db_conn", lambda: BackfillConn(BackfillCursor()))
+    monkeypatch.setattr(psycopg2.extras, "execute_values", execute_values)
+    monkeypatch.setattr(quantize, "COMPACT_MODE", "int8")
+    assert search.backfill(batch_size=2) == 5
+    assert writes == [[1, 2], [3, 4], [5]]
+    assert all(c[2] is not None for c in chunks.values())
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify
+
+from services import serve
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="multi-process serving needs fork()")
+
+
+@pytest.fixture
+def table():
+    table = serve.WorkerTable(3)
+    table.claim(0, "interactive")
+    yield table
+    table.release()
+
+
+def _fake_process(table, state_dir, slot, pid, components, role="interactive"):
+    table.rows[slot, serve.FIELDS.index("pid")] = pid
+    table.rows[slot, serve.FIELDS.index("role")] = serve.ROLES.index(role)
+    with open(serve._state_path(state_dir, slot), "w") as f:
+        json.dump({"pid": pid, "role": role, "metrics": [], "components": components}, f)
+
+
+def test_states_of_other_live_processes_are_merged(table, tmp_path):
+    _fake_process(table, tmp_path, 1, 4242, {"db": 0.5})
+    _fake_process(table, tmp_path, 2, 4343, {"db": 0.1}, role="background")
+    table.rows[2, serve.FIELDS.index("pid")] = 4444    # restarted, its file is stale
+    states = serve._all_states(table, "interactive", str(tmp_path))
+    assert [s["pid"] for s in states] == [os.getpid(), 4242]
+
+
+def test_merge_ready_reports_the_worst_process():
+    states = [
+        {"pid": 1, "role": "interactive", "components": {"db": 0.2, "pdf": 0.1, "genai": None}},
+        {"pid": 2, "role": "background", "components": {"db": 0.4, "pdf": "error: no fitz", "genai": 0.3}},
+    ]
+    status, body = serve.merge_ready(states)
+    assert status == 503
+    assert body["components"] == {"db": 0.4, "pdf": "error: no fitz", "genai": None}
+    assert body["failed"] == ["pdf"]
+    assert len(body["processes"]) == 2
+
+
+def test_warm_tokens_track_every_live_process(table):
+    table.set("warm_requested", 5)
+    table.rows[1, serve.FIELDS.index("pid")] = 4242
+    assert table.warm_requested() == 5
+    table.set("warmed", 5)
+    assert not table.warmed_everywhere(5)
+    table.rows[1, serve.FIELDS.index("warmed")] = 5
+    assert table.warmed_everywhere(5)
+
+
+def test_unreachable_background_process_answers_503(table, tmp_path):
+    app = Flask(__name__)
+
+    @app.post("/ingest")
+    def jobs_ingest():
+        return jsonify({}), 202
+
+    # nothing listens on the discard port
+    serve._install_hooks(app, table, "interactive", "http://127.0.0.1:9", str(tmp_path))
+    resp = app.test_client().post("/ingest", json={"file_id": 1})
+    assert resp.status_code == 503
+    assert "background process unavailable" in resp.get_json()["error"]
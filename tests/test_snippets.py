@@ -0,0 +1,83 @@
+import numpy as np
+
+from services import snippets
+
+
+def _sentences(text):
+    return [text[s:e] for s, e in snippets.split_sentences(text)]
+
+
+def test_split_sentences_trims_and_keeps_offsets():
+    text = "  First sentence here.  Second one!\nThird?   "
+    assert _sentences(text) == ["First sentence here.", "Second one!", "Third?"]
+    flat = snippets.sentence_offsets(text)
+    assert len(flat) == 6
+    assert text[flat[0]:flat[1]] == "First sentence here."
+
+
+def test_split_sentences_skips_abbreviations_and_lowercase_continuations():
+    text = "See Fig. 3 for details. Dr. Smith agreed, e.g. in the appendix. the end"
+    assert _sentences(text) == ["See Fig. 3 for details.", "Dr. Smith agreed, e.g. in the appendix. the end"]
+
+
+def test_split_sentences_breaks_on_blank_lines():
+    assert _sentences("Heading\n\nBody text starts here") == ["Heading", "Body text starts here"]
+    assert snippets.sentence_offsets("") == []
+
+
+def test_stored_offsets_are_used_only_when_they_fit():
+    chunk = {"text": "One. Two.", "sentence_offsets": [0, 4, 5, 9]}
+    assert snippets._spans(chunk) == [(0, 4), (5, 9)]
+    stale = {"text": "One. Two.", "sentence_offsets": [0, 4, 5, 40]}
+    assert snippets._spans(stale) == snippets.split_sentences("One. Two.")
+
+
+def test_score_sentences_prefers_shared_rare_words():
+    scores = snippets.score_sentences("quantum entanglement", [
+        "The weather was mild.",
+        "Quantum entanglement links distant particles.",
+        "The particles were measured.",
+    ])
+    assert scores.dtype == np.float32
+    assert int(np.argmax(scores)) == 1
+    assert scores[0] == 0
+
+
+def test_pick_keeps_best_sentences_in_reading_order(monkeypatch):
+    monkeypatch.setattr(snippets, "SNIPPET_MAX_SENTENCES", 3)
+    spans = [(0, 10), (11, 20), (21, 30), (31, 40), (41, 50)]
+    scores = np.array([0.1, 0.9, 0.2, 0.8, 0.6], dtype=np.float32)
+    assert snippets._pick(scores, spans) == [1, 3, 4]
+
+
+def test_pick_applies_the_relative_cutoff_after_the_minimum():
+    spans = [(0, 10), (11, 20), (21, 30)]
+    scores = np.array([0.9, 0.1, 0.05], dtype=np.float32)
+    assert snippets._pick(scores, spans) == [0, 1]
+
+
+def test_pick_falls_back_to_leading_sentences():
+    spans = [(0, 10), (11, 20), (21, 30), (31, 40), (41, 50)]
+    assert snippets._pick(np.zeros(5, dtype=np.float32), spans) == [0, 1, 2, 3]
+    assert snippets._pick(np.zeros(0, dtype=np.float32), []) == []
+
+
+def test_attach_snippets_marks_gaps_and_drops_offsets():
+    text = ("Alpha is unrelated. Bravo talks about neural ranking. Charlie is filler. "
+            "Delta covers neural ranking models too.")
+    chunk = {"text": text, "sentence_offsets": snippets.sentence_offsets(text)}
+    snippets.attach_snippets("neural ranking", [chunk])
+    assert chunk["snippet"] == ("Bravo talks about neural ranking. " + snippets._ELLIPSIS +
+                                " Delta covers neural ranking models too.")
+    assert [text[s:e] for s, e in chunk["snippet_offsets"]] == [
+        "Bravo talks about neural ranking.", "Delta covers neural ranking models too."]
+    assert "sentence_offsets" not in chunk
+
+
+def test_long_sentence_is_cut_at_a_word_boundary(monkeypatch):
+    monkeypatch.setattr(snippets, "SNIPPET_MAX_CHARS", 20)
+    text = "word " * 20
+    preview, offsets = snippets._render(text, snippets.split_sentences(text), [0])
+    assert preview.endswith(snippets._ELLIPSIS)
+    assert len(preview) <= 21
+    assert offsets[0][1] <= 20
@@ -0,0 +1,11 @@
+import subprocess
+import sys
+
+HEAVY = ("numpy", "fitz", "psycopg2", "pgvector", "google.generativeai", "requests")
+
+
+def test_importing_the_app_defers_heavy_dependencies():
+    code = ("import sys, services.__main__; "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
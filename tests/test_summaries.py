@@ -0,0 +1,126 @@
+import time
+
+from services import ingest_progress, summaries
+
+
+def _collect(monkeypatch, debounce=0.05, max_defer=60.0):
+    ran = []
+    monkeypatch.setattr(summaries, "roll_up",
+                        lambda file_id, chunk_ids=None, document=True: ran.append(file_id) if document else None)
+    monkeypatch.setattr(summaries, "ROLLUP_DEBOUNCE_SECONDS", debounce)
+    monkeypatch.setattr(summaries, "ROLLUP_MAX_DEFER_SECONDS", max_defer)
+    return ran
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_requests_for_one_file_are_merged(monkeypatch):
+    ran = _collect(monkeypatch)
+    for _ in range(20):
+        summaries.schedule(7001)
+    assert _wait_for(lambda: ran)
+    time.sleep(0.15)
+    assert ran == [7001]
+
+
+def test_roll_up_waits_for_the_ingest_to_finish(monkeypatch):
+    ran = _collect(monkeypatch)
+    generation = ingest_progress.start_file(7002)
+    ingest_progress.set_stage(7002, "extracting", generation=generation)
+    summaries.schedule(7002)
+    time.sleep(0.2)
+    assert ran == []
+
+    ingest_progress.set_stage(7002, "embedding", generation=generation, chunks_to_embed=1)
+    ingest_progress.increment(7002, generation=generation, embeddings_done=1)
+    assert _wait_for(lambda: ran == [7002])
+
+
+def test_pages_are_rolled_up_before_the_ingest_finishes(monkeypatch):
+    _collect(monkeypatch)
+    pages = []
+    monkeypatch.setattr(summaries, "roll_up", lambda file_id, chunk_ids=None, document=True:
+                        pages.append((file_id, sorted(chunk_ids), document)))
+    generation = ingest_progress.start_file(7004)
+    ingest_progress.set_stage(7004, "embedding", generation=generation, chunks_to_embed=4)
+    summaries.schedule(7004, [1, 2])
+    summaries.schedule(7004, [3])
+    assert _wait_for(lambda: pages == [(7004, [1, 2, 3], False)])
+    time.sleep(0.15)
+    assert pages == [(7004, [1, 2, 3], False)]
+
+    summaries.schedule(7004, [4])
+    assert _wait_for(lambda: len(pages) == 2)
+    ingest_progress.increment(7004, generation=generation, embeddings_done=4)
+    assert _wait_for(lambda: pages[-1] == (7004, [], True))
+    assert pages[1] == (7004, [4], False)
+
+
+def test_roll_up_file_reads_only_the_touched_pages(monkeypatch):
+    queries = []
+
+    class Cur:
+        rowcount = 0
+
+        def execute(self, sql, params):
+            queries.append((sql, params))
+            self.rows = [{"page_number": 3, "summary": "s", "text": None, "pending": False}] if "FROM chunks" in sql else []
+
+        def fetchall(self):
+            return self.rows
+
+    class Conn:
+        def commit(self):
+            pass
+
+    written = []
+    monkeypatch.setattr(summaries, "get_dict_cursor", lambda conn: Cur())
+    monkeypatch.setattr(summaries, "summarize_page", lambda parts: written.append(parts) or "page")
+    assert summaries.roll_up_file(Conn(), 9, chunk_ids=[31, 32], document=False) == 1
+    assert written == [["s"]]
+    sql, params = queries[0]
+    assert "id = ANY(%s)" in sql and "NOT IN" not in sql
+    assert params == [9, 9, [31, 32]]
+    assert not any("files" in sql for sql, _ in queries)
+
+
+def test_stuck_ingest_is_rolled_up_after_the_max_defer(monkeypatch):
+    ran = _collect(monkeypatch, max_defer=0.2)
+    ingest_progress.start_file(7003, "embedding")
+    summaries.schedule(7003)
+    assert _wait_for(lambda: ran == [7003])
+
+
+def test_load_summaries_reads_each_file_once(monkeypatch):
+    queries = []
+
+    class Cur:
+        def execute(self, sql, params):
+            queries.append(sql)
+            self.rows = ([{"file_id": 5, "page_number": 1, "summary": "page one"}] if "page_summaries" in sql
+                         else [{"id": 5, "summary": "doc"}])
+
+        def fetchall(self):
+            return self.rows
+
+    class Conn:
+        def close(self):
+            pass
+
+    monkeypatch.setattr(summaries, "get_db_conn", Conn)
+    monkeypatch.setattr(summaries, "get_dict_cursor", lambda conn: Cur())
+    summaries._forget(5)
+    assert summaries.load_summaries([(5, 1), (5, 2)]) == ({(5, 1): "page one"}, {5: "doc"})
+    assert summaries.load_summaries([(5, 2)]) == ({}, {5: "doc"})
+    assert len(queries) == 2
+
+    summaries._forget(5)
+    summaries.load_summaries([(5, 1)])
+    assert len(queries) == 4
@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+
+from services import ingest_progress, methods, ocr
+
+
+class _Cursor:
+    def __init__(self, row):
+        self.row = row
+
+    def execute(self, sql, params):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class _Conn:
+    def close(self):
+        pass
+
+
+def _checkpoint(monkeypatch, row):
+    monkeypatch.setattr(methods, "get_db_conn", lambda: _Conn())
+    monkeypatch.setattr(methods, "get_dict_cursor", lambda conn: _Cursor(row))
+
+
+def test_checkpoint_only_resumes_the_same_content(monkeypatch):
+    _checkpoint(monkeypatch, {"content_hash": "abc", "page_count": 120, "last_page": 50})
+    assert methods._load_checkpoint(1, "abc", 120) == 50
+    assert methods._load_checkpoint(1, "other", 120) == 0
+    assert methods._load_checkpoint(1, "abc", 121) == 0
+    _checkpoint(monkeypatch, None)
+    assert methods._load_checkpoint(1, "abc", 120) == 0
+
+
+def _stub_windows(monkeypatch, last_page):
+    calls = {"extract": [], "store": [], "finish": None}
+
+    def extract_document(path, dpi, first, last):
+        calls["extract"].append((first, last))
+        return None, [(p, f"page {p}") for p in range(first, last + 1)], []
+
+    def store_document_chunks(file_id, page_count, page_chunks, keep_pages=(), pages=None, checkpoint=None):
+        calls["store"].append((pages, checkpoint))
+        return [], {"added": len(page_chunks), "removed": 0, "unchanged": 0, "pending_embedding": 0}
+
+    def finish(file_id, page_count, resumed_from):
+        calls["finish"] = resumed_from
+        return 0, [7, 8]
+
+    monkeypatch.setattr(methods, "_load_checkpoint", lambda *a: last_page)
+    monkeypatch.setattr(methods, "extract_document", extract_document)
+    monkeypatch.setattr(methods, "store_document_chunks", store_document_chunks)
+    monkeypatch.setattr(methods, "_finish_windowed_ingest", finish)
+    monkeypatch.setattr(methods.EMBED_BATCHER, "submit", lambda *a, **kw: None)
+    monkeypatch.setattr(ocr, "render_dpi", lambda: None)
+    return calls
+
+
+def test_interrupted_ingest_resumes_after_the_last_checkpoint(monkeypatch):
+    calls = _stub_windows(monkeypatch, last_page=50)
+    diff = methods.ingest_document_windows(1, "doc.pdf", "abc", 120, window=25)
+    assert calls["extract"] == [(51, 75), (76, 100), (101, 120)]
+    assert [c[1] for c in calls["store"]] == [("abc", 75), ("abc", 100), ("abc", 120)]
+    assert calls["finish"] == 51
+    assert diff["resumed_from_page"] == 51
+    assert diff["windows"] == 3
+    assert diff["added"] == 70
+    assert diff["pending_embedding"] == 2
+
+
+def test_fresh_ingest_starts_at_the_first_page(monkeypatch):
+    calls = _stub_windows(monkeypatch, last_page=0)
+    diff = methods.ingest_document_windows(1, "doc.pdf", "abc", 60, window=25)
+    assert calls["extract"] == [(1, 25), (26, 50), (51, 60)]
+    assert diff["resumed_from_page"] is None
+
+
+def test_large_upload_is_handed_to_the_window_worker(monkeypatch):
+    queued = []
+
+    def stream_url_to_file(url, fileobj):
+        fileobj.write(b"%PDF")
+        fileobj.flush()
+        return 4, "abc"
+
+    def queue_windowed_ingest(file_id, path, content_hash, page_count, generation=None):
+        with open(path, "rb") as f:
+            queued.append((file_id, f.read(), page_count, generation))
+        os.unlink(path)
+
+    monkeypatch.setattr(methods, "stream_url_to_file", stream_url_to_file)
+    monkeypatch.setattr(methods, "count_pages", lambda path: methods.INGEST_WINDOW_PAGES + 1)
+    monkeypatch.setattr(methods, "queue_windowed_ingest", queue_windowed_ingest)
+    status, body = methods.handle_ingest_request({"file_id": 9201, "url": "http://example/doc.pdf"})
+    assert status == 202
+    assert body["windowed"] is True
+    assert queued == [(9201, b"%PDF", methods.INGEST_WINDOW_PAGES + 1, ingest_progress.generation(9201))]
+
+
+def test_window_worker_skips_superseded_uploads(monkeypatch, tmp_path):
+    ran, done = [], threading.Event()
+
+    def ingest_document_windows(file_id, path, content_hash, page_count, priority=0, generation=None):
+        ran.append(generation)
+        done.set()
+
+    monkeypatch.setattr(methods, "ingest_document_windows", ingest_document_windows)
+    stale = ingest_progress.start_file(9202)
+    current = ingest_progress.start_file(9202)
+    paths = [tmp_path / "stale.pdf", tmp_path / "current.pdf"]
+    for path in paths:
+        path.write_bytes(b"%PDF")
+    methods.queue_windowed_ingest(9202, str(paths[0]), "abc", 100, generation=stale)
+    methods.queue_windowed_ingest(9202, str(paths[1]), "abc", 100, generation=current)
+    assert done.wait(5)
+    deadline = time.monotonic() + 5
+    while any(path.exists() for path in paths) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ran == [current]
+    assert not any(path.exists() for path in paths)